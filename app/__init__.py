@@ -25,11 +25,38 @@ def create_app(config_class=DevelopmentConfig):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    from app import tracing
+
+    tracing.configure_from_config(app.config)
+    with tracing.start_trace("create_app", kind=None):
+        with tracing.span("create_app.extensions"):
+            _init_extensions(app)
+        with tracing.span("create_app.blueprints"):
+            _register_blueprints(app)
+
+    return app
+
+
+def _init_extensions(app):
     db.init_app(app)
     migrate.init_app(app, db)
+
+    from app.sqlite import configure_sqlite
+    from app import metrics, profiling, tracing
+
+    with app.app_context():
+        configure_sqlite(
+            db.engine,
+            app.config["SQLITE_PRAGMAS"],
+            app.config["SQLITE_WRITE_BEGIN_MODE"],
+        )
+        tracing.init_app(app, db.engine)
     jwt.init_app(app)
     login_manager.init_app(app)
 
+    metrics.init_app(app)
+    profiling.init_app(app)
+
     from app.models import User
 
     @login_manager.user_loader
@@ -37,6 +64,8 @@ def create_app(config_class=DevelopmentConfig):
         """Эта функция нужна Flask-Login для загрузки пользователя из БД по ID из сессии."""
         return User.query.get(int(user_id))
 
+
+def _register_blueprints(app):
     from app.api import blueprint as api_blueprint
 
     app.register_blueprint(api_blueprint)
@@ -44,5 +73,3 @@ def create_app(config_class=DevelopmentConfig):
     from app.web.routes import bp as web_blueprint
 
     app.register_blueprint(web_blueprint)
-
-    return app
@@ -4,6 +4,8 @@ from flask_restx import Api
 from .auth import api as auth_ns
 from .profile import api as profile_ns
 from .chat import api as chat_ns
+from .admin import api as admin_ns
+from app.tracing import traced_resource
 
 
 blueprint = Blueprint("api", __name__, url_prefix="/api/v1")
@@ -24,8 +26,10 @@ api = Api(
     description="API для бизнес-помощника на базе LLM",
     authorizations=authorizations,
     security="jwt",
+    decorators=[traced_resource],
 )
 
 api.add_namespace(auth_ns)
 api.add_namespace(profile_ns)
 api.add_namespace(chat_ns)
+api.add_namespace(admin_ns)
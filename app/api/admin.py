@@ -0,0 +1,70 @@
+# app/api/admin.py
+from flask import current_app, request
+from flask_restx import Namespace, Resource, fields
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app import db, profiling
+from app.models import User
+
+api = Namespace("admin", description="Служебные операции администратора")
+
+profile_request_model = api.model(
+    "ProfileRequest",
+    {
+        "requests": fields.Integer(
+            required=True,
+            min=0,
+            max=1000,
+            description="Сколько следующих запросов профилировать (0 — отменить)",
+        ),
+    },
+)
+
+profile_status_model = api.model(
+    "ProfileStatus",
+    {
+        "remaining": fields.Integer(description="Осталось профилировать запросов"),
+        "profile_dir": fields.String(description="Каталог с файлами .prof"),
+        "profiles": fields.List(
+            fields.String, description="Последние сохраненные профили"
+        ),
+    },
+)
+
+
+def _require_admin():
+    user = db.session.get(User, int(get_jwt_identity()))
+    admins = current_app.config["ADMIN_EMAILS"]
+    if user is None or user.email.lower() not in admins:
+        api.abort(403, "Доступ только для администраторов")
+
+
+def _profile_status():
+    profile_dir = current_app.config["PROFILE_DIR"]
+    return {
+        "remaining": profiling.remaining(profile_dir),
+        "profile_dir": profile_dir,
+        "profiles": profiling.list_profiles(profile_dir),
+    }
+
+
+@api.route("/profile")
+class Profile(Resource):
+    @jwt_required()
+    @api.marshal_with(profile_status_model)
+    @api.doc(security="jwt")
+    @api.response(403, "Доступ только для администраторов.")
+    def get(self):
+        """Состояние профилирования и список сохраненных профилей"""
+        _require_admin()
+        return _profile_status()
+
+    @jwt_required()
+    @api.expect(profile_request_model, validate=True)
+    @api.marshal_with(profile_status_model)
+    @api.doc(security="jwt")
+    @api.response(403, "Доступ только для администраторов.")
+    def post(self):
+        """Включает cProfile для следующих N запросов во всех воркерах"""
+        _require_admin()
+        profiling.arm(current_app.config["PROFILE_DIR"], request.json["requests"])
+        return _profile_status()
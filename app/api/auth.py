@@ -1,9 +1,10 @@
 # app/api/auth.py
-from flask import request
+import hmac
+from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
 from app.models import User
-from app import db
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.services import auth_service
 
 api = Namespace("auth", description="Операции аутентификации")
 
@@ -34,6 +35,7 @@ user_me_model = api.model(
         "email": fields.String,
         "telegram_id": fields.String,
         "created_at": fields.DateTime,
+        "response_cache_opt_out": fields.Boolean,
     },
 )
 
@@ -47,13 +49,10 @@ class UserRegistration(Resource):
     def post(self):
         """Регистрация нового пользователя"""
         data = request.json
-        if User.query.filter_by(email=data["email"]).first():
-            return {"message": "Пользователь с таким email уже существует"}, 409
-
-        new_user = User(email=data["email"])
-        new_user.set_password(data["password"])
-        db.session.add(new_user)
-        db.session.commit()
+        try:
+            auth_service.register_user(data["email"], data["password"])
+        except auth_service.UserAlreadyExists as e:
+            return {"message": str(e)}, 409
 
         return {"message": "Пользователь успешно создан"}, 201
 
@@ -66,11 +65,10 @@ class UserLogin(Resource):
     def post(self):
         """Вход пользователя и получение JWT токена"""
         data = request.json
-        user = User.query.filter_by(email=data["email"]).first()
+        user = auth_service.authenticate(data["email"], data["password"])
 
-        if user and user.check_password(data["password"]):
-            access_token = create_access_token(identity=str(user.id))
-            return {"access_token": access_token}
+        if user:
+            return {"access_token": auth_service.issue_access_token(user)}
 
         return {"message": "Неверные учетные данные"}, 401
 
@@ -85,3 +83,36 @@ class UserMe(Resource):
         current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         return user
+
+
+@api.route("/telegram_token")
+class TelegramToken(Resource):
+    @api.expect(
+        api.model(
+            "TelegramTokenRequest",
+            {
+                "telegram_id": fields.String(
+                    required=True, description="ID пользователя в Telegram"
+                )
+            },
+        ),
+        validate=True,
+    )
+    @api.marshal_with(token_model)
+    @api.doc(
+        security=None,
+        params={"X-Bot-Secret": {"in": "header", "description": "Секрет бота"}},
+    )
+    @api.response(403, "Неверный секрет бота.")
+    @api.response(404, "Telegram аккаунт не привязан.")
+    def post(self):
+        """Продление JWT для привязанного Telegram аккаунта (только для бота)"""
+        secret = current_app.config["BOT_API_SECRET"]
+        provided = request.headers.get("X-Bot-Secret", "")
+        if not secret or not hmac.compare_digest(provided, secret):
+            api.abort(403, "Неверный секрет бота.")
+
+        token = auth_service.issue_token_for_telegram(request.json["telegram_id"])
+        if token is None:
+            api.abort(404, "Telegram аккаунт не привязан.")
+        return {"access_token": token}
@@ -1,10 +1,15 @@
 # app/api/chat.py
-from flask import request
-from flask_restx import Namespace, Resource, fields
-from app.models import BusinessProfile, ChatSession, Message
-from app import db
+import json
+import math
+from flask import Response, current_app, request, stream_with_context
+from flask_restx import Namespace, Resource, fields, inputs, reqparse
+from app.models import ChatSession
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.services.llm_clients import get_gigachat_response
+from app.metrics import record_llm_error
+from app.services import chat_service, idempotency
+from app.services.admission import AdmissionRejected, Lease, admit
+from app.services.llm_clients import LLMCircuitOpen, LLMError
+from app.services.llm_providers import get_llm_provider
 
 api = Namespace("chat", description="Операции чата с ассистентом")
 
@@ -37,6 +42,9 @@ assistant_message_response_model = api.model(
         "assistant_message": fields.Nested(
             message_model, description="Сообщение, сгенерированное ассистентом"
         ),
+        "prompt_tokens": fields.Integer(
+            description="Оценка числа токенов промпта, отправленного в LLM"
+        ),
     },
 )
 
@@ -47,11 +55,101 @@ session_history_model = api.model(
         "user_id": fields.Integer(readOnly=True),
         "created_at": fields.DateTime(readOnly=True),
         "messages": fields.List(
-            fields.Nested(message_model), description="Список всех сообщений в сессии"
+            fields.Nested(message_model),
+            description="Страница сообщений сессии в хронологическом порядке",
+        ),
+        "has_more": fields.Boolean(
+            description="Есть ли еще сообщения в направлении листания"
         ),
     },
 )
 
+session_summary_model = api.model(
+    "SessionSummary",
+    {
+        "id": fields.Integer(readOnly=True),
+        "title": fields.String(description="Начало первого сообщения пользователя"),
+        "message_count": fields.Integer(description="Число сообщений в сессии"),
+        "last_message_at": fields.DateTime(description="Время последнего сообщения"),
+        "created_at": fields.DateTime(readOnly=True),
+    },
+)
+
+session_list_model = api.model(
+    "SessionList",
+    {
+        "sessions": fields.List(fields.Nested(session_summary_model)),
+        "has_more": fields.Boolean(description="Есть ли более давние сессии"),
+    },
+)
+
+MAX_HISTORY_PAGE_SIZE = 200
+MAX_SESSIONS_PAGE_SIZE = 100
+
+session_history_parser = reqparse.RequestParser()
+session_history_parser.add_argument(
+    "before_id",
+    type=int,
+    location="args",
+    help="Вернуть сообщения, предшествующие сообщению с этим ID",
+)
+session_history_parser.add_argument(
+    "after_id",
+    type=int,
+    location="args",
+    help="Вернуть сообщения, следующие за сообщением с этим ID",
+)
+session_history_parser.add_argument(
+    "limit",
+    type=inputs.int_range(1, MAX_HISTORY_PAGE_SIZE),
+    default=50,
+    location="args",
+    help=f"Размер страницы (1-{MAX_HISTORY_PAGE_SIZE})",
+)
+
+session_list_parser = reqparse.RequestParser()
+session_list_parser.add_argument(
+    "before_id",
+    type=int,
+    location="args",
+    help="ID последней сессии предыдущей страницы",
+)
+session_list_parser.add_argument(
+    "limit",
+    type=inputs.int_range(1, MAX_SESSIONS_PAGE_SIZE),
+    default=20,
+    location="args",
+    help=f"Размер страницы (1-{MAX_SESSIONS_PAGE_SIZE})",
+)
+
+
+@api.errorhandler(AdmissionRejected)
+def handle_admission_rejected(error):
+    """429/503 с Retry-After вместо ожидания таймаута GigaChat."""
+    return (
+        {"message": str(error)},
+        error.status_code,
+        {"Retry-After": str(error.retry_after)},
+    )
+
+
+@api.errorhandler(LLMCircuitOpen)
+def handle_circuit_open(error):
+    """503, пока GigaChat недоступен и автомат разомкнут."""
+    record_llm_error(error)
+    return (
+        {"message": "Ассистент временно недоступен. Повторите запрос позже."},
+        503,
+        {"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+def _sse(data, event=None):
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event:
+        payload = f"event: {event}\n{payload}"
+    return payload
+
 
 @api.route("/send_message")
 class SendMessage(Resource):
@@ -59,78 +157,221 @@ class SendMessage(Resource):
     @jwt_required()
     @api.expect(send_message_model, validate=True)
     @api.marshal_with(assistant_message_response_model)
+    @api.header(
+        "Idempotency-Key",
+        "Ключ повтора: запрос с тем же ключом вернет сохраненный ответ",
+    )
+    @api.response(
+        409,
+        "Сессия была удалена во время генерации ответа или запрос с тем же "
+        "Idempotency-Key еще выполняется.",
+    )
+    @api.response(422, "Idempotency-Key уже использован для другого запроса.")
+    @api.response(429, "Превышена доля запросов пользователя (см. Retry-After).")
+    @api.response(503, "Ассистент перегружен или недоступен (см. Retry-After).")
     def post(self):
+        """Отправка сообщения ассистенту.
+
+        Если передан заголовок ``Idempotency-Key``, повтор запроса с тем же
+        ключом (например, после таймаута у клиента) не создает второе
+        сообщение и не вызывает LLM повторно, а возвращает сохраненный ответ.
+        Пока исходный запрос выполняется, повтор ждет его завершения.
+        """
         current_user_id = int(get_jwt_identity())
         data = request.json
-        user_message_content = data["message_content"]
-        session_id = data.get("session_id")
+        idempotency_key = request.headers.get("Idempotency-Key")
 
-        if session_id:
-            session = ChatSession.query.get(session_id)
-            if not session or session.user_id != current_user_id:
-                api.abort(403, "Доступ к данной сессии запрещен.")
-        else:
-            session = ChatSession(user_id=current_user_id)
-            db.session.add(session)
-            db.session.flush()
+        if idempotency_key:
+            fingerprint = idempotency.request_fingerprint(
+                [data["message_content"], data.get("session_id")]
+            )
+            try:
+                replay = idempotency.begin(
+                    current_user_id, idempotency_key, fingerprint
+                )
+            except idempotency.IdempotencyKeyReused as e:
+                api.abort(422, str(e))
+            except idempotency.IdempotencyInProgress as e:
+                api.abort(409, str(e))
+            if replay is not None:
+                return replay
 
-        user_message = Message(
-            session_id=session.id, role="user", content=user_message_content
-        )
-        db.session.add(user_message)
-
-        profile = BusinessProfile.query.filter_by(user_id=current_user_id).first()
-        history_messages = (
-            Message.query.filter_by(session_id=session.id)
-            .order_by(Message.timestamp.desc())
-            .limit(10)
-            .all()
-        )
-        history_messages.reverse()
+        try:
+            session_id, assistant_message, prompt_tokens = chat_service.send_message(
+                current_user_id, data["message_content"], data.get("session_id")
+            )
+        except chat_service.SessionAccessDenied as e:
+            if idempotency_key:
+                idempotency.fail(current_user_id, idempotency_key)
+            api.abort(403, str(e))
+        except chat_service.SessionDeleted as e:
+            if idempotency_key:
+                idempotency.fail(current_user_id, idempotency_key)
+            api.abort(409, str(e))
+        except Exception:
+            if idempotency_key:
+                idempotency.fail(current_user_id, idempotency_key)
+            raise
 
-        system_text = (
-            "Ты — полезный ассистент для малого бизнеса в РФ. Отвечай кратко и по делу."
+        result = api.marshal(
+            {
+                "session_id": session_id,
+                "assistant_message": assistant_message,
+                "prompt_tokens": prompt_tokens,
+            },
+            assistant_message_response_model,
         )
-        if profile:
-            system_text += (
-                f" Контекст о бизнесе пользователя: "
-                f"Отрасль - {profile.industry}, "
-                f"Размер компании - {profile.company_size}, "
-                f"Цели - {profile.goals}."
+        if idempotency_key:
+            idempotency.complete(current_user_id, idempotency_key, result)
+        return result
+
+
+@api.route("/send_message/stream")
+class SendMessageStream(Resource):
+    @api.doc(security="jwt")
+    @jwt_required()
+    @api.expect(send_message_model, validate=True)
+    @api.produces(["text/event-stream"])
+    @api.response(429, "Превышена доля запросов пользователя (см. Retry-After).")
+    @api.response(503, "Ассистент перегружен или недоступен (см. Retry-After).")
+    def post(self):
+        """Отправка сообщения с потоковой передачей ответа (Server-Sent Events).
+
+        События: ``session`` с ID сессии, затем безымянные события с
+        фрагментами ответа ``{"delta": ...}`` и итоговое ``done`` с
+        сохранённым сообщением ассистента. Если поток LLM оборвался или
+        завершился ошибкой, вместо ``done`` приходит ``error`` с
+        ``partial: true``: сохранённый ответ неполный и не кэшируется.
+        """
+        current_user_id = int(get_jwt_identity())
+        data = request.json
+        user_message_content = data["message_content"]
+
+        try:
+            turn = chat_service.begin_turn(
+                current_user_id, data.get("session_id"), user_message_content
             )
+        except chat_service.SessionAccessDenied as e:
+            api.abort(403, str(e))
+        session_id = turn.session_id
+        context = turn.context
 
-        dialog_history_text = "\n".join(
-            [f"{msg.role}: {msg.content}" for msg in history_messages]
-        )
+        # Ответ из кэша отдается без слота. При промахе слот занимается перед
+        # обращением к LLM и освобождается, когда поток завершен или
+        # соединение закрыто
+        cached = chat_service.get_cached_response(turn)
+        provider = get_llm_provider(current_app.config)
+        if cached is None:
+            lease = admit(current_app.config, current_user_id)
+            try:
+                provider.ensure_available()
+            except Exception:
+                lease.release()
+                raise
+        else:
+            lease = Lease(None, current_user_id)
 
-        assistant_response_content = get_gigachat_response(
-            system_prompt=system_text,
-            dialog_history=dialog_history_text,
-            user_message=user_message_content,
-        )
+        def generate():
+            chunks = []
+            completed = False
+            llm_error = None
+            try:
+                yield _sse(
+                    {"session_id": session_id, "prompt_tokens": context.prompt_tokens},
+                    event="session",
+                )
+                if cached is not None:
+                    chunks.append(cached)
+                    yield _sse({"delta": cached})
+                else:
+                    try:
+                        for chunk in provider.stream(
+                            system_prompt=context.system_prompt,
+                            history=context.history,
+                            user_message=user_message_content,
+                        ):
+                            chunks.append(chunk)
+                            yield _sse({"delta": chunk})
+                    except LLMError as e:
+                        print(f"LLM Error: {e!r}")
+                        record_llm_error(e)
+                        llm_error = e
+                        notice = f"\n\n{e.user_message}" if chunks else e.user_message
+                        chunks.append(notice)
+                        yield _sse({"delta": notice})
+                    else:
+                        chat_service.cache_response(turn, "".join(chunks))
+                completed = True
+            finally:
+                lease.release()
+                # Сохраняем ответ и при обрыве соединения клиентом: в этом
+                # случае в истории останется уже сгенерированная часть.
+                content = "".join(chunks)
+                assistant_message = None
+                if content:
+                    assistant_message = chat_service.save_assistant_message(
+                        session_id, content
+                    )
 
-        if assistant_response_content.startswith("Извините, произошла ошибка"):
-            print(f"LLM Error: {assistant_response_content}")
+            if completed:
+                payload = {
+                    "session_id": session_id,
+                    "prompt_tokens": context.prompt_tokens,
+                    "assistant_message": assistant_message
+                    and api.marshal(assistant_message, message_model),
+                }
+                if llm_error is None:
+                    yield _sse(payload, event="done")
+                else:
+                    payload.update(partial=True, message=llm_error.user_message)
+                    yield _sse(payload, event="error")
 
-        assistant_message = Message(
-            session_id=session.id, role="assistant", content=assistant_response_content
+        response = Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-        db.session.add(assistant_message)
+        response.call_on_close(lease.release)
+        return response
 
-        db.session.commit()
 
-        return {"session_id": session.id, "assistant_message": assistant_message}
+@api.route("/sessions")
+class SessionList(Resource):
+    @api.doc(security="jwt")
+    @jwt_required()
+    @api.expect(session_list_parser)
+    @api.marshal_with(session_list_model)
+    def get(self):
+        """Список сессий пользователя, от недавно активных к давним"""
+        current_user_id = int(get_jwt_identity())
+        args = session_list_parser.parse_args()
+        sessions, has_more = chat_service.list_sessions(
+            current_user_id, before_id=args["before_id"], limit=args["limit"]
+        )
+        return {"sessions": sessions, "has_more": has_more}
 
 
 @api.route("/session/<int:session_id>")
 class SessionHistory(Resource):
     @api.doc(security="jwt")
     @jwt_required()
+    @api.expect(session_history_parser)
     @api.marshal_with(session_history_model)
+    @api.response(400, "Некорректные параметры пагинации.")
     @api.response(403, "Доступ запрещен.")
     @api.response(404, "Сессия не найдена.")
     def get(self, session_id):
+        """История сессии с пагинацией по курсору.
+
+        Без параметров возвращает последние ``limit`` сообщений. Для
+        загрузки более ранних передайте ``before_id`` равным ID первого
+        полученного сообщения, для новых — ``after_id``.
+        """
         current_user_id = int(get_jwt_identity())
+        args = session_history_parser.parse_args()
+        if args["before_id"] is not None and args["after_id"] is not None:
+            api.abort(400, "Укажите только один из параметров before_id и after_id.")
+
         session = ChatSession.query.get_or_404(
             session_id, description=f"Сессия с ID {session_id} не найдена."
         )
@@ -138,4 +379,16 @@ class SessionHistory(Resource):
         if session.user_id != current_user_id:
             api.abort(403, "Доступ к данной сессии запрещен.")
 
-        return session
+        messages, has_more = chat_service.get_session_messages(
+            session.id,
+            before_id=args["before_id"],
+            after_id=args["after_id"],
+            limit=args["limit"],
+        )
+        return {
+            "id": session.id,
+            "user_id": session.user_id,
+            "created_at": session.created_at,
+            "messages": messages,
+            "has_more": has_more,
+        }
@@ -2,10 +2,11 @@
 
 from flask import request
 from flask_restx import Namespace, Resource, fields
-from app.models import BusinessProfile
+from app.models import BusinessProfile, User
 from app import db
+from app.sqlite import begin_write
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import User
+from app.services import auth_service
 
 api = Namespace("profile", description="Операции с бизнес-профилем пользователя")
 
@@ -58,8 +59,14 @@ class ProfileResource(Resource):
         current_user_id = int(get_jwt_identity())
         data = request.json
 
+        begin_write()
         profile = BusinessProfile.query.filter_by(user_id=current_user_id).first()
 
+        # Сбрасываем закэшированный системный промпт во всех воркерах
+        User.query.filter_by(id=current_user_id).update(
+            {User.profile_version: User.profile_version + 1}
+        )
+
         if profile:
             profile.industry = data["industry"]
             profile.company_size = data["company_size"]
@@ -98,17 +105,43 @@ class LinkTelegram(Resource):
     def post(self):
         """Привязать Telegram ID к текущему пользователю"""
         current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
-        if not user:
-            api.abort(404, "Пользователь не найден.")
-
         data = request.json
-        telegram_id = data["telegram_id"]
 
-        existing_user = User.query.filter_by(telegram_id=telegram_id).first()
-        if existing_user and existing_user.id != current_user_id:
-            api.abort(409, "Этот Telegram аккаунт уже привязан к другому пользователю.")
+        try:
+            auth_service.link_telegram(current_user_id, data["telegram_id"])
+        except auth_service.UserNotFound as e:
+            api.abort(404, str(e))
+        except auth_service.TelegramAlreadyLinked as e:
+            api.abort(409, str(e))
+        return {"message": "Telegram аккаунт успешно привязан."}, 200
+
 
-        user.telegram_id = str(telegram_id)
+@api.route("/response_cache")
+class ResponseCacheSetting(Resource):
+    @api.doc(security="jwt")
+    @jwt_required()
+    @api.expect(
+        api.model(
+            "ResponseCacheSettingModel",
+            {
+                "enabled": fields.Boolean(
+                    required=True,
+                    description="Разрешить отдавать ответы из кэша повторных вопросов",
+                )
+            },
+        ),
+        validate=True,
+    )
+    @api.response(200, "Настройка сохранена.")
+    @api.response(404, "Пользователь не найден.")
+    def post(self):
+        """Включить или отключить кэш ответов для текущего пользователя"""
+        current_user_id = int(get_jwt_identity())
+        begin_write()
+        user = db.session.get(User, current_user_id)
+        if not user:
+            api.abort(404, "Пользователь не найден.")
+
+        user.response_cache_opt_out = not request.json["enabled"]
         db.session.commit()
-        return {"message": "Telegram аккаунт успешно привязан."}, 200
+        return {"enabled": not user.response_cache_opt_out}, 200
@@ -0,0 +1,232 @@
+# app/metrics.py
+"""Метрики в формате Prometheus.
+
+При запуске под gunicorn задайте PROMETHEUS_MULTIPROC_DIR (пустой каталог,
+общий для воркеров): тогда каждый воркер пишет значения в свои файлы, а
+``/metrics`` любого воркера отдает сумму по всем процессам.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from app import tracing
+
+# Ответ LLM занимает секунды, запросы к БД — миллисекунды
+STAGE_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    20,
+    30,
+    60,
+)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "alpha_chat_stage_seconds",
+    "Длительность этапов обработки сообщения чата",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_ERRORS = Counter(
+    "alpha_llm_errors_total", "Ошибки обращения к LLM по классу", ["error"]
+)
+LLM_TOKENS = Counter(
+    "alpha_llm_tokens_total",
+    "Токены, учтенные GigaChat (usage), по виду",
+    ["kind"],
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "alpha_llm_prompt_tokens",
+    "Оценка числа токенов промпта (системный промпт, история и вопрос)",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+LLM_PROMPT_TRUNCATED = Counter(
+    "alpha_llm_prompt_truncated_total",
+    "Промпты, история которых обрезана по бюджету контекста",
+)
+LLM_CIRCUIT_TRANSITIONS = Counter(
+    "alpha_llm_circuit_transitions_total",
+    "Переходы автоматического выключателя LLM",
+    ["from_state", "to_state"],
+)
+# Число воркеров, у которых автомат LLM в данном состоянии
+LLM_CIRCUIT_STATE = Gauge(
+    "alpha_llm_circuit_state",
+    "Воркеры по состоянию автоматического выключателя LLM",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+LLM_LATENCY_P95 = Gauge(
+    "alpha_llm_latency_p95_seconds",
+    "p95 длительности ответа LLM по скользящему окну (максимум по воркерам)",
+    multiprocess_mode="livemax",
+)
+LLM_ADMISSION_ACTIVE = Gauge(
+    "alpha_llm_admission_active",
+    "Запросы к LLM, получившие слот допуска",
+    multiprocess_mode="livesum",
+)
+LLM_ADMISSION_QUEUED = Gauge(
+    "alpha_llm_admission_queued",
+    "Запросы к LLM в очереди допуска",
+    multiprocess_mode="livesum",
+)
+LLM_ADMISSION_REJECTED = Counter(
+    "alpha_llm_admission_rejected_total",
+    "Запросы к LLM, не допущенные контроллером, по причине",
+    ["reason"],
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "alpha_response_cache_lookups_total",
+    "Обращения к кэшам сервиса по кэшу и результату",
+    ["cache", "result"],
+)
+RESPONSE_CACHE_ENTRIES = Gauge(
+    "alpha_response_cache_entries",
+    "Записи в кэшах сервиса",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+RESPONSE_CACHE_BYTES = Gauge(
+    "alpha_response_cache_bytes",
+    "Размер значений в кэшах сервиса, байт",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+HTTP_IN_PROGRESS = Gauge(
+    "alpha_http_requests_in_progress",
+    "Выполняемые HTTP-запросы",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "alpha_http_request_duration_seconds",
+    "Длительность HTTP-запросов",
+    ["endpoint", "method", "status"],
+    buckets=STAGE_BUCKETS,
+)
+BOT_HANDLER_SECONDS = Histogram(
+    "alpha_bot_handler_seconds",
+    "Длительность обработчиков Telegram-бота",
+    ["handler", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+
+
+@contextmanager
+def observe_stage(stage):
+    """Записывает длительность этапа ``stage`` в гистограмму и спан трассы."""
+    with tracing.span(f"stage.{stage}"), CHAT_STAGE_SECONDS.labels(stage).time():
+        yield
+
+
+def record_llm_error(error):
+    LLM_ERRORS.labels(type(error).__name__).inc()
+
+
+def record_llm_usage(usage):
+    """Учитывает поле ``usage`` ответа chat/completions, если оно есть."""
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            LLM_TOKENS.labels(kind).inc(tokens)
+
+
+def record_prompt(tokens, truncated):
+    LLM_PROMPT_TOKENS.observe(tokens)
+    if truncated:
+        LLM_PROMPT_TRUNCATED.inc()
+
+
+def record_circuit_transition(name, old_state, new_state):
+    LLM_CIRCUIT_TRANSITIONS.labels(old_state, new_state).inc()
+
+
+def record_circuit_state(state):
+    for name in ("closed", "open", "half_open"):
+        LLM_CIRCUIT_STATE.labels(name).set(1 if name == state else 0)
+
+
+def record_llm_latency_p95(seconds):
+    if seconds is not None:
+        LLM_LATENCY_P95.set(seconds)
+
+
+def record_admission_state(active, queued):
+    LLM_ADMISSION_ACTIVE.set(active)
+    LLM_ADMISSION_QUEUED.set(queued)
+
+
+def record_admission_rejected(reason):
+    LLM_ADMISSION_REJECTED.labels(reason).inc()
+
+
+def record_cache_lookup(cache, hit):
+    RESPONSE_CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_cache_size(cache, entries, size):
+    RESPONSE_CACHE_ENTRIES.labels(cache).set(entries)
+    RESPONSE_CACHE_BYTES.labels(cache).set(size)
+
+
+def _collect():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_app(app):
+    """Регистрирует ``/metrics`` и учет HTTP-запросов приложения."""
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_endpoint = request.endpoint or "unknown"
+        HTTP_IN_PROGRESS.labels(g.metrics_endpoint).inc()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.get("metrics_started")
+        if started is not None:
+            HTTP_REQUEST_SECONDS.labels(
+                g.metrics_endpoint, request.method, str(response.status_code)
+            ).observe(time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        endpoint = g.pop("metrics_endpoint", None)
+        if endpoint is not None:
+            HTTP_IN_PROGRESS.labels(endpoint).dec()
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(_collect(), mimetype=CONTENT_TYPE_LATEST)
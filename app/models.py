@@ -11,6 +11,15 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     telegram_id = db.Column(db.String(64), unique=True, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Пользователь может запретить отдавать ему ответы из кэша
+    response_cache_opt_out = db.Column(
+        db.Boolean, nullable=False, default=False, server_default=db.false()
+    )
+    # Увеличивается при каждом изменении бизнес-профиля; по нему воркеры
+    # узнают, что закэшированный системный промпт устарел.
+    profile_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
 
     business_profile = db.relationship(
         "BusinessProfile", backref="user", uselist=False, lazy=True
@@ -43,20 +52,56 @@ class BusinessProfile(db.Model):
 
 
 class ChatSession(db.Model):
+    # Список диалогов пользователя сортируется по последней активности
+    __table_args__ = (
+        db.Index(
+            "ix_chat_session_user_id_last_message_at_id",
+            "user_id",
+            "last_message_at",
+            "id",
+        ),
+    )
+
+    TITLE_LENGTH = 80
+
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Денормализованные поля для списка сессий; обновляются в той же
+    # транзакции, что и вставка сообщений (см. chat_service.add_message).
+    title = db.Column(db.String(TITLE_LENGTH))
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_message_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Отдельный индекс не нужен: user_id — первый столбец составного индекса
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
     messages = db.relationship(
         "Message", backref="chat_session", lazy=True, cascade="all, delete-orphan"
     )
 
+    @classmethod
+    def title_from_message(cls, content):
+        """Заголовок сессии по первому сообщению пользователя.
+
+        Пробелы схлопываются, длинный текст обрезается до TITLE_LENGTH с "…".
+        """
+        title = " ".join(content.split())
+        if len(title) > cls.TITLE_LENGTH:
+            title = title[: cls.TITLE_LENGTH - 1] + "…"
+        return title
+
     def __repr__(self):
         return f"<ChatSession {self.id}>"
 
 
 class Message(db.Model):
+    # История сессии читается как "последние N сообщений по времени",
+    # поэтому индекс покрывает и фильтр, и сортировку.
+    __table_args__ = (
+        db.Index("ix_message_session_id_timestamp_id", "session_id", "timestamp", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     role = db.Column(db.String(10), nullable=False)
@@ -66,3 +111,25 @@ class Message(db.Model):
 
     def __repr__(self):
         return f"<Message {self.id} in Session {self.session_id}>"
+
+
+class IdempotencyRecord(db.Model):
+    """Результат запроса, сохраненный по ключу Idempotency-Key."""
+
+    __table_args__ = (db.UniqueConstraint("user_id", "key"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    # Отпечаток тела запроса: повтор с тем же ключом, но другим телом — ошибка
+    request_hash = db.Column(db.String(64), nullable=False)
+    # "pending" пока исходный запрос выполняется, затем "done"
+    status = db.Column(db.String(10), nullable=False, default="pending")
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # До этого момента запрос "pending" считается выполняемым; после — его
+    # воркер, вероятно, упал, и повтор может перехватить запись
+    lease_expires_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<IdempotencyRecord {self.key} for User {self.user_id}>"
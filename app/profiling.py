@@ -0,0 +1,131 @@
+# app/profiling.py
+"""Профилирование следующих N запросов по команде администратора.
+
+Счетчик оставшихся запросов хранится в файле PROFILE_DIR/armed под
+блокировкой fcntl, поэтому команда действует на все воркеры gunicorn.
+Профили cProfile сохраняются в PROFILE_DIR и открываются через
+``python -m pstats`` или snakeviz.
+"""
+
+import cProfile
+import fcntl
+import os
+import threading
+import time
+from flask import current_app, g, request
+from app import tracing
+
+ARMED_FILE = "armed"
+
+# Одновременно в процессе профилируется один запрос: профилировщики
+# разных потоков мешают друг другу (в Python 3.12 это ошибка).
+_profile_lock = threading.Lock()
+
+
+def _armed_path(profile_dir):
+    return os.path.join(profile_dir, ARMED_FILE)
+
+
+def _update_remaining(profile_dir, change):
+    """Меняет счетчик под блокировкой; возвращает (было, стало)."""
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(_armed_path(profile_dir), "a+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        raw = f.read().strip()
+        before = int(raw) if raw else 0
+        after = max(0, change(before))
+        f.seek(0)
+        f.truncate()
+        # Нулевой счетчик хранится пустым файлом: _claim видит его по размеру
+        if after:
+            f.write(str(after))
+        return before, after
+
+
+def _peek_remaining(profile_dir):
+    """Читает счетчик без блокировки (значение может быть устаревшим)."""
+    try:
+        with open(_armed_path(profile_dir), encoding="utf-8") as f:
+            raw = f.read().strip()
+    except FileNotFoundError:
+        return 0
+    try:
+        return int(raw) if raw else 0
+    except ValueError:
+        # Запись в другом процессе еще не завершена
+        return 1
+
+
+def arm(profile_dir, count):
+    """Профилировать следующие ``count`` запросов (0 — отменить)."""
+    return _update_remaining(profile_dir, lambda _: count)[1]
+
+
+def remaining(profile_dir):
+    return _peek_remaining(profile_dir)
+
+
+def list_profiles(profile_dir, limit=50):
+    if not os.path.isdir(profile_dir):
+        return []
+    names = [name for name in os.listdir(profile_dir) if name.endswith(".prof")]
+    return sorted(names, reverse=True)[:limit]
+
+
+def _claim(profile_dir):
+    # Дешевая проверка без блокировки: в обычном режиме файла со счетчиком
+    # нет или он пустой. Блокировка берется, только если счетчик не нулевой.
+    path = _armed_path(profile_dir)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    if _peek_remaining(profile_dir) <= 0:
+        return False
+    before, _ = _update_remaining(profile_dir, lambda value: value - 1)
+    return before > 0
+
+
+def init_app(app):
+    profile_dir = app.config["PROFILE_DIR"]
+
+    @app.before_request
+    def _start_profiling():
+        if not _profile_lock.acquire(blocking=False):
+            return
+        try:
+            claimed = _claim(profile_dir)
+        except OSError as e:
+            print(f"Не удалось прочитать счетчик профилирования: {e}")
+            claimed = False
+        if not claimed:
+            _profile_lock.release()
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Профилировщик уже включен другим инструментом
+            _profile_lock.release()
+            return
+        g.profiler = profiler
+
+    @app.teardown_request
+    def _finish_profiling(exc):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return
+        try:
+            profiler.disable()
+            endpoint = (request.endpoint or "unknown").replace(".", "_")
+            name = "{}-{:09d}-{}-{}.prof".format(
+                time.strftime("%Y%m%d-%H%M%S"),
+                time.time_ns() % 10**9,
+                endpoint,
+                tracing.current_trace_id() or os.getpid(),
+            )
+            profiler.dump_stats(os.path.join(profile_dir, name))
+            current_app.logger.info(f"Saved profile {name}")
+        except OSError as e:
+            print(f"Не удалось сохранить профиль: {e}")
+        finally:
+            _profile_lock.release()
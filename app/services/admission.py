@@ -0,0 +1,316 @@
+# app/services/admission.py
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from app.metrics import record_admission_rejected, record_admission_state
+
+
+class AdmissionRejected(Exception):
+    """Запрос к LLM не допущен; клиенту стоит повторить через ``retry_after``."""
+
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimited(AdmissionRejected):
+    """Пользователь исчерпал свою долю запросов."""
+
+    status_code = 429
+
+
+class Overloaded(AdmissionRejected):
+    """Очередь ожидания переполнена или ожидание слота истекло."""
+
+    status_code = 503
+
+
+class TokenBucket:
+    """Ограничение частоты: ``rate`` запросов в секунду с запасом ``burst``.
+
+    ``rate`` = 0 — частота не ограничена. Не потокобезопасен сам по себе,
+    вызывается под локом контроллера.
+    """
+
+    def __init__(self, rate, burst):
+        if rate < 0:
+            raise ValueError(f"rate must be >= 0, got {rate}")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self):
+        if not self.rate:
+            return True
+        self._refill(time.monotonic())
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def time_until_token(self):
+        if not self.rate:
+            return 0.0
+        self._refill(time.monotonic())
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+# Пользователь, чей слот занят в текущем контексте: по нему допускается
+# дублирующий (хеджирующий) вызов LLM того же запроса
+_current_user = contextvars.ContextVar("admission_user", default=None)
+
+
+class Lease:
+    """Выданный слот; ``release`` можно вызывать повторно.
+
+    Внутри ``with`` пользователь слота доступен через ``current_user()``.
+    """
+
+    def __init__(self, controller, user_id):
+        self._controller = controller
+        self._user_id = user_id
+        # Без контроллера (допуск выключен) освобождать нечего
+        self._released = controller is None
+        self._context_token = None
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._user_id)
+
+    def __enter__(self):
+        self._context_token = _current_user.set(self._user_id)
+        return self
+
+    def __exit__(self, *exc):
+        _current_user.reset(self._context_token)
+        self.release()
+
+
+class AdmissionController:
+    """Допуск запросов к LLM: лимит параллельности, частоты и честная очередь.
+
+    Запрос сразу получает слот, если свободна параллельность, в корзине
+    есть токен и никто не ждет. Иначе он встает в ограниченную очередь
+    (``max_queue``) и ждет не дольше ``queue_timeout`` секунд. Освободившийся
+    слот получает пользователь с наименьшим числом выполняемых запросов, а
+    среди равных — тот, кто дольше не обслуживался, поэтому один активный
+    пользователь не вытесняет остальных. У каждого пользователя не больше
+    ``max_per_user`` запросов в работе и в очереди вместе.
+
+    Лимиты действуют в пределах процесса: при нескольких воркерах gunicorn
+    суммарный лимит равен лимиту воркера, умноженному на число воркеров.
+    Число выполняемых и ожидающих запросов и отказы экспортируются в
+    метрики Prometheus.
+    """
+
+    def __init__(
+        self, max_concurrent, rate, burst, max_queue, queue_timeout, max_per_user
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.pid = os.getpid()
+        self._bucket = TokenBucket(rate, burst)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._active_by_user = {}
+        # Очереди билетов по пользователям; порядок ключей — очередность
+        # обслуживания пользователей (round-robin)
+        self._waiting = OrderedDict()
+        self._queued = 0
+        self._granted = set()
+
+    def acquire(self, user_id):
+        """Возвращает Lease или бросает RateLimited/Overloaded."""
+        with self._cond:
+            user_load = self._active_by_user.get(user_id, 0) + len(
+                self._waiting.get(user_id, ())
+            )
+            if user_load >= self.max_per_user:
+                record_admission_rejected("per_user")
+                raise RateLimited(
+                    "Слишком много одновременных запросов. Дождитесь ответа "
+                    "на предыдущие сообщения.",
+                    retry_after=self._estimate_wait(),
+                )
+
+            if (
+                not self._queued
+                and self._active < self.max_concurrent
+                and self._bucket.try_take()
+            ):
+                self._grant(user_id)
+                return Lease(self, user_id)
+
+            if self._queued >= self.max_queue:
+                record_admission_rejected("queue_full")
+                raise Overloaded(
+                    "Ассистент перегружен. Повторите запрос позже.",
+                    retry_after=self._estimate_wait(),
+                )
+
+            ticket = object()
+            self._waiting.setdefault(user_id, deque()).append(ticket)
+            self._queued += 1
+            self._publish()
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    self._dispatch()
+                    if ticket in self._granted:
+                        self._granted.discard(ticket)
+                        return Lease(self, user_id)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        record_admission_rejected("queue_timeout")
+                        raise Overloaded(
+                            "Ассистент перегружен. Повторите запрос позже.",
+                            retry_after=self._estimate_wait(),
+                        )
+                    timeout = remaining
+                    if self._active < self.max_concurrent:
+                        # Ждем только пополнения корзины
+                        timeout = min(timeout, self._bucket.time_until_token())
+                    self._cond.wait(max(timeout, 0.001))
+            finally:
+                self._discard_ticket(user_id, ticket)
+                self._publish()
+
+    def try_acquire(self, user_id):
+        """Возвращает Lease, если слот свободен прямо сейчас, иначе None.
+
+        В очередь не встает и отказ не считает: так допускаются
+        необязательные вызовы вроде хеджирующего дубля.
+        """
+        with self._cond:
+            user_load = self._active_by_user.get(user_id, 0) + len(
+                self._waiting.get(user_id, ())
+            )
+            if (
+                user_load < self.max_per_user
+                and not self._queued
+                and self._active < self.max_concurrent
+                and self._bucket.try_take()
+            ):
+                self._grant(user_id)
+                return Lease(self, user_id)
+            return None
+
+    def _grant(self, user_id):
+        self._active += 1
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+        self._publish()
+
+    def _publish(self):
+        """Вызывается под локом."""
+        record_admission_state(self._active, self._queued)
+
+    def _dispatch(self):
+        """Раздает свободные слоты ожидающим. Вызывается под локом."""
+        granted_any = False
+        while self._queued and self._active < self.max_concurrent:
+            if not self._bucket.try_take():
+                break
+            user_id = min(
+                self._waiting, key=lambda uid: self._active_by_user.get(uid, 0)
+            )
+            tickets = self._waiting.pop(user_id)
+            self._granted.add(tickets.popleft())
+            self._queued -= 1
+            if tickets:
+                # Пользователь уходит в конец очереди обслуживания
+                self._waiting[user_id] = tickets
+            self._grant(user_id)
+            granted_any = True
+        if granted_any:
+            self._cond.notify_all()
+
+    def _discard_ticket(self, user_id, ticket):
+        tickets = self._waiting.get(user_id)
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        self._queued -= 1
+        if not tickets:
+            del self._waiting[user_id]
+
+    def _release(self, user_id):
+        with self._cond:
+            self._active -= 1
+            self._active_by_user[user_id] -= 1
+            if not self._active_by_user[user_id]:
+                del self._active_by_user[user_id]
+            self._publish()
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _estimate_wait(self):
+        """Грубая оценка, когда стоит повторить: очередь / частота."""
+        if not self._bucket.rate:
+            # Без ограничения частоты очередь ждет только освобождения слотов
+            return self.queue_timeout
+        return (self._queued + 1) / self._bucket.rate
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller(config):
+    """Возвращает контроллер процесса или None, если допуск выключен."""
+    global _controller
+    if not config["LLM_ADMISSION_ENABLED"]:
+        return None
+    controller = _controller
+    if controller is not None and controller.pid == os.getpid():
+        return controller
+    with _controller_lock:
+        if _controller is None or _controller.pid != os.getpid():
+            _controller = AdmissionController(
+                max_concurrent=config["LLM_MAX_CONCURRENT"],
+                rate=config["LLM_RATE_LIMIT"],
+                burst=config["LLM_RATE_BURST"],
+                max_queue=config["LLM_QUEUE_SIZE"],
+                queue_timeout=config["LLM_QUEUE_TIMEOUT"],
+                max_per_user=config["LLM_MAX_PER_USER"],
+            )
+        return _controller
+
+
+def admit(config, user_id):
+    """Занимает слот для запроса пользователя к LLM.
+
+    Возвращает Lease (пустой, если допуск выключен); бросает
+    AdmissionRejected, если запрос не допущен.
+    """
+    controller = get_admission_controller(config)
+    if controller is None:
+        return Lease(None, user_id)
+    return controller.acquire(user_id)
+
+
+def try_admit(config, user_id):
+    """Неблокирующий вариант ``admit``: Lease или None, если слота нет."""
+    controller = get_admission_controller(config)
+    if controller is None:
+        return Lease(None, user_id)
+    return controller.try_acquire(user_id)
+
+
+def current_user():
+    """Пользователь слота, занятого в текущем контексте, или None."""
+    return _current_user.get()
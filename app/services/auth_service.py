@@ -0,0 +1,76 @@
+# app/services/auth_service.py
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models import User
+from app.sqlite import begin_write
+
+
+class AuthServiceError(Exception):
+    """Базовая ошибка сервиса аутентификации."""
+
+
+class UserAlreadyExists(AuthServiceError):
+    """Пользователь с таким email уже зарегистрирован."""
+
+
+class UserNotFound(AuthServiceError):
+    """Пользователь не найден."""
+
+
+class TelegramAlreadyLinked(AuthServiceError):
+    """Telegram аккаунт привязан к другому пользователю."""
+
+
+def register_user(email, password):
+    """Создает пользователя и возвращает его."""
+    begin_write()
+    if User.query.filter_by(email=email).first():
+        raise UserAlreadyExists("Пользователь с таким email уже существует")
+
+    new_user = User(email=email)
+    new_user.set_password(password)
+    db.session.add(new_user)
+    db.session.commit()
+    return new_user
+
+
+def authenticate(email, password):
+    """Возвращает пользователя при верных учетных данных, иначе None."""
+    user = User.query.filter_by(email=email).first()
+    if user and user.check_password(password):
+        return user
+    return None
+
+
+def issue_access_token(user):
+    return create_access_token(identity=str(user.id))
+
+
+def issue_token_for_telegram(telegram_id):
+    """Выпускает JWT для пользователя, к которому привязан Telegram ID.
+
+    Позволяет боту продлевать сессию без повторного ввода пароля.
+    Возвращает None, если Telegram аккаунт не привязан.
+    """
+    user = User.query.filter_by(telegram_id=str(telegram_id)).first()
+    if user is None:
+        return None
+    return issue_access_token(user)
+
+
+def link_telegram(user_id, telegram_id):
+    """Привязывает Telegram ID к пользователю."""
+    begin_write()
+    user = db.session.get(User, user_id)
+    if not user:
+        raise UserNotFound("Пользователь не найден.")
+
+    existing_user = User.query.filter_by(telegram_id=str(telegram_id)).first()
+    if existing_user and existing_user.id != user_id:
+        raise TelegramAlreadyLinked(
+            "Этот Telegram аккаунт уже привязан к другому пользователю."
+        )
+
+    user.telegram_id = str(telegram_id)
+    db.session.commit()
+    return user
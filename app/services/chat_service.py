@@ -0,0 +1,380 @@
+# app/services/chat_service.py
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.expression import ColumnElement
+from app import db
+from app.metrics import observe_stage, record_llm_error, record_prompt
+from app.models import BusinessProfile, ChatSession, Message, User
+from app.services.admission import admit
+from app.services.context_window import ContextWindow, build_context_window
+from app.services.response_cache import (
+    ResponseCache,
+    get_response_cache,
+    make_cache_key,
+)
+from app.services.llm_clients import LLMError
+from app.services.llm_providers import get_llm_provider
+from app.sqlite import begin_write
+
+
+class ChatServiceError(Exception):
+    """Базовая ошибка сервиса чата."""
+
+
+class SessionAccessDenied(ChatServiceError):
+    """Сессия не существует или принадлежит другому пользователю."""
+
+
+class SessionDeleted(ChatServiceError):
+    """Сессию удалили, пока генерировался ответ."""
+
+
+@dataclass
+class Turn:
+    """Данные хода диалога, собранные в первой фазе."""
+
+    session_id: int
+    context: ContextWindow
+    # Ключ кэша ответов; None, если кэш выключен или пользователь отказался
+    cache_key: str | None = None
+
+
+BASE_SYSTEM_PROMPT = (
+    "Ты — полезный ассистент для малого бизнеса в РФ. Отвечай кратко и по делу."
+)
+
+# Отрендеренные системные промпты по ключу "user_id:profile_version".
+# Версия профиля хранится в БД, поэтому после изменения профиля все воркеры
+# перестают попадать в старую запись; она вытесняется по LRU/TTL.
+_system_prompt_cache = ResponseCache(
+    ttl=24 * 3600, max_bytes=4 * 1024 * 1024, name="system_prompt"
+)
+
+
+def get_or_create_session(user_id, session_id):
+    """Возвращает пару (session, user); пользователь загружается вместе с сессией."""
+    if session_id:
+        session = ChatSession.query.options(joinedload(ChatSession.user)).get(
+            session_id
+        )
+        if not session or session.user_id != user_id:
+            raise SessionAccessDenied("Доступ к данной сессии запрещен.")
+        return session, session.user
+
+    session = ChatSession(user_id=user_id)
+    db.session.add(session)
+    db.session.flush()
+    return session, db.session.get(User, user_id)
+
+
+def get_system_prompt(user):
+    """Возвращает системный промпт с контекстом бизнес-профиля пользователя.
+
+    Профиль читается из БД только при промахе кэша: ключ включает
+    ``user.profile_version``, который увеличивается при каждом изменении
+    профиля.
+    """
+    key = f"{user.id}:{user.profile_version}"
+    system_text = _system_prompt_cache.get(key)
+    if system_text is not None:
+        return system_text
+
+    profile = BusinessProfile.query.filter_by(user_id=user.id).first()
+    system_text = BASE_SYSTEM_PROMPT
+    if profile:
+        system_text += (
+            f" Контекст о бизнесе пользователя: "
+            f"Отрасль - {profile.industry}, "
+            f"Размер компании - {profile.company_size}, "
+            f"Цели - {profile.goals}."
+        )
+    _system_prompt_cache.set(key, system_text)
+    return system_text
+
+
+def add_message(session, role, content):
+    """Добавляет сообщение и обновляет счетчики сессии в текущей транзакции."""
+    now = datetime.utcnow()
+    message = Message(session_id=session.id, role=role, content=content, timestamp=now)
+    db.session.add(message)
+
+    # Счетчик наращивается в SQL. Если в этой транзакции выражение уже
+    # назначено (второе сообщение до flush), увеличиваем его, а не заменяем.
+    pending_count = session.__dict__.get("message_count")
+    if isinstance(pending_count, ColumnElement):
+        session.message_count = pending_count + 1
+    else:
+        session.message_count = ChatSession.message_count + 1
+    session.last_message_at = now
+    if not session.title and role == "user":
+        session.title = ChatSession.title_from_message(content)
+    return message
+
+
+def build_prompt(user, session, user_message_content):
+    """Собирает промпт для LLM в пределах бюджета токенов.
+
+    Возвращает ContextWindow с системным промптом, историей диалога и
+    оценкой числа токенов промпта.
+    """
+    config = current_app.config
+    system_text = get_system_prompt(user)
+    history_messages = (
+        Message.query.filter_by(session_id=session.id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(config["CHAT_HISTORY_MAX_MESSAGES"])
+    )
+
+    return build_context_window(
+        system_text,
+        user_message_content,
+        history_messages,
+        budget_tokens=config["GIGACHAT_CONTEXT_TOKENS"],
+        max_tokens=config["GIGACHAT_MAX_TOKENS"],
+    )
+
+
+def begin_turn(user_id, session_id, user_message_content):
+    """Фаза 1: сохраняет сообщение пользователя и собирает промпт.
+
+    Транзакция фиксируется до обращения к LLM, чтобы не держать блокировку
+    записи SQLite на время сетевого запроса. Возвращает Turn — ORM-объекты
+    после commit не используются.
+    """
+    begin_write()
+    with observe_stage("db_load"):
+        session, user = get_or_create_session(user_id, session_id)
+
+    # История собирается до добавления нового сообщения: оно передается
+    # в LLM отдельно и не должно дублироваться в истории.
+    with observe_stage("prompt_build"):
+        context = build_prompt(user, session, user_message_content)
+    record_prompt(context.prompt_tokens, context.truncated)
+    current_app.logger.debug(
+        f"LLM prompt: session={session.id} tokens={context.prompt_tokens} "
+        f"history={len(context.history)} truncated={context.truncated}"
+    )
+
+    add_message(session, "user", user_message_content)
+
+    cache_key = None
+    if get_response_cache(current_app.config) is not None:
+        if not user.response_cache_opt_out:
+            cache_key = make_cache_key(
+                context.system_prompt, context.history, user_message_content
+            )
+
+    turn = Turn(session_id=session.id, context=context, cache_key=cache_key)
+    with observe_stage("commit"):
+        db.session.commit()
+    return turn
+
+
+def get_cached_response(turn):
+    """Возвращает закэшированный ответ для хода или None."""
+    if turn.cache_key is None:
+        return None
+    return get_response_cache(current_app.config).get(turn.cache_key)
+
+
+def cache_response(turn, content):
+    if turn.cache_key is None:
+        return
+    get_response_cache(current_app.config).set(turn.cache_key, content)
+
+
+def save_assistant_message(session_id, content):
+    """Фаза 3: сохраняет ответ ассистента в отдельной короткой транзакции.
+
+    Возвращает None, если сессию удалили, пока шла генерация ответа.
+    """
+    begin_write()
+    session = db.session.get(ChatSession, session_id)
+    if session is None:
+        db.session.rollback()
+        return None
+
+    assistant_message = add_message(session, "assistant", content)
+    try:
+        with observe_stage("commit"):
+            db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return assistant_message
+
+
+def send_message(user_id, user_message_content, session_id=None):
+    """Полный цикл сообщения: сохранить вопрос, спросить LLM, сохранить ответ.
+
+    Возвращает тройку (session_id, assistant_message, prompt_tokens).
+    Ответ из кэша отдается без слота контроллера допуска. При промахе слот
+    занимается только на время обращения к LLM; если запрос отклонен
+    (AdmissionRejected или LLMCircuitOpen, пока GigaChat недоступен), вопрос
+    остается в истории без ответа.
+    Требует контекст приложения Flask.
+    """
+    turn = begin_turn(user_id, session_id, user_message_content)
+    context = turn.context
+
+    # Фаза 2: запрос к LLM без открытой транзакции.
+    assistant_response_content = get_cached_response(turn)
+    if assistant_response_content is None:
+        with admit(current_app.config, user_id):
+            provider = get_llm_provider(current_app.config)
+            provider.ensure_available()
+            try:
+                assistant_response_content = provider.complete(
+                    system_prompt=context.system_prompt,
+                    history=context.history,
+                    user_message=user_message_content,
+                )
+            except LLMError as e:
+                print(f"LLM Error: {e!r}")
+                record_llm_error(e)
+                assistant_response_content = e.user_message
+            else:
+                cache_response(turn, assistant_response_content)
+
+    assistant_message = save_assistant_message(
+        turn.session_id, assistant_response_content
+    )
+    if assistant_message is None:
+        raise SessionDeleted("Сессия была удалена во время генерации ответа.")
+    return turn.session_id, assistant_message, context.prompt_tokens
+
+
+def get_session_messages(session_id, before_id=None, after_id=None, limit=50):
+    """Страница сообщений сессии по курсору в стабильном порядке (timestamp, id).
+
+    Без курсора возвращаются последние ``limit`` сообщений; с ``before_id`` —
+    предыдущие перед указанным сообщением, с ``after_id`` — следующие после
+    него. Сообщения всегда отдаются в хронологическом порядке. Возвращает
+    пару (messages, has_more), где has_more означает, что в направлении
+    листания есть еще сообщения.
+    """
+    key = tuple_(Message.timestamp, Message.id)
+    query = Message.query.filter_by(session_id=session_id)
+
+    cursor_id = before_id if before_id is not None else after_id
+    if cursor_id is not None:
+        cursor = (
+            db.session.query(Message.timestamp, Message.id)
+            .filter_by(session_id=session_id, id=cursor_id)
+            .first()
+        )
+        if cursor is None:
+            return [], False
+        cursor_key = tuple_(cursor.timestamp, cursor.id)
+
+    if after_id is not None and before_id is None:
+        query = query.filter(key > cursor_key).order_by(
+            Message.timestamp.asc(), Message.id.asc()
+        )
+        newest_first = False
+    else:
+        if before_id is not None:
+            query = query.filter(key < cursor_key)
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+        newest_first = True
+
+    messages = query.limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if newest_first:
+        messages.reverse()
+    return messages, has_more
+
+
+def list_sessions(user_id, before_id=None, limit=20):
+    """Страница сессий пользователя, от недавно активных к давним.
+
+    Курсор ``before_id`` — ID последней сессии предыдущей страницы.
+    Возвращает пару (sessions, has_more).
+    """
+    key = tuple_(ChatSession.last_message_at, ChatSession.id)
+    query = ChatSession.query.filter_by(user_id=user_id)
+
+    if before_id is not None:
+        cursor = (
+            db.session.query(ChatSession.last_message_at, ChatSession.id)
+            .filter_by(user_id=user_id, id=before_id)
+            .first()
+        )
+        if cursor is None:
+            return [], False
+        query = query.filter(key < tuple_(cursor.last_message_at, cursor.id))
+
+    sessions = (
+        query.order_by(ChatSession.last_message_at.desc(), ChatSession.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    return sessions[:limit], len(sessions) > limit
+
+
+def _send_message_in_context(app, user_id, user_message_content, session_id):
+    with app.app_context():
+        session_id, assistant_message, prompt_tokens = send_message(
+            user_id, user_message_content, session_id
+        )
+        return {
+            "session_id": session_id,
+            "prompt_tokens": prompt_tokens,
+            "assistant_message": {
+                "id": assistant_message.id,
+                "role": assistant_message.role,
+                "content": assistant_message.content,
+                "timestamp": assistant_message.timestamp,
+            },
+        }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(config):
+    """Пул потоков процесса для синхронных вызовов из асинхронного кода.
+
+    Пул цикла событий по умолчанию (``asyncio.to_thread``) содержит
+    min(32, cpu + 4) потоков: ходы диалога, ждущие LLM, заняли бы его
+    целиком. Размер задается BOT_WORKER_THREADS.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=config["BOT_WORKER_THREADS"],
+                    thread_name_prefix="chat-worker",
+                )
+    return _executor
+
+
+async def run_in_executor(app, fn, *args):
+    """Выполняет ``fn(*args)`` в пуле get_executor, сохраняя contextvars."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await loop.run_in_executor(get_executor(app.config), call)
+
+
+async def send_message_async(app, user_id, user_message_content, session_id=None):
+    """Асинхронная обертка над send_message для Telegram-бота.
+
+    Выполняет запрос в пуле потоков со своим контекстом приложения и
+    сессией БД, не блокируя цикл событий. Возвращает словарь в формате
+    ответа ``/chat/send_message``.
+    """
+    return await run_in_executor(
+        app, _send_message_in_context, app, user_id, user_message_content, session_id
+    )
@@ -0,0 +1,59 @@
+# app/services/context_window.py
+import math
+from dataclasses import dataclass, field
+from app.services.llm_clients import ChatMessage
+
+# Грубая оценка для токенизатора GigaChat: русский текст в среднем
+# укладывается в ~3 символа на токен. Оценка намеренно с запасом.
+CHARS_PER_TOKEN = 3
+# Служебные токены на каждое сообщение (роль, разделители).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Оценивает число токенов в тексте сообщения вместе с накладными."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class ContextWindow:
+    """Промпт, собранный под бюджет токенов."""
+
+    system_prompt: str
+    history: list = field(default_factory=list)
+    prompt_tokens: int = 0
+    truncated: bool = False
+
+
+def build_context_window(
+    system_prompt, user_message, messages_newest_first, budget_tokens, max_tokens
+):
+    """Заполняет бюджет токенов историей от новых сообщений к старым.
+
+    Системный промпт (вместе с бизнес-профилем) и текущее сообщение
+    пользователя включаются всегда; из ``budget_tokens`` резервируется
+    ``max_tokens`` под ответ модели. Сообщения истории добавляются, пока
+    очередное помещается в оставшийся бюджет; на первом не поместившемся
+    заполнение останавливается, чтобы в истории не было «дыр».
+    """
+    used = estimate_tokens(system_prompt) + estimate_tokens(user_message)
+    available = budget_tokens - max_tokens - used
+
+    history = []
+    truncated = False
+    for msg in messages_newest_first:
+        cost = estimate_tokens(msg.content)
+        if cost > available:
+            truncated = True
+            break
+        history.append(ChatMessage(msg.role, msg.content))
+        available -= cost
+        used += cost
+
+    history.reverse()
+    return ContextWindow(
+        system_prompt=system_prompt,
+        history=history,
+        prompt_tokens=used,
+        truncated=truncated,
+    )
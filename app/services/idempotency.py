@@ -0,0 +1,150 @@
+# app/services/idempotency.py
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import IdempotencyRecord
+from app.sqlite import begin_write
+
+# Интервал опроса БД, пока исходный запрос с тем же ключом еще выполняется
+POLL_INTERVAL = 0.2
+
+
+class IdempotencyError(Exception):
+    """Базовая ошибка обработки Idempotency-Key."""
+
+
+class IdempotencyKeyReused(IdempotencyError):
+    """Ключ уже использован для запроса с другим телом."""
+
+
+class IdempotencyInProgress(IdempotencyError):
+    """Исходный запрос не завершился за время ожидания."""
+
+
+def request_fingerprint(payload):
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _expiry_cutoff():
+    return datetime.utcnow() - timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"])
+
+
+def _find(user_id, key):
+    return IdempotencyRecord.query.filter_by(user_id=user_id, key=key).first()
+
+
+def _lease_deadline():
+    return datetime.utcnow() + timedelta(
+        seconds=current_app.config["IDEMPOTENCY_LEASE"]
+    )
+
+
+def _lease_expired(record):
+    expires_at = record.lease_expires_at
+    if expires_at is None:
+        # Запись создана до появления аренды
+        expires_at = record.created_at + timedelta(
+            seconds=current_app.config["IDEMPOTENCY_LEASE"]
+        )
+    return expires_at < datetime.utcnow()
+
+
+def _take_over(record_id, expired_lease):
+    """Забирает просроченную запись "pending"; True, если успели первыми."""
+    begin_write()
+    taken = IdempotencyRecord.query.filter_by(
+        id=record_id, status="pending", lease_expires_at=expired_lease
+    ).update({"lease_expires_at": _lease_deadline()}, synchronize_session=False)
+    db.session.commit()
+    return taken == 1
+
+
+def begin(user_id, key, fingerprint):
+    """Регистрирует запрос с ключом или возвращает сохраненный результат.
+
+    Возвращает None, если вызывающий должен выполнить запрос сам (и затем
+    вызвать ``complete`` или ``fail``). Если запрос с этим ключом уже
+    выполнен, возвращает его результат. Если он еще выполняется — ждет
+    его завершения, а не запускает второй вызов LLM. Запись, аренда которой
+    истекла (воркер исходного запроса упал), перехватывается: вызывающий
+    выполняет запрос заново.
+    """
+    config = current_app.config
+    deadline = time.monotonic() + config["IDEMPOTENCY_WAIT_TIMEOUT"]
+
+    while True:
+        begin_write()
+        # Заодно чистим устаревшие записи, чтобы таблица оставалась ограниченной
+        IdempotencyRecord.query.filter(
+            IdempotencyRecord.created_at < _expiry_cutoff()
+        ).delete(synchronize_session=False)
+        db.session.add(
+            IdempotencyRecord(
+                user_id=user_id,
+                key=key,
+                request_hash=fingerprint,
+                lease_expires_at=_lease_deadline(),
+            )
+        )
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+        record = _find(user_id, key)
+        if record is None:
+            # Запись удалили между вставкой и чтением (fail) — пробуем снова
+            continue
+        if record.request_hash != fingerprint:
+            db.session.rollback()
+            raise IdempotencyKeyReused(
+                "Idempotency-Key уже использован для другого запроса."
+            )
+        if record.status == "done":
+            response = json.loads(record.response)
+            db.session.rollback()
+            return response
+        if _lease_expired(record):
+            record_id, expired_lease = record.id, record.lease_expires_at
+            db.session.rollback()
+            if _take_over(record_id, expired_lease):
+                current_app.logger.warning(
+                    f"Idempotency-Key {key}: lease expired, request taken over"
+                )
+                return None
+            continue
+
+        db.session.rollback()
+        if time.monotonic() >= deadline:
+            raise IdempotencyInProgress(
+                "Запрос с этим Idempotency-Key еще выполняется. Повторите позже."
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+def complete(user_id, key, response):
+    """Сохраняет результат запроса для повторов с тем же ключом."""
+    begin_write()
+    record = _find(user_id, key)
+    if record is None:
+        db.session.rollback()
+        return
+    record.status = "done"
+    record.response = json.dumps(response, ensure_ascii=False)
+    db.session.commit()
+
+
+def fail(user_id, key):
+    """Снимает регистрацию ключа, чтобы повтор мог выполнить запрос заново."""
+    db.session.rollback()
+    begin_write()
+    IdempotencyRecord.query.filter_by(
+        user_id=user_id, key=key, status="pending"
+    ).delete(synchronize_session=False)
+    db.session.commit()
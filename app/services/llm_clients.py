@@ -1,21 +1,303 @@
-# app/services/llm_clients.py
+import json
+import os
 import requests
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from app import tracing
+from app.metrics import (
+    observe_stage,
+    record_circuit_state,
+    record_circuit_transition,
+    record_llm_latency_p95,
+    record_llm_usage,
+)
+from app.services.admission import current_user, try_admit
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    backoff_delays,
+    hedged_call,
+)
 
+# Ответы, после которых запрос безопасно повторить: запрос не выполнен
+# или выполнен без побочных эффектов для нас
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
 
-def get_gigachat_token():
-    auth_credentials_base64 = current_app.config["GIGACHAT_AUTH_CREDENTIALS"]
 
-    if auth_credentials_base64:
-        auth_credentials_base64 = auth_credentials_base64.strip("\"'")
+class LLMError(Exception):
+    """Ошибка обращения к LLM.
 
-    if not auth_credentials_base64:
-        print("Ошибка конфигурации: GIGACHAT_AUTH_CREDENTIALS не найден в .env")
-        return None, "Ошибка: Учетные данные для GigaChat не настроены."
+    ``user_message`` — текст, который можно показать пользователю вместо
+    ответа ассистента.
+    """
+
+    user_message = "Извините, произошла ошибка при обращении к GigaChat."
+
+    def __init__(self, message, user_message=None):
+        super().__init__(message)
+        if user_message is not None:
+            self.user_message = user_message
+
+
+class LLMConfigError(LLMError):
+    """Учетные данные GigaChat не настроены."""
+
+
+class LLMAuthError(LLMError):
+    """Не удалось получить access token GigaChat."""
+
+
+class LLMUnavailable(LLMError):
+    """GigaChat недоступен: сетевая ошибка, таймаут или 5xx после повторов."""
+
+
+class LLMCircuitOpen(LLMUnavailable):
+    """Автомат разомкнут после серии ошибок; запрос не отправлялся."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMResponseError(LLMError):
+    """Ответ GigaChat не удалось разобрать."""
+
+    user_message = "Извините, произошла ошибка при обработке ответа от GigaChat."
+
+
+@dataclass(frozen=True)
+class ChatMessage:
+    """Сообщение диалога в формате chat/completions."""
+
+    role: str
+    content: str
+
+
+class _PoolTimeoutMixin:
+    """Пул urllib3, который ждет свободное соединение не дольше ``pool_timeout``.
+
+    requests не передает ``pool_timeout`` в ``urlopen``, и с ``pool_block``
+    поток ждал бы соединение без ограничения. По истечении срока urllib3
+    бросает EmptyPoolError.
+    """
+
+    pool_timeout = None
+
+    def urlopen(self, method, url, *args, pool_timeout=None, **kwargs):
+        if pool_timeout is None:
+            pool_timeout = self.pool_timeout
+        return super().urlopen(method, url, *args, pool_timeout=pool_timeout, **kwargs)
+
+
+class PoolTimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter с ограниченным ожиданием соединения из пула."""
+
+    def __init__(self, pool_timeout, **kwargs):
+        # Нужен в init_poolmanager, который вызывается из HTTPAdapter.__init__
+        self.pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {"pool_timeout": self.pool_timeout}
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type(
+                "HTTPConnectionPool", (_PoolTimeoutMixin, HTTPConnectionPool), attrs
+            ),
+            "https": type(
+                "HTTPSConnectionPool", (_PoolTimeoutMixin, HTTPSConnectionPool), attrs
+            ),
+        }
+
+
+class GigaChatTransport:
+    """Общий HTTP-транспорт к хостам GigaChat.
+
+    Один ``requests.Session`` с пулом keep-alive соединений на процесс:
+    TCP- и TLS-рукопожатие выполняются один раз на соединение, а размер
+    пула ограничивает число сокетов, которые открывает воркер.
+    """
+
+    def __init__(
+        self,
+        oauth_url,
+        completions_url,
+        scope,
+        pool_size,
+        pool_timeout,
+        connect_timeout,
+        read_timeout,
+        oauth_timeout,
+        verify,
+    ):
+        self.oauth_url = oauth_url
+        self.completions_url = completions_url
+        self.scope = scope
+        self.timeout = (connect_timeout, read_timeout)
+        self.oauth_timeout = (connect_timeout, oauth_timeout)
+        self.pid = os.getpid()
+        self.session = requests.Session()
+        self.session.verify = verify
+        # Пулы на два хоста (OAuth и completions), в каждом не больше
+        # pool_size сокетов. pool_block: лишний поток ждет свободное
+        # соединение, а не открывает временное, которое потом выбрасывается
+        # ("Connection pool is full, discarding connection"), но не дольше
+        # pool_timeout секунд.
+        adapter = PoolTimeoutAdapter(
+            pool_timeout,
+            pool_connections=2,
+            pool_maxsize=pool_size,
+            pool_block=True,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            oauth_url=config["GIGACHAT_OAUTH_URL"],
+            completions_url=config["GIGACHAT_COMPLETIONS_URL"],
+            scope=config["GIGACHAT_SCOPE"],
+            pool_size=config["GIGACHAT_POOL_SIZE"],
+            pool_timeout=config["GIGACHAT_POOL_TIMEOUT"],
+            connect_timeout=config["GIGACHAT_CONNECT_TIMEOUT"],
+            read_timeout=config["GIGACHAT_READ_TIMEOUT"],
+            oauth_timeout=config["GIGACHAT_OAUTH_TIMEOUT"],
+            verify=config["GIGACHAT_CA_BUNDLE"] or True,
+        )
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Возвращает транспорт текущего процесса, создавая его при первом вызове.
+
+    Проверка pid нужна для gunicorn с preload: соединения, открытые в
+    мастер-процессе, не должны переходить в воркеры после fork.
+    """
+    global _transport
+    transport = _transport
+    if transport is not None and transport.pid == os.getpid():
+        return transport
+    with _transport_lock:
+        if _transport is None or _transport.pid != os.getpid():
+            _transport = GigaChatTransport.from_config(current_app.config)
+        return _transport
+
+
+def reset_transport():
+    """Закрывает пул соединений; следующий запрос создаст новый."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None and _transport.pid == os.getpid():
+            _transport.close()
+        _transport = None
+
+
+class GigaChatTokenManager:
+    """Хранит access token GigaChat и обновляет его до истечения срока.
+
+    Токен живёт ~30 минут, поэтому запрашивать его на каждое сообщение
+    незачем. Пока до истечения больше ``refresh_margin`` секунд, отдаётся
+    закэшированный токен; в окне обновления токен ещё отдаётся, а новый
+    запрашивается в фоновом потоке. Одновременно выполняется не более
+    одного обновления.
+    """
+
+    def __init__(self, refresh_margin=120, fallback_ttl=1800):
+        self.refresh_margin = refresh_margin
+        self.fallback_ttl = fallback_ttl
+        # Короткий лок состояния: токен, срок и флаг фонового обновления
+        self._lock = threading.Lock()
+        # Запрос к OAuth выполняет один поток за раз, не держа ``_lock``
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._token = None
+        self._expires_at = 0.0
+
+    def _is_valid(self, now):
+        return self._token is not None and now < self._expires_at
+
+    def _needs_refresh(self, now):
+        return now >= self._expires_at - self.refresh_margin
+
+    def get_token(self, credentials, transport):
+        """Возвращает пару (token, error)."""
+        now = time.time()
+        with self._lock:
+            token = self._token if self._is_valid(now) else None
+            start_refresh = (
+                token is not None and self._needs_refresh(now) and not self._refreshing
+            )
+            if start_refresh:
+                self._refreshing = True
+        if start_refresh:
+            threading.Thread(
+                target=self._background_refresh,
+                args=(credentials, transport),
+                daemon=True,
+            ).start()
+        if token is not None:
+            return token, None
+
+        # Токена нет или он истёк: обновляем синхронно, но только один поток.
+        with self._refresh_lock:
+            with self._lock:
+                if self._is_valid(time.time()):
+                    return self._token, None
+            return self._refresh(credentials, transport)
+
+    def invalidate(self, token=None):
+        """Сбрасывает токен (например, после 401 от completions)."""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
 
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    def _background_refresh(self, credentials, transport):
+        try:
+            with self._refresh_lock:
+                with self._lock:
+                    if not self._needs_refresh(time.time()):
+                        return
+                self._refresh(credentials, transport)
+        finally:
+            with self._lock:
+                self._refreshing = False
 
+    def _refresh(self, credentials, transport):
+        """Запрашивает новый токен. Вызывается под ``self._refresh_lock``.
+
+        Сетевой запрос идет без ``self._lock``: остальные потоки в это время
+        получают закэшированный токен.
+        """
+        token, expires_at, error = _request_gigachat_token(credentials, transport)
+        if error:
+            return None, error
+        with self._lock:
+            self._token = token
+            self._expires_at = expires_at
+        return token, None
+
+
+def _request_gigachat_token(auth_credentials_base64, transport):
     headers = {
         "Content-Type": "application/x-www-form-urlencoded",
         "Accept": "application/json",
@@ -23,63 +305,329 @@ def get_gigachat_token():
         "Authorization": f"Basic {auth_credentials_base64}",
     }
 
-    payload = {"scope": "GIGACHAT_API_PERS"}
+    payload = {"scope": transport.scope}
 
     try:
-        response = requests.post(
-            url, headers=headers, data=payload, verify=False, timeout=10
-        )
+        with tracing.span("gigachat.oauth", kind="CLIENT") as tags:
+            response = transport.post(
+                transport.oauth_url,
+                headers=headers,
+                data=payload,
+                timeout=transport.oauth_timeout,
+            )
+            tags["status"] = response.status_code
         response.raise_for_status()
 
         token_data = response.json()
-        return token_data["access_token"], None
+        # GigaChat возвращает expires_at в миллисекундах с начала эпохи.
+        expires_at = token_data.get("expires_at")
+        if expires_at:
+            expires_at = expires_at / 1000
+        else:
+            expires_at = time.time() + _token_manager.fallback_ttl
+        return token_data["access_token"], expires_at, None
     except requests.exceptions.RequestException as e:
         error_details = e.response.text if e.response else "No response from server"
         print(f"Ошибка получения токена GigaChat: {e}\nDetails: {error_details}")
         return (
+            None,
             None,
             f"Ошибка аутентификации GigaChat. Проверьте ваш GIGACHAT_AUTH_CREDENTIALS.",
         )
 
 
-def get_gigachat_response(system_prompt, dialog_history, user_message):
-    """Отправляет запрос к GigaChat API и возвращает ответ."""
-    access_token, error = get_gigachat_token()
+_token_manager = GigaChatTokenManager()
+
+
+def get_gigachat_token():
+    """Возвращает access token; бросает LLMConfigError или LLMAuthError."""
+    auth_credentials_base64 = current_app.config["GIGACHAT_AUTH_CREDENTIALS"]
+
+    if auth_credentials_base64:
+        auth_credentials_base64 = auth_credentials_base64.strip("\"'")
+
+    if not auth_credentials_base64:
+        print("Ошибка конфигурации: GIGACHAT_AUTH_CREDENTIALS не найден в .env")
+        raise LLMConfigError(
+            "GIGACHAT_AUTH_CREDENTIALS is not set",
+            user_message="Ошибка: Учетные данные для GigaChat не настроены.",
+        )
+
+    token, error = _token_manager.get_token(auth_credentials_base64, get_transport())
     if error:
-        return error
+        raise LLMAuthError(error, user_message=error)
+    return token
 
-    url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "Authorization": f"Bearer {access_token}",
-    }
 
+_breaker = None
+_breaker_lock = threading.Lock()
+_latency = LatencyTracker()
+
+
+def get_circuit_breaker():
+    """Автомат процесса для вызовов GigaChat (создается по конфигурации)."""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                config = current_app.config
+                breaker = CircuitBreaker(
+                    "gigachat",
+                    failure_threshold=config["LLM_BREAKER_FAILURE_THRESHOLD"],
+                    recovery_timeout=config["LLM_BREAKER_RECOVERY_TIMEOUT"],
+                )
+                breaker.on_transition(record_circuit_transition)
+                breaker.on_transition(
+                    lambda name, old_state, new_state: record_circuit_state(new_state)
+                )
+                record_circuit_state(breaker.CLOSED)
+                _breaker = breaker
+    return _breaker
+
+
+def ensure_available():
+    """Бросает LLMCircuitOpen, если автомат разомкнут.
+
+    Позволяет отклонить запрос до обращения к LLM, не занимая слот надолго.
+    """
+    retry_after = get_circuit_breaker().retry_after()
+    if retry_after:
+        raise LLMCircuitOpen("Сервис gigachat временно недоступен.", retry_after)
+
+
+def _build_payload(system_prompt, history, user_message, stream=False):
     messages = [{"role": "system", "content": system_prompt}]
-    for line in dialog_history.split("\n"):
-        if ": " in line:
-            role, content = line.split(": ", 1)
-            messages.append({"role": role.lower(), "content": content})
+    messages.extend({"role": msg.role, "content": msg.content} for msg in history)
     messages.append({"role": "user", "content": user_message})
 
     payload = {
-        "model": "GigaChat:latest",
+        "model": current_app.config["GIGACHAT_MODEL"],
         "messages": messages,
         "temperature": 0.7,
-        "max_tokens": 1000,
+        "max_tokens": current_app.config["GIGACHAT_MAX_TOKENS"],
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
 
+def _send_completions(payload, stream):
+    """Один запрос в chat/completions.
+
+    При 401 токен сбрасывается и запрос повторяется один раз: закэшированный
+    токен мог быть отозван раньше expires_at.
+    """
+    for attempt in range(2):
+        with observe_stage("token_fetch"):
+            access_token = get_gigachat_token()
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream" if stream else "application/json",
+            "Authorization": f"Bearer {access_token}",
+        }
+
+        transport = get_transport()
+        # Для потокового режима — время до начала ответа
+        with observe_stage("llm_call"), tracing.span(
+            "gigachat.completions", kind="CLIENT", stream=stream, attempt=attempt
+        ) as tags:
+            response = transport.post(
+                transport.completions_url, headers=headers, json=payload, stream=stream
+            )
+            tags["status"] = response.status_code
+        if response.status_code == 401 and attempt == 0:
+            response.close()
+            _token_manager.invalidate(access_token)
+            continue
+        return response
+
+
+def _post_completions(payload, stream=False):
+    """Отправляет запрос в chat/completions через автомат и с повторами.
+
+    Сетевые ошибки соединения и ответы из RETRYABLE_STATUS_CODES
+    повторяются с экспоненциальной паузой и джиттером. Таймаут чтения не
+    повторяется: иначе при недоступности сервиса запрос ждал бы таймаут
+    несколько раз. Каждая попытка учитывается автоматом; пока он разомкнут,
+    запросы отклоняются сразу. Возвращает успешный ответ или бросает LLMError.
+    """
+    config = current_app.config
+    breaker = get_circuit_breaker()
+    delays = backoff_delays(
+        config["LLM_RETRY_ATTEMPTS"],
+        config["LLM_RETRY_BASE_DELAY"],
+        config["LLM_RETRY_MAX_DELAY"],
+    )
+
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            raise LLMCircuitOpen(str(e), e.retry_after) from e
+
+        try:
+            response = _send_completions(payload, stream)
+        except LLMConfigError:
+            breaker.record_success()
+            raise
+        except LLMAuthError:
+            breaker.record_failure()
+            raise
+        except EmptyPoolError as e:
+            # Все соединения пула заняты: запрос не отправлялся, на автомат
+            # не влияет
+            breaker.cancel_call()
+            print(f"Нет свободного соединения с GigaChat API: {e}")
+            raise LLMUnavailable(str(e)) from e
+        except requests.exceptions.ReadTimeout as e:
+            breaker.record_failure()
+            print(f"Таймаут ответа GigaChat API: {e}")
+            raise LLMUnavailable(str(e)) from e
+        except requests.exceptions.ConnectionError as e:
+            breaker.record_failure()
+            print(f"Ошибка соединения с GigaChat API: {e}")
+            error = LLMUnavailable(str(e))
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure()
+            print(f"Ошибка при обращении к GigaChat API: {e}")
+            raise LLMUnavailable(str(e)) from e
+        else:
+            if response.ok:
+                breaker.record_success()
+                return response
+            status_code = response.status_code
+            details = response.text
+            response.close()
+            print(
+                f"Ошибка при обращении к GigaChat API: HTTP {status_code}\n"
+                f"Details: {details}"
+            )
+            if status_code not in RETRYABLE_STATUS_CODES:
+                # Сервис отвечает, ошибка в запросе: на автомат не влияет
+                breaker.record_success()
+                raise LLMError(f"GigaChat API returned HTTP {status_code}")
+            breaker.record_failure()
+            error = LLMUnavailable(f"GigaChat API returned HTTP {status_code}")
+
+        delay = next(delays, None)
+        if delay is None:
+            raise error
+        with tracing.span("gigachat.backoff", delay=round(delay, 3)):
+            time.sleep(delay)
+
+
+def _complete(app, payload):
+    with app.app_context():
+        started = time.monotonic()
+        response = _post_completions(payload)
+        try:
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Ошибка обработки ответа от GigaChat API: {e!r}")
+            raise LLMResponseError(str(e)) from e
+        _latency.observe(time.monotonic() - started)
+        record_llm_latency_p95(_latency.percentile(0.95))
+        record_llm_usage(result.get("usage"))
+        return content
+
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor(config):
+    """Пул потоков для вызовов с хеджированием (создается по конфигурации).
+
+    Каждый допущенный вызов занимает поток, а проигравшая попытка держит
+    свой до конца HTTP-запроса, поэтому размер — LLM_HEDGE_WORKERS,
+    по умолчанию вдвое больше LLM_MAX_CONCURRENT.
+    """
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=config["LLM_HEDGE_WORKERS"],
+                    thread_name_prefix="hedge",
+                )
+    return _hedge_executor
+
+
+def _hedge_delay(config):
+    """Задержка перед дублирующим запросом или None, если хеджирование выключено."""
+    if not config["LLM_HEDGE_ENABLED"]:
+        return None
+    if get_circuit_breaker().state != CircuitBreaker.CLOSED:
+        return None
+    p95 = _latency.percentile(0.95)
+    if p95 is None:
+        return None
+    return max(p95, config["LLM_HEDGE_MIN_DELAY"])
+
+
+def get_gigachat_response(system_prompt, history, user_message):
+    """Отправляет запрос к GigaChat API и возвращает текст ответа.
+
+    ``history`` — список ChatMessage от старых к новым, без текущего
+    сообщения пользователя. При ошибке бросает LLMError. Если включено
+    хеджирование и ответа нет дольше p95, параллельно отправляется второй
+    такой же запрос и возвращается первый ответ. Второй запрос тоже
+    проходит допуск (без ожидания): если свободного слота нет, он не
+    отправляется.
+    """
+    payload = _build_payload(system_prompt, history, user_message)
+    app = current_app._get_current_object()
+
+    delay = _hedge_delay(app.config)
+    if delay is None:
+        return _complete(app, payload)
+    user_id = current_user()
+    return hedged_call(
+        lambda: _complete(app, payload),
+        delay,
+        get_hedge_executor(app.config),
+        admit_hedge=lambda: try_admit(app.config, user_id),
+    )
+
+
+def stream_gigachat_response(system_prompt, history, user_message):
+    """Запрашивает ответ GigaChat в потоковом режиме и отдаёт его по частям.
+
+    GigaChat присылает SSE-события ``data: {...}`` с фрагментами ответа в
+    ``choices[0].delta.content`` и завершает поток строкой ``data: [DONE]``.
+    Повторы и автомат действуют только до начала потока; ошибка посреди
+    потока пробрасывается как LLMError. Поток, закрытый без ``[DONE]`` и
+    без ``finish_reason``, считается оборванным (LLMUnavailable).
+    """
+    payload = _build_payload(system_prompt, history, user_message, stream=True)
+    response = _post_completions(payload, stream=True)
+
+    finished = False
     try:
-        response = requests.post(
-            url, headers=headers, json=payload, verify=False, timeout=30
-        )
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    finished = True
+                    break
+                chunk = json.loads(data)
+                # usage приходит в последнем фрагменте
+                record_llm_usage(chunk.get("usage"))
+                choice = chunk["choices"][0]
+                if choice.get("finish_reason"):
+                    finished = True
+                content = choice["delta"].get("content")
+                if content:
+                    yield content
     except requests.exceptions.RequestException as e:
-        error_details = e.response.text if e.response else "No response from server"
-        print(f"Ошибка при обращении к GigaChat API: {e}\nDetails: {error_details}")
-        return f"Извините, произошла ошибка при обращении к GigaChat."
-    except KeyError as e:
-        print(f"Ошибка обработки ответа от GigaChat API: отсутствует ключ {e}")
-        return f"Извините, произошла ошибка при обработке ответа от GigaChat."
+        print(f"Обрыв потока GigaChat API: {e}")
+        raise LLMUnavailable(str(e)) from e
+    except (KeyError, IndexError, ValueError) as e:
+        print(f"Ошибка обработки потокового ответа от GigaChat API: {e!r}")
+        raise LLMResponseError(str(e)) from e
+    if not finished:
+        print("Обрыв потока GigaChat API: соединение закрыто до [DONE]")
+        raise LLMUnavailable("GigaChat stream ended before [DONE]")
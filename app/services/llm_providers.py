@@ -0,0 +1,74 @@
+# app/services/llm_providers.py
+from abc import ABC, abstractmethod
+from app.services import llm_clients
+
+
+class LLMProvider(ABC):
+    """Интерфейс провайдера LLM.
+
+    ``history`` — список ChatMessage от старых к новым, без текущего
+    сообщения пользователя. Ошибки провайдер сообщает исключениями
+    ``llm_clients.LLMError``. Подкласс обязан реализовать ``complete`` и
+    ``stream``, иначе его нельзя создать.
+    """
+
+    name = None
+
+    def ensure_available(self):
+        """Бросает LLMCircuitOpen, если провайдер заведомо недоступен."""
+
+    @abstractmethod
+    def complete(self, system_prompt, history, user_message):
+        """Возвращает текст ответа целиком."""
+
+    @abstractmethod
+    def stream(self, system_prompt, history, user_message):
+        """Генератор фрагментов ответа."""
+
+
+class GigaChatProvider(LLMProvider):
+    """GigaChat API; адреса берутся из GIGACHAT_OAUTH_URL и
+    GIGACHAT_COMPLETIONS_URL, поэтому тот же провайдер работает с
+    локальной заглушкой ``fake_gigachat.py``."""
+
+    name = "gigachat"
+
+    def ensure_available(self):
+        llm_clients.ensure_available()
+
+    def complete(self, system_prompt, history, user_message):
+        return llm_clients.get_gigachat_response(system_prompt, history, user_message)
+
+    def stream(self, system_prompt, history, user_message):
+        return llm_clients.stream_gigachat_response(
+            system_prompt, history, user_message
+        )
+
+
+PROVIDERS = {}
+_instances = {}
+
+
+def register_provider(cls):
+    """Регистрирует класс провайдера под его ``name``."""
+    PROVIDERS[cls.name] = cls
+    return cls
+
+
+register_provider(GigaChatProvider)
+
+
+def get_llm_provider(config):
+    """Возвращает провайдера, выбранного в LLM_PROVIDER."""
+    name = config["LLM_PROVIDER"]
+    provider = _instances.get(name)
+    if provider is None:
+        try:
+            provider_class = PROVIDERS[name]
+        except KeyError:
+            raise llm_clients.LLMConfigError(
+                f"Unknown LLM_PROVIDER: {name!r}",
+                user_message="Ошибка: провайдер LLM настроен неверно.",
+            ) from None
+        provider = _instances.setdefault(name, provider_class())
+    return provider
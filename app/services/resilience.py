@@ -0,0 +1,182 @@
+# app/services/resilience.py
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class CircuitOpenError(Exception):
+    """Автомат разомкнут: вызов отклонен без обращения к сервису."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для вызовов внешнего сервиса.
+
+    ``closed`` — вызовы проходят; после ``failure_threshold`` ошибок подряд
+    автомат размыкается (``open``) и ``recovery_timeout`` секунд отклоняет
+    вызовы сразу. Затем он переходит в ``half_open`` и пропускает один
+    пробный вызов: успех замыкает автомат, ошибка снова размыкает.
+
+    Каждый переход считается в ``transitions`` и передается подписчикам
+    ``on_transition(name, old_state, new_state)``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._listeners = []
+        self.transitions = {}
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def retry_after(self):
+        """Секунды до пробного вызова или 0, если вызовы разрешены."""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state != self.OPEN:
+                return 0
+            return max(self._opened_at + self.recovery_timeout - now, 1)
+
+    def on_transition(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def before_call(self):
+        """Бросает CircuitOpenError, если вызов сейчас не разрешен."""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            retry_after = max(self._opened_at + self.recovery_timeout - now, 1)
+        raise CircuitOpenError(
+            f"Сервис {self.name} временно недоступен.", retry_after=retry_after
+        )
+
+    def cancel_call(self):
+        """Вызов после ``before_call`` не состоялся по локальной причине.
+
+        Счетчики не меняются; пробный вызов в half_open снова разрешен.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _maybe_half_open(self, now):
+        if self._state == self.OPEN and now >= self._opened_at + self.recovery_timeout:
+            self._set_state(self.HALF_OPEN)
+
+    def _set_state(self, new_state):
+        """Вызывается под локом."""
+        old_state, self._state = self._state, new_state
+        key = f"{old_state}->{new_state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        print(f"Circuit breaker {self.name}: {old_state} -> {new_state}")
+        for listener in self._listeners:
+            try:
+                listener(self.name, old_state, new_state)
+            except Exception as e:
+                print(f"Circuit breaker listener failed: {e}")
+
+
+def backoff_delays(attempts, base_delay, max_delay):
+    """Паузы перед повторами: экспонента с полным джиттером."""
+    for attempt in range(attempts - 1):
+        yield random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class LatencyTracker:
+    """Скользящее окно длительностей успешных вызовов для оценки p95."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """Возвращает q-перцентиль или None, пока данных мало."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+def hedged_call(fn, delay, executor, admit_hedge=None):
+    """Вызывает ``fn``; если ответа нет за ``delay`` секунд, запускает копию.
+
+    Возвращается первый успешный результат. Если обе попытки завершились
+    ошибкой, пробрасывается ошибка первой. Проигравший вызов не отменяется
+    (HTTP-запрос нельзя прервать), его результат отбрасывается.
+    ``admit_hedge`` возвращает слот для копии (объект с ``release``) или
+    None — тогда копия не запускается и ждем основной вызов.
+    Каждая попытка выполняется в ``executor`` в копии contextvars
+    вызывающего потока, чтобы спаны трассировки попадали в текущую трассу.
+    """
+    primary = executor.submit(contextvars.copy_context().run, fn)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    lease = admit_hedge() if admit_hedge is not None else None
+    if admit_hedge is not None and lease is None:
+        return primary.result()
+    hedge = executor.submit(contextvars.copy_context().run, fn)
+    if lease is not None:
+        hedge.add_done_callback(lambda _: lease.release())
+    pending = {primary, hedge}
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is None:
+                return future.result()
+            if first_error is None or future is primary:
+                first_error = error
+    raise first_error
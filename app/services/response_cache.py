@@ -0,0 +1,106 @@
+# app/services/response_cache.py
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from app.metrics import record_cache_lookup, record_cache_size
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text):
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def make_cache_key(system_prompt, history, user_message):
+    """Отпечаток промпта: системный промпт (с профилем), история и вопрос.
+
+    Перед хэшированием пробелы схлопываются, регистр приводится к нижнему,
+    поэтому «Как  открыть ИП?» и «как открыть ип?» дают один ключ.
+    """
+    parts = [_normalize(system_prompt)]
+    parts.extend(f"{msg.role}:{_normalize(msg.content)}" for msg in history)
+    parts.append(f"user:{_normalize(user_message)}")
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Потокобезопасный LRU-кэш ответов LLM с TTL и лимитом по размеру.
+
+    Размер считается по байтам UTF-8 закэшированных ответов; при
+    превышении ``max_bytes`` вытесняются давно не использованные записи.
+    Попадания, промахи и размер кэша экспортируются в метрики Prometheus
+    с меткой ``cache=name``.
+    """
+
+    def __init__(self, ttl, max_bytes, name="response"):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self._publish_size()
+                entry = None
+            if entry is None:
+                record_cache_lookup(self.name, hit=False)
+                return None
+            self._entries.move_to_end(key)
+        record_cache_lookup(self.name, hit=True)
+        return entry[0]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+            self._publish_size()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._publish_size()
+
+    def _publish_size(self):
+        """Вызывается под локом."""
+        record_cache_size(self.name, len(self._entries), self._size)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(config):
+    """Возвращает кэш процесса или None, если кэширование выключено."""
+    global _cache
+    if not config["RESPONSE_CACHE_ENABLED"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    ttl=config["RESPONSE_CACHE_TTL"],
+                    max_bytes=config["RESPONSE_CACHE_MAX_BYTES"],
+                )
+    return _cache
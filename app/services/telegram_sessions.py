@@ -0,0 +1,152 @@
+# app/services/telegram_sessions.py
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TelegramSessionStore:
+    """Хранилище сессий Telegram-бота в локальном файле SQLite.
+
+    Для каждого telegram_id хранится JWT токен и ID текущей сессии чата.
+    Записи переживают перезапуск бота, устаревают через ``ttl`` секунд
+    без активности, а при превышении ``max_entries`` вытесняются давно не
+    использованные (LRU по ``last_used``). Чтение продлевает ``last_used``,
+    только если отметка старше ``touch_interval`` секунд (по умолчанию
+    десятая часть TTL, но не больше часа): иначе каждое сообщение боту
+    было бы записью в файл.
+
+    Методы синхронные и могут ждать блокировку файла до 30 секунд. Из
+    цикла событий вызывайте их ``*_async``-варианты: они выполняются в
+    собственном потоке хранилища.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=10000, touch_interval=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if touch_interval is None:
+            touch_interval = min(ttl / 10, 3600)
+        self.touch_interval = touch_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Вызовы из цикла событий: один поток, запросы к файлу и так
+        # выполняются по очереди под ``_lock``
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="bot-sessions"
+        )
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bot_session (
+                telegram_id INTEGER PRIMARY KEY,
+                jwt_token TEXT NOT NULL,
+                session_id INTEGER,
+                last_used REAL NOT NULL
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_bot_session_last_used "
+            "ON bot_session (last_used)"
+        )
+
+    def get(self, telegram_id):
+        """Возвращает {"jwt_token", "session_id"} или None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT jwt_token, session_id, last_used FROM bot_session "
+                "WHERE telegram_id = ?",
+                (telegram_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            jwt_token, session_id, last_used = row
+            if last_used + self.ttl < now:
+                self._conn.execute(
+                    "DELETE FROM bot_session WHERE telegram_id = ?", (telegram_id,)
+                )
+                return None
+            if now - last_used >= self.touch_interval:
+                self._conn.execute(
+                    "UPDATE bot_session SET last_used = ? WHERE telegram_id = ?",
+                    (now, telegram_id),
+                )
+        return {"jwt_token": jwt_token, "session_id": session_id}
+
+    def set(self, telegram_id, jwt_token, session_id=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO bot_session (telegram_id, jwt_token, session_id, last_used) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(telegram_id) DO UPDATE SET jwt_token = excluded.jwt_token, "
+                "session_id = excluded.session_id, last_used = excluded.last_used",
+                (telegram_id, jwt_token, session_id, time.time()),
+            )
+            self._evict()
+
+    def update(self, telegram_id, **fields):
+        """Обновляет jwt_token и/или session_id существующей записи."""
+        allowed = {"jwt_token", "session_id"}
+        assignments = [f"{name} = ?" for name in fields if name in allowed]
+        if not assignments:
+            return
+        values = [value for name, value in fields.items() if name in allowed]
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE bot_session SET {', '.join(assignments)}, last_used = ? "
+                "WHERE telegram_id = ?",
+                (*values, time.time(), telegram_id),
+            )
+
+    def delete(self, telegram_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM bot_session WHERE telegram_id = ?", (telegram_id,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM bot_session").fetchone()[0]
+
+    def _evict(self):
+        """Удаляет устаревшие записи и лишние по LRU. Вызывается под локом."""
+        self._conn.execute(
+            "DELETE FROM bot_session WHERE last_used < ?", (time.time() - self.ttl,)
+        )
+        self._conn.execute(
+            "DELETE FROM bot_session WHERE telegram_id IN ("
+            "SELECT telegram_id FROM bot_session ORDER BY last_used DESC "
+            "LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    async def _run_async(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(method, *args, **kwargs)
+        )
+
+    async def get_async(self, telegram_id):
+        return await self._run_async(self.get, telegram_id)
+
+    async def set_async(self, telegram_id, jwt_token, session_id=None):
+        await self._run_async(self.set, telegram_id, jwt_token, session_id)
+
+    async def update_async(self, telegram_id, **fields):
+        await self._run_async(self.update, telegram_id, **fields)
+
+    async def delete_async(self, telegram_id):
+        await self._run_async(self.delete, telegram_id)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
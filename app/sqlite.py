@@ -0,0 +1,55 @@
+# app/sqlite.py
+from sqlalchemy import event
+from app import db
+
+# Опция выполнения соединения: транзакция будет записывающей
+WRITE_OPTION = "sqlite_write"
+
+
+def configure_sqlite(engine, pragmas, write_begin_mode=None):
+    """Настраивает соединения SQLite через события движка.
+
+    ``pragmas`` выполняются на каждом новом соединении пула. Если задан
+    ``write_begin_mode`` (например, "IMMEDIATE"), управление транзакциями
+    забирается у драйвера pysqlite: обычные транзакции начинаются с
+    отложенного ``BEGIN`` и не мешают параллельному чтению в WAL, а
+    транзакции, открытые через ``begin_write``, — с
+    ``BEGIN <write_begin_mode>``.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if write_begin_mode:
+            # Отключаем неявный BEGIN драйвера, ниже выполняем свой
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    if write_begin_mode:
+
+        @event.listens_for(engine, "begin")
+        def do_begin(conn):
+            if conn.get_execution_options().get(WRITE_OPTION):
+                conn.exec_driver_sql(f"BEGIN {write_begin_mode}")
+            else:
+                conn.exec_driver_sql("BEGIN")
+
+
+def begin_write():
+    """Открывает в ``db.session`` транзакцию записи.
+
+    Вызывается до первого запроса единицы работы, которая читает и затем
+    пишет: в WAL отложенная транзакция при переходе от чтения к записи
+    может получить SQLITE_BUSY без ожидания busy_timeout, а
+    ``BEGIN IMMEDIATE`` сразу ждет блокировку записи. Уже открытая
+    транзакция (например, чтение при сериализации ответа) фиксируется.
+    Для других СУБД опция игнорируется.
+    """
+    session = db.session()
+    if session.in_transaction():
+        session.commit()
+    session.connection(execution_options={WRITE_OPTION: True})
@@ -15,6 +15,31 @@ document.addEventListener('DOMContentLoaded', () => {
         chatWindow.appendChild(messageElement);
         // Прокручиваем вниз
         chatWindow.scrollTop = chatWindow.scrollHeight;
+        return messageElement;
+    }
+
+    // Разбирает одно SSE-событие вида "event: ...\ndata: {...}"
+    function parseEvent(rawEvent) {
+        let event = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach((line) => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+    }
+
+    function handleEvent({ event, data }, assistantElement) {
+        // error — ответ оборвался: частичный текст уже показан вместе с пояснением
+        if (event === 'session' || event === 'done' || event === 'error') {
+            chatSessionId = data.session_id; // Сохраняем/обновляем ID сессии
+        } else if (data && data.delta) {
+            assistantElement.textContent += data.delta;
+            chatWindow.scrollTop = chatWindow.scrollHeight;
+        }
     }
 
     // Обработчик отправки формы
@@ -40,10 +65,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 requestData.session_id = chatSessionId;
             }
 
-            const response = await fetch('/api/v1/chat/send_message', {
+            const response = await fetch('/api/v1/chat/send_message/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
                     'Authorization': `Bearer ${JWT_TOKEN}` // Используем токен, полученный из шаблона
                 },
                 body: JSON.stringify(requestData)
@@ -55,14 +81,33 @@ document.addEventListener('DOMContentLoaded', () => {
                     addMessage('Ваша сессия истекла. Пожалуйста, обновите страницу и войдите снова.', 'assistant');
                     return;
                 }
+                // Ассистент перегружен: сервер подсказывает, когда повторить
+                if (response.status === 429 || response.status === 503) {
+                    const retryAfter = response.headers.get('Retry-After') || '10';
+                    addMessage(`Ассистент сейчас перегружен. Попробуйте еще раз через ${retryAfter} с.`, 'assistant');
+                    return;
+                }
                 throw new Error(`Ошибка сервера: ${response.statusText}`);
             }
 
-            const data = await response.json();
-            const assistantMessage = data.assistant_message.content;
-            chatSessionId = data.session_id; // Сохраняем/обновляем ID сессии
+            // Ответ приходит как Server-Sent Events: дописываем текст по мере генерации
+            const assistantElement = addMessage('', 'assistant');
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
 
-            addMessage(assistantMessage, 'assistant');
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    handleEvent(parseEvent(rawEvent), assistantElement);
+                }
+            }
 
         } catch (error) {
             console.error('Ошибка при отправке сообщения:', error);
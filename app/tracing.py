@@ -0,0 +1,296 @@
+# app/tracing.py
+"""Трассировка запросов: спаны в формате Zipkin v2.
+
+Спаны пишутся построчно (JSON Lines) в TRACE_FILE и/или отправляются
+пачками в коллектор TRACE_ZIPKIN_URL (Zipkin, Jaeger и OpenTelemetry
+Collector принимают этот формат). Текущая трасса хранится в contextvars,
+поэтому переходит в пулы потоков (``run_in_executor`` бота копирует
+контекст) и вложенные вызовы сервисов.
+
+Идентификатор трассы передается между процессами заголовками
+``X-Trace-Id`` и ``X-Parent-Span-Id``: так запрос бота и обработка его
+в API попадают в одну трассу.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from flask import g, request
+from sqlalchemy import event
+
+TRACE_HEADER = "X-Trace-Id"
+PARENT_SPAN_HEADER = "X-Parent-Span-Id"
+
+# Текущий спан: (trace_id, span_id) или None, если трасса не пишется
+_current = contextvars.ContextVar("alpha_trace_span", default=None)
+
+
+class _Exporter:
+    """Фоновая отправка спанов: в файл и/или в коллектор Zipkin."""
+
+    def __init__(self, service_name, file_path=None, zipkin_url=None):
+        self.service_name = service_name
+        self.file_path = file_path
+        self.zipkin_url = zipkin_url
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(
+            target=self._run, name="trace-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # Трассировка не должна тормозить запросы
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Собираем пачку, пока спаны идут подряд
+            deadline = time.monotonic() + 0.5
+            while len(batch) < 500 and time.monotonic() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=0.1))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if self.file_path:
+            try:
+                lines = "".join(
+                    json.dumps(span, ensure_ascii=False) + "\n" for span in batch
+                )
+                # Одна запись в режиме append: строки разных воркеров не смешиваются
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError as e:
+                print(f"Не удалось записать спаны в {self.file_path}: {e}")
+        if self.zipkin_url:
+            try:
+                requests.post(self.zipkin_url, json=batch, timeout=5)
+            except requests.exceptions.RequestException as e:
+                print(f"Не удалось отправить спаны в {self.zipkin_url}: {e}")
+
+
+_settings = None
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def configure(service_name, file_path=None, zipkin_url=None, sample_rate=1.0):
+    """Включает трассировку процесса. Повторные вызовы игнорируются.
+
+    Без ``file_path`` и ``zipkin_url`` трассировка остается выключенной.
+    """
+    global _settings
+    if _settings is not None or not (file_path or zipkin_url):
+        return
+    if file_path:
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    _settings = {
+        "service_name": service_name,
+        "file_path": file_path,
+        "zipkin_url": zipkin_url,
+        "sample_rate": sample_rate,
+    }
+
+
+def is_enabled():
+    return _settings is not None
+
+
+def _get_exporter():
+    """Экспортер текущего процесса; после fork создается заново."""
+    global _exporter
+    exporter = _exporter
+    if exporter is not None and exporter.pid == os.getpid():
+        return exporter
+    with _exporter_lock:
+        if _exporter is None or _exporter.pid != os.getpid():
+            _exporter = _Exporter(
+                _settings["service_name"],
+                _settings["file_path"],
+                _settings["zipkin_url"],
+            )
+        return _exporter
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def current_trace_id():
+    span = _current.get()
+    return span[0] if span else None
+
+
+def propagation_headers():
+    """Заголовки для исходящего запроса в рамках текущей трассы."""
+    span = _current.get()
+    if span is None:
+        return {}
+    return {TRACE_HEADER: span[0], PARENT_SPAN_HEADER: span[1]}
+
+
+@contextmanager
+def span(name, kind=None, **tags):
+    """Спан внутри текущей трассы; без трассы ничего не делает.
+
+    Возвращает словарь тегов: в него можно дописать значения, известные
+    только в конце операции (например, статус ответа).
+    """
+    parent = _current.get()
+    if parent is None:
+        yield tags
+        return
+    trace_id, parent_id = parent
+    span_id = _new_id(64)
+    # set(parent) вместо reset(token): спан HTTP-запроса закрывается в
+    # teardown, который для потоковых ответов может идти в другом контексте
+    _current.set((trace_id, span_id))
+    started_wall = time.time()
+    started = time.perf_counter()
+    try:
+        yield tags
+    except BaseException as e:
+        tags["error"] = type(e).__name__
+        raise
+    finally:
+        _current.set(parent)
+        _record(name, trace_id, span_id, parent_id, started_wall, started, kind, tags)
+
+
+@contextmanager
+def start_trace(name, trace_id=None, parent_id=None, kind="SERVER", **tags):
+    """Корневой спан новой трассы (или продолжение входящей по ``trace_id``).
+
+    Трасса без входящего ``trace_id`` пишется с вероятностью TRACE_SAMPLE_RATE.
+    """
+    if _settings is None or (
+        trace_id is None and random.random() >= _settings["sample_rate"]
+    ):
+        yield tags
+        return
+    previous = _current.get()
+    _current.set((trace_id or _new_id(128), parent_id))
+    try:
+        with span(name, kind=kind, **tags) as span_tags:
+            yield span_tags
+    finally:
+        _current.set(previous)
+
+
+def _record(name, trace_id, span_id, parent_id, started_wall, started, kind, tags):
+    duration_us = max(1, int((time.perf_counter() - started) * 1_000_000))
+    record = {
+        "traceId": trace_id,
+        "id": span_id,
+        "name": name,
+        "timestamp": int(started_wall * 1_000_000),
+        "duration": duration_us,
+        "localEndpoint": {"serviceName": _settings["service_name"]},
+        "tags": {key: str(value) for key, value in tags.items() if value is not None},
+    }
+    if parent_id:
+        record["parentId"] = parent_id
+    if kind:
+        record["kind"] = kind
+    _get_exporter().submit(record)
+
+
+def traced_resource(method):
+    """Декоратор ресурсов flask-restx: спан на обработчик с маршалингом."""
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with span(f"api {request.endpoint}", method=request.method):
+            return method(*args, **kwargs)
+
+    return wrapper
+
+
+def _instrument_engine(engine):
+    """Спаны на SQL-запросы внутри трассы."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is None:
+            return
+        manager = span("db.query", statement=statement[:300])
+        manager.__enter__()
+        conn.info.setdefault("alpha_trace_spans", []).append(manager)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("alpha_trace_spans")
+        if spans:
+            spans.pop().__exit__(None, None, None)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("alpha_trace_spans") if conn is not None else None
+        if spans:
+            error = exception_context.original_exception
+            spans.pop().__exit__(type(error), error, None)
+
+
+def configure_from_config(config):
+    configure(
+        config["TRACE_SERVICE_NAME"],
+        file_path=config["TRACE_FILE"],
+        zipkin_url=config["TRACE_ZIPKIN_URL"],
+        sample_rate=config["TRACE_SAMPLE_RATE"],
+    )
+
+
+def init_app(app, engine):
+    """Спан на каждый HTTP-запрос приложения и на SQL-запросы."""
+    configure_from_config(app.config)
+    if not is_enabled():
+        return
+
+    _instrument_engine(engine)
+
+    @app.before_request
+    def _start_request_trace():
+        manager = start_trace(
+            f"{request.method} {request.url_rule or request.path}",
+            trace_id=request.headers.get(TRACE_HEADER),
+            parent_id=request.headers.get(PARENT_SPAN_HEADER),
+            path=request.path,
+        )
+        g.trace_tags = manager.__enter__()
+        g.trace_manager = manager
+
+    @app.after_request
+    def _tag_response(response):
+        tags = g.get("trace_tags")
+        if tags is not None:
+            tags["status"] = response.status_code
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers[TRACE_HEADER] = trace_id
+        return response
+
+    @app.teardown_request
+    def _finish_request_trace(exc):
+        manager = g.pop("trace_manager", None)
+        if manager is not None:
+            if exc is not None:
+                manager.__exit__(type(exc), exc, None)
+            else:
+                manager.__exit__(None, None, None)
@@ -1,12 +1,8 @@
 # app/web/routes.py
-import requests
 from flask import render_template, flash, redirect, url_for, request, session
 from flask_login import login_user, logout_user, current_user, login_required
 from . import bp
-from app.models import User
-from app import db
-
-API_BASE_URL = "http://127.0.0.1:5000/api/v1"
+from app.services import auth_service
 
 
 @bp.route("/")
@@ -21,22 +17,15 @@ def login():
     if request.method == "POST":
         email = request.form.get("email")
         password = request.form.get("password")
-        try:
-            response = requests.post(
-                f"{API_BASE_URL}/auth/login",
-                json={"email": email, "password": password},
-            )
-            if response.status_code == 200:
-                user = User.query.filter_by(email=email).first()
-                login_user(user, remember=True)
+        user = auth_service.authenticate(email, password)
+        if user:
+            login_user(user, remember=True)
 
-                session["jwt_token"] = response.json()["access_token"]
+            session["jwt_token"] = auth_service.issue_access_token(user)
 
-                return redirect(url_for("web.chat"))
-            else:
-                flash("Неверный email или пароль")
-        except requests.RequestException:
-            flash("Сервис временно недоступен")
+            return redirect(url_for("web.chat"))
+        else:
+            flash("Неверный email или пароль")
 
     return render_template("login.html", title="Вход")
 
@@ -55,18 +44,15 @@ def register():
     if request.method == "POST":
         email = request.form.get("email")
         password = request.form.get("password")
-        try:
-            response = requests.post(
-                f"{API_BASE_URL}/auth/register",
-                json={"email": email, "password": password},
-            )
-            if response.status_code == 201:
+        if not email or not password:
+            flash("Укажите email и пароль")
+        else:
+            try:
+                auth_service.register_user(email, password)
                 flash("Регистрация прошла успешно! Теперь вы можете войти.")
                 return redirect(url_for("web.login"))
-            else:
-                flash(response.json().get("message", "Произошла ошибка"))
-        except requests.RequestException:
-            flash("Сервис временно недоступен")
+            except auth_service.UserAlreadyExists as e:
+                flash(str(e))
 
     return render_template("register.html", title="Регистрация")
 
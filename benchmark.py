@@ -0,0 +1,576 @@
+"""Нагрузочный бенчмарк цепочки чата на локальной заглушке GigaChat.
+
+Создает приложение через ``create_app``, заполняет БД пользователями и
+сессиями с историей заданной длины, поднимает ``fake_gigachat`` с заданной
+задержкой и по очереди нагружает сценарии:
+
+* ``send_message`` — ``POST /api/v1/chat/send_message``;
+* ``session_history`` — ``GET /api/v1/chat/session/<id>``;
+* ``login`` — ``POST /api/v1/auth/login``;
+* ``bot`` — путь сообщения бота (``bot.send_chat_message``) в режиме
+  ``inprocess`` или ``http``.
+
+Для каждого сценария считаются p50/p95/p99 задержки, запросы в секунду и
+доля ошибок; результаты пишутся в JSON для сравнения прогонов.
+
+Пример::
+
+    python benchmark.py --config production --users 20 --history 0,50,200 \\
+        --concurrency 16 --duration 30 --llm-latency fixed:0.3 \\
+        --output benchmark-results/prod-wal.json
+
+По умолчанию приложение обслуживается встроенным многопоточным сервером
+werkzeug в этом же процессе. С ``--gunicorn`` бенчмарк запускает gunicorn
+с ``gunicorn.conf.py`` на той же БД и заглушке; ``--concurrency`` со
+списком значений показывает, как пропускная способность растет с числом
+одновременных чатов::
+
+    python benchmark.py --gunicorn --scenarios send_message \\
+        --concurrency 1,16,64,256 --llm-latency fixed:2 \\
+        --llm-max-concurrent 64 --llm-rate-limit 200 --llm-queue-size 256
+
+Пропускную способность send_message ограничивает допуск к LLM (на каждый
+воркер ``LLM_MAX_CONCURRENT`` одновременных вызовов и ``LLM_RATE_LIMIT``
+вызовов в секунду), поэтому действующие лимиты задаются флагами
+``--llm-*`` и печатаются в начале прогона и в отчете (``admission``).
+
+Уже запущенный сервер (с тем же DATABASE_URL и адресами GigaChat,
+указывающими на ``--llm-port``) нагружается через ``--base-url``.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import runpy
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import requests
+from werkzeug.serving import make_server
+
+from config import config_by_name
+from fake_gigachat import create_fake_app
+
+SCENARIOS = ("send_message", "session_history", "login", "bot")
+PASSWORD = "benchmark-password"
+
+# Настройки допуска к LLM, которые задаются флагами: они ограничивают
+# пропускную способность send_message сильнее всего остального
+ADMISSION_SETTINGS = {
+    "llm_max_concurrent": ("LLM_MAX_CONCURRENT", int),
+    "llm_rate_limit": ("LLM_RATE_LIMIT", float),
+    "llm_rate_burst": ("LLM_RATE_BURST", int),
+    "llm_queue_size": ("LLM_QUEUE_SIZE", int),
+    "llm_queue_timeout": ("LLM_QUEUE_TIMEOUT", float),
+    "llm_max_per_user": ("LLM_MAX_PER_USER", int),
+}
+
+
+@dataclass
+class Fixture:
+    """Засеянные данные: пользователи с токенами и их сессии."""
+
+    users: list = field(default_factory=list)
+
+    def pick(self, rng):
+        user = rng.choice(self.users)
+        return user, rng.choice(user["sessions"])
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+    statuses: dict = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def record(self, seconds, status):
+        self.latencies.append(seconds)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if not (isinstance(status, int) and 200 <= status < 300):
+            self.errors += 1
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+        total = len(ordered)
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else None,
+            "rps": round(total / self.elapsed, 2) if self.elapsed else None,
+            "latency_ms": {
+                "p50": _percentile_ms(ordered, 0.50),
+                "p95": _percentile_ms(ordered, 0.95),
+                "p99": _percentile_ms(ordered, 0.99),
+                "max": _percentile_ms(ordered, 1.0),
+            },
+            "statuses": self.statuses,
+            "duration_s": round(self.elapsed, 2),
+        }
+
+
+def _percentile_ms(ordered, q):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return round(ordered[index] * 1000, 2)
+
+
+def _serve(wsgi_app, port=0):
+    """Запускает многопоточный сервер в фоне, возвращает (server, base_url)."""
+    server = make_server("127.0.0.1", port, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def build_config(args, llm_url, database_uri):
+    base = config_by_name[args.config]
+
+    class BenchmarkConfig(base):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        SECRET_KEY = (
+            os.environ.get("SECRET_KEY") or "benchmark-secret-key-for-local-runs-only"
+        )
+        JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or SECRET_KEY
+        GIGACHAT_AUTH_CREDENTIALS = "benchmark"
+        GIGACHAT_OAUTH_URL = f"{llm_url}/api/v2/oauth"
+        GIGACHAT_COMPLETIONS_URL = f"{llm_url}/api/v1/chat/completions"
+        RESPONSE_CACHE_ENABLED = args.response_cache
+
+    for option, (name, _) in ADMISSION_SETTINGS.items():
+        value = getattr(args, option)
+        if value is not None:
+            setattr(BenchmarkConfig, name, value)
+    if args.no_admission:
+        BenchmarkConfig.LLM_ADMISSION_ENABLED = False
+    return BenchmarkConfig
+
+
+def _gunicorn_workers(args):
+    """Число воркеров gunicorn с учетом gunicorn.conf.py и --gunicorn-args."""
+    gunicorn_args = args.gunicorn_args.split()
+    for flag in ("--workers", "-w"):
+        if flag in gunicorn_args[:-1]:
+            return int(gunicorn_args[gunicorn_args.index(flag) + 1])
+    root = os.path.dirname(os.path.abspath(__file__))
+    return runpy.run_path(os.path.join(root, "gunicorn.conf.py"))["workers"]
+
+
+def effective_admission(config_class, workers):
+    """Действующие лимиты допуска: на процесс и суммарно по воркерам."""
+    settings = {
+        name: getattr(config_class, name) for name, _ in ADMISSION_SETTINGS.values()
+    }
+    settings["LLM_ADMISSION_ENABLED"] = config_class.LLM_ADMISSION_ENABLED
+    settings["workers"] = workers
+    if config_class.LLM_ADMISSION_ENABLED:
+        settings["total_max_concurrent"] = workers * config_class.LLM_MAX_CONCURRENT
+        settings["total_rate_limit"] = workers * config_class.LLM_RATE_LIMIT
+    return settings
+
+
+def seed(app, args):
+    """Создает пользователей и сессии с историей напрямую в БД."""
+    from app import db
+    from app.models import ChatSession, Message, User
+    from app.services.auth_service import issue_access_token
+
+    history_lengths = itertools.cycle(args.history)
+    fixture = Fixture()
+    with app.app_context():
+        db.create_all()
+        # Хэш пароля считается один раз: pbkdf2 медленный намеренно
+        template = User(email="template@benchmark.local")
+        template.set_password(PASSWORD)
+
+        run_tag = int(time.time())
+        for index in range(args.users):
+            user = User(
+                email=f"bench-{run_tag}-{index}@benchmark.local",
+                password_hash=template.password_hash,
+            )
+            db.session.add(user)
+            db.session.flush()
+
+            sessions = []
+            for _ in range(args.sessions):
+                length = next(history_lengths)
+                started = datetime.utcnow() - timedelta(seconds=length)
+                session = ChatSession(
+                    user_id=user.id,
+                    title=f"Benchmark {length}",
+                    message_count=length,
+                    last_message_at=started + timedelta(seconds=length),
+                )
+                db.session.add(session)
+                db.session.flush()
+                db.session.add_all(
+                    Message(
+                        session_id=session.id,
+                        role="user" if n % 2 == 0 else "assistant",
+                        content=f"Сообщение {n} в истории бенчмарка. " * 8,
+                        timestamp=started + timedelta(seconds=n),
+                    )
+                    for n in range(length)
+                )
+                sessions.append(session.id)
+
+            fixture.users.append(
+                {
+                    "email": user.email,
+                    "token": issue_access_token(user),
+                    "sessions": sessions,
+                }
+            )
+        db.session.commit()
+    return fixture
+
+
+def _start_gunicorn(args, llm_url, database_uri, config_class):
+    """Запускает gunicorn с gunicorn.conf.py, возвращает (process, base_url)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(
+        os.environ,
+        FLASK_CONFIG=args.config,
+        DATABASE_URL=database_uri,
+        DEV_DATABASE_URL=database_uri,
+        SECRET_KEY=config_class.SECRET_KEY,
+        JWT_SECRET_KEY=config_class.JWT_SECRET_KEY,
+        GIGACHAT_AUTH_CREDENTIALS=config_class.GIGACHAT_AUTH_CREDENTIALS,
+        GIGACHAT_OAUTH_URL=f"{llm_url}/api/v2/oauth",
+        GIGACHAT_COMPLETIONS_URL=f"{llm_url}/api/v1/chat/completions",
+        RESPONSE_CACHE_ENABLED="1" if args.response_cache else "0",
+        LLM_ADMISSION_ENABLED="1" if config_class.LLM_ADMISSION_ENABLED else "0",
+        **{
+            name: str(getattr(config_class, name))
+            for name, _ in ADMISSION_SETTINGS.values()
+        },
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        GUNICORN_ACCESS_LOG="",
+    )
+    root = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "run:app"]
+        + args.gunicorn_args.split(),
+        cwd=root,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn завершился с кодом {process.returncode}")
+        try:
+            requests.get(f"{base_url}/api/v1/swagger.json", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn не ответил за 60 с")
+
+
+def run_http_scenario(name, base_url, fixture, args, concurrency):
+    """Замкнутый цикл: ``concurrency`` потоков шлют запросы ``duration`` секунд."""
+    result = ScenarioResult(name)
+    lock = threading.Lock()
+    counter = itertools.count()
+    deadline = time.monotonic() + args.duration
+
+    def worker(worker_id):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        http = requests.Session()
+        while time.monotonic() < deadline:
+            user, session_id = fixture.pick(rng)
+            headers = {"Authorization": f"Bearer {user['token']}"}
+            if name == "send_message":
+                question = f"Вопрос {next(counter)}: как снизить расходы?"
+                request = dict(
+                    method="POST",
+                    url=f"{base_url}/api/v1/chat/send_message",
+                    json={"message_content": question, "session_id": session_id},
+                    headers=headers,
+                )
+            elif name == "session_history":
+                request = dict(
+                    method="GET",
+                    url=f"{base_url}/api/v1/chat/session/{session_id}",
+                    params={"limit": args.page_size},
+                    headers=headers,
+                )
+            else:
+                request = dict(
+                    method="POST",
+                    url=f"{base_url}/api/v1/auth/login",
+                    json={"email": user["email"], "password": PASSWORD},
+                )
+
+            started = time.perf_counter()
+            try:
+                status = http.request(timeout=args.timeout, **request).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                result.record(elapsed, status)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+async def _run_bot_scenario(app, base_url, fixture, args, concurrency):
+    import httpx
+    import bot
+
+    bot.BOT_API_MODE = args.bot_mode
+    bot.flask_app = app
+    bot.http_client = httpx.AsyncClient(
+        base_url=f"{base_url}/api/v1",
+        timeout=bot.API_TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    result = ScenarioResult("bot")
+    counter = itertools.count()
+    deadline = time.monotonic() + args.duration
+
+    async def worker(worker_id):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        while time.monotonic() < deadline:
+            user, session_id = fixture.pick(rng)
+            number = next(counter)
+            started = time.perf_counter()
+            try:
+                await bot.send_chat_message(
+                    user["token"],
+                    f"Вопрос {number} из бота: как снизить расходы?",
+                    session_id,
+                    idempotency_key=f"bench-{args.seed}-{number}",
+                )
+                status = 200
+            except bot.ApiBusy:
+                status = "ApiBusy"
+            except (bot.ApiError, bot.SessionExpired) as e:
+                status = type(e).__name__
+            result.record(time.perf_counter() - started, status)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    finally:
+        await bot.http_client.aclose()
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_admission(settings):
+    if not settings["LLM_ADMISSION_ENABLED"]:
+        return f"Допуск к LLM выключен, воркеров: {settings['workers']}"
+    return (
+        f"Допуск к LLM на процесс: {settings['LLM_MAX_CONCURRENT']} одновременно, "
+        f"{_rate(settings['LLM_RATE_LIMIT'])} (запас {settings['LLM_RATE_BURST']}), "
+        f"очередь {settings['LLM_QUEUE_SIZE']} на {settings['LLM_QUEUE_TIMEOUT']} с, "
+        f"{settings['LLM_MAX_PER_USER']} на пользователя; воркеров: "
+        f"{settings['workers']}, итого {settings['total_max_concurrent']} "
+        f"одновременно и {_rate(settings['total_rate_limit'])}"
+    )
+
+
+def _rate(value):
+    return f"{value} rps" if value else "без лимита частоты"
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--config", choices=sorted(config_by_name), default="production"
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="Сценарии через запятую: " + ", ".join(SCENARIOS),
+    )
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument(
+        "--sessions", type=int, default=3, help="Сессий на пользователя"
+    )
+    parser.add_argument(
+        "--history",
+        default="0,20,200",
+        help="Длины истории сессий через запятую (назначаются по кругу)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="8",
+        help="Число клиентов; несколько значений через запятую — прогон на каждом",
+    )
+    parser.add_argument("--duration", type=float, default=20, help="Секунд на сценарий")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--llm-latency", default="fixed:0.3")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-port", type=int, default=0)
+    parser.add_argument(
+        "--bot-mode", choices=("inprocess", "http"), default="inprocess"
+    )
+    parser.add_argument(
+        "--base-url", help="Нагружать внешний сервер вместо встроенного"
+    )
+    parser.add_argument(
+        "--gunicorn",
+        action="store_true",
+        help="Запустить gunicorn с gunicorn.conf.py вместо встроенного сервера",
+    )
+    parser.add_argument(
+        "--gunicorn-args",
+        default="",
+        help='Дополнительные аргументы gunicorn, например "--workers 2 --threads 8"',
+    )
+    admission = parser.add_argument_group(
+        "допуск к LLM",
+        "Лимиты на процесс; по умолчанию — из конфигурации и переменных окружения",
+    )
+    for option, (name, value_type) in ADMISSION_SETTINGS.items():
+        admission.add_argument(
+            "--" + option.replace("_", "-"), type=value_type, help=name
+        )
+    admission.add_argument(
+        "--no-admission",
+        action="store_true",
+        help="Выключить допуск (LLM_ADMISSION_ENABLED=0)",
+    )
+    parser.add_argument("--database-url", help="По умолчанию — временный файл SQLite")
+    parser.add_argument("--response-cache", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+    args.history = [int(length) for length in args.history.split(",")]
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    if args.gunicorn and args.base_url:
+        parser.error("--gunicorn и --base-url взаимоисключающие")
+    return args
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    # Журнал каждого запроса искажает замеры и засоряет вывод
+    for name in ("werkzeug", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    from app import create_app
+
+    llm_app = create_fake_app(
+        latency=args.llm_latency, error_rate=args.llm_error_rate, chunk_delay=0.0
+    )
+    _, llm_url = _serve(llm_app, args.llm_port)
+
+    database_uri = args.database_url
+    if database_uri is None:
+        workdir = tempfile.mkdtemp(prefix="alpha-bench-")
+        database_uri = "sqlite:///" + os.path.join(workdir, "benchmark.db")
+
+    config_class = build_config(args, llm_url, database_uri)
+    app = create_app(config_class)
+    fixture = seed(app, args)
+
+    gunicorn = None
+    base_url = args.base_url
+    if args.gunicorn:
+        gunicorn, base_url = _start_gunicorn(args, llm_url, database_uri, config_class)
+    elif base_url is None:
+        _, base_url = _serve(app)
+    base_url = base_url.rstrip("/")
+
+    # Для внешнего сервера (--base-url) лимиты неизвестны: показываем
+    # конфигурацию этого процесса на один воркер
+    admission = effective_admission(
+        config_class, _gunicorn_workers(args) if args.gunicorn else 1
+    )
+    print(_format_admission(admission))
+
+    report = {
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "target": (
+            "gunicorn"
+            if args.gunicorn
+            else base_url if args.base_url else "in-process werkzeug"
+        ),
+        "admission": admission,
+        "scenarios": {},
+    }
+
+    try:
+        for name, concurrency in itertools.product(args.scenarios, args.concurrency):
+            print(f"Сценарий {name}: {concurrency} клиентов, {args.duration} с...")
+            if name == "bot":
+                result = asyncio.run(
+                    _run_bot_scenario(app, base_url, fixture, args, concurrency)
+                )
+            else:
+                result = run_http_scenario(name, base_url, fixture, args, concurrency)
+            summary = result.summary()
+            summary["concurrency"] = concurrency
+            # При нескольких уровнях нагрузки — отдельная запись на каждый
+            key = name if len(args.concurrency) == 1 else f"{name}@{concurrency}"
+            report["scenarios"][key] = summary
+            latency = summary["latency_ms"]
+            print(
+                f"  {summary['requests']} запросов, {summary['rps']} rps, "
+                f"ошибок {summary['error_rate']}, p50={latency['p50']} мс, "
+                f"p95={latency['p95']} мс, p99={latency['p99']} мс"
+            )
+    finally:
+        if gunicorn is not None:
+            gunicorn.terminate()
+            gunicorn.wait(timeout=120)
+
+    report["llm_stub"] = dict(llm_app.extensions["fake_gigachat"].stats)
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
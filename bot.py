@@ -1,7 +1,16 @@
 # bot.py
+import math
 import os
-import requests
+import time
+import asyncio
+import functools
+import hmac
+import signal
+import threading
+import httpx
+import jwt
 import logging
+from aiohttp import web
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -13,6 +22,9 @@ from telegram.ext import (
 
 # Загружаем переменные окружения
 from dotenv import load_dotenv
+from prometheus_client import start_http_server
+from app import tracing
+from app.metrics import BOT_HANDLER_SECONDS
 
 load_dotenv()
 
@@ -29,38 +41,342 @@ if TELEGRAM_TOKEN:
 
 API_BASE_URL = "http://127.0.0.1:5000/api/v1"
 
-user_sessions = {}
+# "inprocess" — бот вызывает сервисы приложения напрямую, со своим контекстом
+# приложения и сессией БД; "http" — ходит в веб-API по API_BASE_URL.
+BOT_API_MODE = os.getenv("BOT_API_MODE", "inprocess").lower()
+
+# Таймауты запросов к API: авторизация быстрая, ответ LLM может идти долго
+API_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+LLM_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Сессии пользователей бота: файл SQLite с TTL и LRU-вытеснением
+BOT_SESSION_DB = os.getenv(
+    "BOT_SESSION_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bot_sessions.db"),
+)
+BOT_SESSION_TTL = int(os.getenv("BOT_SESSION_TTL", 30 * 24 * 3600))
+BOT_SESSION_MAX_ENTRIES = int(os.getenv("BOT_SESSION_MAX_ENTRIES", 100000))
+# Токен продлевается заранее, если до истечения осталось меньше этого
+TOKEN_RENEW_MARGIN = 300
+
+BOT_API_SECRET = os.getenv("BOT_API_SECRET")
+
+# Порт HTTP-сервера метрик Prometheus бота (не задан — метрики не отдаются)
+BOT_METRICS_PORT = os.getenv("BOT_METRICS_PORT")
+
+# "polling" — один процесс опрашивает getUpdates (второй процесс с тем же
+# токеном получит конфликт); "webhook" — Telegram присылает обновления на
+# BOT_WEBHOOK_URL, за балансировщиком может стоять несколько реплик.
+# Сессии пользователей хранятся в BOT_SESSION_DB (SQLite WAL), поэтому
+# реплики работают только на одном хосте с файлом на локальном диске:
+# на сетевых файловых системах WAL небезопасен.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL")
+BOT_WEBHOOK_LISTEN = os.getenv("BOT_WEBHOOK_LISTEN", "0.0.0.0")
+BOT_WEBHOOK_PORT = int(os.getenv("BOT_WEBHOOK_PORT", 8443))
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+# Telegram передает его в X-Telegram-Bot-Api-Secret-Token; обязателен в
+# режиме webhook: иначе любой, кто знает адрес, подделает обновление от
+# имени привязанного пользователя
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET")
+BOT_WEBHOOK_MAX_CONNECTIONS = int(os.getenv("BOT_WEBHOOK_MAX_CONNECTIONS", 100))
+# Сколько обновлений процесс обрабатывает одновременно
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", 256))
+# Адрес Bot API; для локальной проверки — fake_telegram.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Трассировка обработчиков (см. app/tracing.py); в режиме http трасса
+# продолжается в API через заголовок X-Trace-Id
+tracing.configure(
+    os.getenv("BOT_TRACE_SERVICE_NAME", "alpha-bot"),
+    file_path=os.getenv("TRACE_FILE"),
+    zipkin_url=os.getenv("TRACE_ZIPKIN_URL"),
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 1.0)),
+)
+
+user_sessions = None
+
+# Общий асинхронный HTTP-клиент с пулом соединений. Создается при запуске
+# Application (post_init) и закрывается при остановке (post_shutdown).
+http_client: httpx.AsyncClient | None = None
+
+# Flask-приложение для режима inprocess (создается в post_init)
+flask_app = None
+
+
+class SessionExpired(Exception):
+    """JWT токен пользователя истек или недействителен."""
+
+
+class ApiError(Exception):
+    """Ошибка при обращении к ассистенту."""
+
+
+class ApiBusy(ApiError):
+    """Ассистент перегружен; повторить через ``retry_after`` секунд."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+async def init_resources(application: Application):
+    global http_client, flask_app, user_sessions
+    from app.services.telegram_sessions import TelegramSessionStore
+
+    user_sessions = TelegramSessionStore(
+        BOT_SESSION_DB, ttl=BOT_SESSION_TTL, max_entries=BOT_SESSION_MAX_ENTRIES
+    )
+    http_client = httpx.AsyncClient(
+        base_url=API_BASE_URL,
+        timeout=API_TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    if BOT_API_MODE == "inprocess":
+        from app import create_app
+        from config import get_config
+
+        flask_app = create_app(get_config())
+
+
+async def close_resources(application: Application):
+    global http_client, user_sessions
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    if user_sessions is not None:
+        user_sessions.close()
+        user_sessions = None
+
+
+def _user_id_from_token(token):
+    """Проверяет JWT и возвращает ID пользователя (режим inprocess)."""
+    from flask_jwt_extended import decode_token
+    from jwt import PyJWTError
+
+    with flask_app.app_context():
+        try:
+            return int(decode_token(token)["sub"])
+        except PyJWTError as e:
+            raise SessionExpired() from e
+
+
+def _login_in_process(email, password):
+    from app.services import auth_service
+
+    with flask_app.app_context():
+        user = auth_service.authenticate(email, password)
+        return auth_service.issue_access_token(user) if user else None
+
+
+def _link_telegram_in_process(token, telegram_id):
+    from app.services import auth_service
+
+    user_id = _user_id_from_token(token)
+    with flask_app.app_context():
+        try:
+            auth_service.link_telegram(user_id, telegram_id)
+            return True
+        except auth_service.AuthServiceError as e:
+            logger.error(f"Link Telegram failed: {e}")
+            return False
+
+
+def _renew_token_in_process(telegram_id):
+    from app.services import auth_service
+
+    with flask_app.app_context():
+        return auth_service.issue_token_for_telegram(telegram_id)
+
+
+async def renew_token(telegram_id):
+    """Выпускает новый JWT по уже привязанному telegram_id, без пароля."""
+    if BOT_API_MODE == "inprocess":
+        from app.services.chat_service import run_in_executor
+
+        return await run_in_executor(flask_app, _renew_token_in_process, telegram_id)
+    if not BOT_API_SECRET:
+        return None
+    try:
+        response = await http_client.post(
+            "/auth/telegram_token",
+            headers={"X-Bot-Secret": BOT_API_SECRET},
+            json={"telegram_id": str(telegram_id)},
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["access_token"]
+    except httpx.HTTPError as e:
+        logger.error(f"API Token renewal failed: {e}")
+        return None
+
+
+def _token_expires_soon(token):
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return True
+    return claims.get("exp", 0) - time.time() < TOKEN_RENEW_MARGIN
+
+
+async def get_session(telegram_id, force_renew=False):
+    """Возвращает сессию пользователя бота с действующим токеном или None.
+
+    Если записи нет (например, после перезапуска) или токен скоро истечет,
+    токен продлевается по привязанному telegram_id без повторного /login.
+    """
+    session_data = await user_sessions.get_async(telegram_id)
+    if session_data and not force_renew:
+        if not _token_expires_soon(session_data["jwt_token"]):
+            return session_data
+
+    token = await renew_token(telegram_id)
+    if not token:
+        if session_data:
+            await user_sessions.delete_async(telegram_id)
+        return None
+
+    session_id = session_data["session_id"] if session_data else None
+    await user_sessions.set_async(telegram_id, token, session_id)
+    return {"jwt_token": token, "session_id": session_id}
 
 
 async def login_user(email, password):
     """Отправляет запрос на логин в наше API и возвращает JWT токен."""
+    if BOT_API_MODE == "inprocess":
+        from app.services.chat_service import run_in_executor
+
+        return await run_in_executor(flask_app, _login_in_process, email, password)
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/auth/login", json={"email": email, "password": password}
+        response = await http_client.post(
+            "/auth/login", json={"email": email, "password": password}
         )
         response.raise_for_status()
         return response.json()["access_token"]
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"API Login failed: {e}")
         return None
 
 
 async def link_telegram_account(token, telegram_id):
     """Привязывает telegram_id к аккаунту пользователя в нашем API."""
+    if BOT_API_MODE == "inprocess":
+        from app.services.chat_service import run_in_executor
+
+        try:
+            return await run_in_executor(
+                flask_app, _link_telegram_in_process, token, telegram_id
+            )
+        except SessionExpired:
+            return False
     try:
         headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(
-            f"{API_BASE_URL}/profile/link_telegram",
+        response = await http_client.post(
+            "/profile/link_telegram",
             headers=headers,
             json={"telegram_id": str(telegram_id)},
         )
         response.raise_for_status()
         return True
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"API Link Telegram failed: {e}")
         return False
 
 
+async def send_chat_message(token, text, chat_session_id, idempotency_key=None):
+    """Отправляет сообщение ассистенту и возвращает ответ в формате API.
+
+    В режиме HTTP запрос с ``idempotency_key`` при таймауте повторяется один
+    раз с тем же ключом: API вернет уже сгенерированный ответ вместо второго
+    вызова LLM. Бросает SessionExpired, если токен истек, и ApiError при
+    прочих ошибках.
+    """
+    if BOT_API_MODE == "inprocess":
+        from app.services import chat_service
+
+        user_id = _user_id_from_token(token)
+        from app.services.admission import AdmissionRejected
+        from app.services.llm_clients import LLMCircuitOpen
+
+        try:
+            return await chat_service.send_message_async(
+                flask_app, user_id, text, chat_session_id
+            )
+        except AdmissionRejected as e:
+            raise ApiBusy(str(e), e.retry_after) from e
+        except LLMCircuitOpen as e:
+            raise ApiBusy(str(e), math.ceil(e.retry_after)) from e
+        except Exception as e:
+            raise ApiError(str(e)) from e
+
+    headers = {"Authorization": f"Bearer {token}"}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    payload = {"message_content": text}
+
+    if chat_session_id is not None:
+        payload["session_id"] = chat_session_id
+
+    attempts = 2 if idempotency_key else 1
+    for attempt in range(attempts):
+        try:
+            with tracing.span(
+                "api.send_message", kind="CLIENT", attempt=attempt
+            ) as tags:
+                response = await http_client.post(
+                    "/chat/send_message",
+                    headers={**headers, **tracing.propagation_headers()},
+                    json=payload,
+                    timeout=LLM_TIMEOUT,
+                )
+                tags["status"] = response.status_code
+            if response.status_code == 401:
+                raise SessionExpired()
+            if response.status_code in (429, 503):
+                raise ApiBusy(
+                    response.text, int(response.headers.get("Retry-After", 10))
+                )
+            response.raise_for_status()
+            return response.json()
+        except httpx.TimeoutException as e:
+            if attempt + 1 < attempts:
+                logger.warning(f"send_message timed out, retrying: {e}")
+                continue
+            raise ApiError(str(e)) from e
+        except httpx.HTTPError as e:
+            raise ApiError(str(e)) from e
+
+
+def timed_handler(name):
+    """Учитывает длительность обработчика в alpha_bot_handler_seconds.
+
+    Каждый обработчик — корневой спан своей трассы.
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                with tracing.start_trace(
+                    f"bot.{name}", kind="CONSUMER", update_id=update.update_id
+                ):
+                    result = await handler(update, context)
+                outcome = "ok"
+                return result
+            finally:
+                BOT_HANDLER_SECONDS.labels(name, outcome).observe(
+                    time.perf_counter() - started
+                )
+
+        return wrapper
+
+    return decorator
+
+
+@timed_handler("start")
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start."""
     user = update.effective_user
@@ -72,6 +388,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@timed_handler("login")
 async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /login."""
     chat_id = update.effective_chat.id
@@ -108,17 +425,18 @@ async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    user_sessions[telegram_id] = {"jwt_token": token, "session_id": None}
+    await user_sessions.set_async(telegram_id, token, None)
     await context.bot.send_message(
         chat_id=chat_id,
         text="✅ Вход выполнен успешно! Теперь можешь задавать мне вопросы.",
     )
 
 
+@timed_handler("new")
 async def new_chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
-    if telegram_id in user_sessions:
-        user_sessions[telegram_id]["session_id"] = None
+    if await get_session(telegram_id):
+        await user_sessions.update_async(telegram_id, session_id=None)
         await update.message.reply_text(
             "Новый диалог начат. Контекст предыдущего сброшен."
         )
@@ -126,12 +444,14 @@ async def new_chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Сначала войдите в систему с помощью /login.")
 
 
+@timed_handler("message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
     text = update.message.text
 
     # Проверяем, залогинен ли пользователь
-    if telegram_id not in user_sessions:
+    session_data = await get_session(telegram_id)
+    if session_data is None:
         await update.message.reply_text(
             "Пожалуйста, сначала войдите в систему с помощью команды /login."
         )
@@ -141,39 +461,42 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id=update.effective_chat.id, action="typing"
     )
 
-    session_data = user_sessions[telegram_id]
-    token = session_data["jwt_token"]
     chat_session_id = session_data.get("session_id")
-
-    headers = {"Authorization": f"Bearer {token}"}
-    payload = {"message_content": text, "model": "gigachat"}
-
-    if chat_session_id is not None:
-        payload["session_id"] = chat_session_id
+    # update_id уникален для сообщения: повтор после таймаута не создаст дубль
+    idempotency_key = f"tg-{update.update_id}"
 
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/chat/send_message", headers=headers, json=payload
-        )
-
-        if response.status_code == 401:
-            await update.message.reply_text(
-                "Ваша сессия истекла. Пожалуйста, войдите снова: /login <email> <password>"
+        try:
+            data = await send_chat_message(
+                session_data["jwt_token"], text, chat_session_id, idempotency_key
+            )
+        except SessionExpired:
+            # Токен отозван или ключ сменился: продлеваем один раз и повторяем
+            session_data = await get_session(telegram_id, force_renew=True)
+            if session_data is None:
+                raise
+            data = await send_chat_message(
+                session_data["jwt_token"], text, chat_session_id, idempotency_key
             )
-            del user_sessions[telegram_id]
-            return
-
-        response.raise_for_status()
-
-        data = response.json()
         assistant_message = data["assistant_message"]["content"]
         new_session_id = data["session_id"]
 
-        user_sessions[telegram_id]["session_id"] = new_session_id
+        await user_sessions.update_async(telegram_id, session_id=new_session_id)
 
         await update.message.reply_text(assistant_message)
 
-    except requests.exceptions.RequestException as e:
+    except SessionExpired:
+        await update.message.reply_text(
+            "Ваша сессия истекла. Пожалуйста, войдите снова: /login <email> <password>"
+        )
+        await user_sessions.delete_async(telegram_id)
+    except ApiBusy as e:
+        logger.warning(f"Assistant is overloaded: {e}")
+        await update.message.reply_text(
+            f"Ассистент сейчас перегружен. Попробуйте еще раз через "
+            f"{e.retry_after} с."
+        )
+    except ApiError as e:
         logger.error(f"API Error during send_message: {e}")
         await update.message.reply_text(
             "Произошла ошибка при обращении к ассистенту. Попробуйте еще раз."
@@ -183,24 +506,128 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 bot_application = None
 
 
+# Событие остановки сервера вебхука (режим webhook)
+webhook_stop_event: asyncio.Event | None = None
+
+
 async def stop_bot():
     global bot_application
-    if bot_application:
+    if webhook_stop_event is not None:
+        webhook_stop_event.set()
+    elif bot_application:
         await bot_application.stop()
 
 
+def build_webhook_app(application: Application):
+    """aiohttp-приложение, принимающее обновления Telegram.
+
+    Обновление только ставится в очередь Application и сразу получает
+    ответ 200: Telegram не ждет ответа ассистента и не присылает повторы.
+    Обработчики выполняются параллельно (до BOT_CONCURRENT_UPDATES).
+    Запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются.
+    """
+    if not BOT_WEBHOOK_SECRET:
+        raise RuntimeError("BOT_WEBHOOK_SECRET is required in webhook mode")
+    secret = BOT_WEBHOOK_SECRET.encode("utf-8")
+
+    async def receive_update(request):
+        if not hmac.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode("utf-8"),
+            secret,
+        ):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health(request):
+        return web.json_response({"status": "ok"})
+
+    web_app = web.Application()
+    web_app.router.add_post(BOT_WEBHOOK_PATH, receive_update)
+    web_app.router.add_get("/healthz", health)
+    return web_app
+
+
+async def run_webhook(application: Application):
+    """Запускает Application без Updater и сервер вебхука до остановки.
+
+    post_init/post_shutdown вызываются только из run_polling/run_webhook
+    самой библиотеки, поэтому ресурсы здесь открываются и закрываются явно.
+    """
+    global webhook_stop_event
+    webhook_stop_event = asyncio.Event()
+    if threading.current_thread() is threading.main_thread():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, webhook_stop_event.set)
+
+    runner = web.AppRunner(build_webhook_app(application))
+    await application.initialize()
+    try:
+        await init_resources(application)
+        if BOT_WEBHOOK_URL:
+            # Каждая реплика регистрирует один и тот же адрес: вызов идемпотентен
+            await application.bot.set_webhook(
+                BOT_WEBHOOK_URL,
+                secret_token=BOT_WEBHOOK_SECRET,
+                max_connections=BOT_WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, BOT_WEBHOOK_LISTEN, BOT_WEBHOOK_PORT).start()
+        logger.info(
+            f"Webhook listening on {BOT_WEBHOOK_LISTEN}:{BOT_WEBHOOK_PORT}"
+            f"{BOT_WEBHOOK_PATH}"
+        )
+        await webhook_stop_event.wait()
+    finally:
+        # Сначала перестаем принимать обновления, затем дорабатываем очередь
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        await close_resources(application)
+        await application.shutdown()
+
+
 def main():
     global bot_application
 
     if not TELEGRAM_TOKEN:
         logger.error("Не найден TELEGRAM_BOT_TOKEN! Проверьте файл .env")
         return
+    if BOT_MODE == "webhook" and not BOT_WEBHOOK_SECRET:
+        logger.error(
+            "В режиме webhook нужен BOT_WEBHOOK_SECRET (A-Z, a-z, 0-9, _ и -)! "
+            "Проверьте файл .env"
+        )
+        return
 
     logger.info(
         f"TELEGRAM_BOT_TOKEN found with length: {len(TELEGRAM_TOKEN) if TELEGRAM_TOKEN else 0}"
     )
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(init_resources)
+        .post_shutdown(close_resources)
+        # Обрабатываем сообщения разных чатов параллельно, а не по очереди
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+    if BOT_MODE == "webhook":
+        # Обновления приходят в сервер вебхука, getUpdates не нужен
+        builder = builder.updater(None)
+    application = builder.build()
     bot_application = application
 
     application.add_handler(CommandHandler("start", start_command))
@@ -211,9 +638,16 @@ def main():
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
     )
 
+    if BOT_METRICS_PORT:
+        start_http_server(int(BOT_METRICS_PORT))
+        logger.info(f"Prometheus metrics on port {BOT_METRICS_PORT}")
+
     # Запускаем бота
-    logger.info("Starting bot...")
-    application.run_polling(stop_signals=[])
+    logger.info(f"Starting bot in {BOT_MODE} mode...")
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(stop_signals=[])
 
 
 if __name__ == "__main__":
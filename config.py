@@ -16,7 +16,138 @@ class Config:
 
     GIGACHAT_AUTH_CREDENTIALS = os.environ.get("GIGACHAT_AUTH_CREDENTIALS")
 
+    # Бюджет контекста: промпт + история + ответ модели (max_tokens)
+    GIGACHAT_CONTEXT_TOKENS = int(os.environ.get("GIGACHAT_CONTEXT_TOKENS", 8192))
+    GIGACHAT_MAX_TOKENS = int(os.environ.get("GIGACHAT_MAX_TOKENS", 1000))
+    # Верхняя граница числа сообщений истории, читаемых из БД за один запрос
+    CHAT_HISTORY_MAX_MESSAGES = int(os.environ.get("CHAT_HISTORY_MAX_MESSAGES", 50))
+
+    # Кэш ответов LLM на повторяющиеся вопросы (в памяти воркера)
+    RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "0") == "1"
+    RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+    RESPONSE_CACHE_MAX_BYTES = int(
+        os.environ.get("RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    )
+
+    # Idempotency-Key для send_message: сколько хранить результат и сколько
+    # повтор ждет завершения исходного запроса
+    IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 3600))
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT", 60))
+
+    # Допуск запросов к GigaChat (лимиты на процесс-воркер): параллельность,
+    # частота (token bucket, 0 — без ограничения), очередь ожидания и доля
+    # одного пользователя. Суммарно к GigaChat уходит до
+    # воркеры × LLM_MAX_CONCURRENT одновременных запросов и до
+    # воркеры × LLM_RATE_LIMIT запросов в секунду.
+    LLM_ADMISSION_ENABLED = os.environ.get("LLM_ADMISSION_ENABLED", "1") == "1"
+    LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", 8))
+    LLM_RATE_LIMIT = float(os.environ.get("LLM_RATE_LIMIT", 5))
+    LLM_RATE_BURST = int(os.environ.get("LLM_RATE_BURST", 10))
+    LLM_QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", 32))
+    LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 10))
+    LLM_MAX_PER_USER = int(os.environ.get("LLM_MAX_PER_USER", 3))
+    # Потоки бота в режиме inprocess: ход диалога занимает поток на время
+    # ожидания в очереди допуска и вызова LLM, поэтому пул рассчитан на
+    # LLM_MAX_CONCURRENT + LLM_QUEUE_SIZE ходов и запас для входа/продления
+    BOT_WORKER_THREADS = int(
+        os.environ.get("BOT_WORKER_THREADS", LLM_MAX_CONCURRENT + LLM_QUEUE_SIZE + 8)
+    )
+
+    # Устойчивость вызовов GigaChat: повторы с экспоненциальной паузой,
+    # автоматический выключатель и хеджирование по p95 (по умолчанию выключено)
+    LLM_RETRY_ATTEMPTS = int(os.environ.get("LLM_RETRY_ATTEMPTS", 3))
+    LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5))
+    LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", 4))
+    LLM_BREAKER_FAILURE_THRESHOLD = int(
+        os.environ.get("LLM_BREAKER_FAILURE_THRESHOLD", 5)
+    )
+    LLM_BREAKER_RECOVERY_TIMEOUT = float(
+        os.environ.get("LLM_BREAKER_RECOVERY_TIMEOUT", 30)
+    )
+    LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "0") == "1"
+    LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 2))
+    # Потоки для вызовов с хеджированием: основная и дублирующая попытки
+    LLM_HEDGE_WORKERS = int(os.environ.get("LLM_HEDGE_WORKERS", LLM_MAX_CONCURRENT * 2))
+
+    # Трассировка (см. app/tracing.py): спаны пишутся в TRACE_FILE и/или
+    # отправляются в коллектор Zipkin; без них трассировка выключена
+    TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "alpha-web")
+    TRACE_FILE = os.environ.get("TRACE_FILE")
+    TRACE_ZIPKIN_URL = os.environ.get("TRACE_ZIPKIN_URL")
+    TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 1.0))
+
+    # Профилирование по команде администратора (см. app/profiling.py)
+    PROFILE_DIR = os.environ.get(
+        "PROFILE_DIR", os.path.join(basedir, "data", "profiles")
+    )
+    ADMIN_EMAILS = {
+        email.strip().lower()
+        for email in os.environ.get("ADMIN_EMAILS", "").split(",")
+        if email.strip()
+    }
+
+    # /metrics в формате Prometheus (см. app/metrics.py)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+    # Провайдер LLM (см. app/services/llm_providers.py) и адреса GigaChat.
+    # Для нагрузочных тестов адреса указывают на fake_gigachat.py, например
+    # GIGACHAT_OAUTH_URL=http://127.0.0.1:8090/api/v2/oauth
+    LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gigachat")
+    GIGACHAT_OAUTH_URL = os.environ.get(
+        "GIGACHAT_OAUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    )
+    GIGACHAT_COMPLETIONS_URL = os.environ.get(
+        "GIGACHAT_COMPLETIONS_URL",
+        "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
+    )
+    GIGACHAT_SCOPE = os.environ.get("GIGACHAT_SCOPE", "GIGACHAT_API_PERS")
+    GIGACHAT_MODEL = os.environ.get("GIGACHAT_MODEL", "GigaChat:latest")
+
+    # HTTP-транспорт GigaChat (пул keep-alive соединений на воркер). Потоки
+    # сверх размера пула ждут соединение, поэтому по умолчанию пул рассчитан
+    # на все одновременные вызовы с хеджированием (LLM_HEDGE_WORKERS).
+    GIGACHAT_POOL_SIZE = int(os.environ.get("GIGACHAT_POOL_SIZE", LLM_HEDGE_WORKERS))
+    # Сколько поток ждет свободное соединение, если пул все же исчерпан
+    GIGACHAT_POOL_TIMEOUT = float(os.environ.get("GIGACHAT_POOL_TIMEOUT", 2))
+    GIGACHAT_CONNECT_TIMEOUT = float(os.environ.get("GIGACHAT_CONNECT_TIMEOUT", 5))
+    GIGACHAT_READ_TIMEOUT = float(os.environ.get("GIGACHAT_READ_TIMEOUT", 30))
+    GIGACHAT_OAUTH_TIMEOUT = float(os.environ.get("GIGACHAT_OAUTH_TIMEOUT", 10))
+    # Верхняя оценка времени ответа LLM на одно сообщение: ожидание слота
+    # допуска и LLM_RETRY_ATTEMPTS попыток, каждая из которых может ждать
+    # соединение из пула, получать токен OAuth и подключаться заново, плюс
+    # паузы между попытками.
+    # По ней считаются таймауты gunicorn и аренда Idempotency-Key.
+    LLM_REQUEST_DEADLINE = (
+        LLM_QUEUE_TIMEOUT
+        + LLM_RETRY_ATTEMPTS
+        * (
+            GIGACHAT_POOL_TIMEOUT
+            + GIGACHAT_CONNECT_TIMEOUT
+            + GIGACHAT_OAUTH_TIMEOUT
+            + GIGACHAT_CONNECT_TIMEOUT
+            + GIGACHAT_READ_TIMEOUT
+        )
+        + (LLM_RETRY_ATTEMPTS - 1) * LLM_RETRY_MAX_DELAY
+    )
+    # Аренда записи "pending" Idempotency-Key: дольше исходный запрос идти не
+    # может. Запись воркера, упавшего посреди запроса, после этого срока
+    # перехватывает повтор с тем же ключом.
+    IDEMPOTENCY_LEASE = float(
+        os.environ.get("IDEMPOTENCY_LEASE", LLM_REQUEST_DEADLINE + 30)
+    )
+    # Путь к CA bundle с корневыми сертификатами Минцифры; если не задан,
+    # используется хранилище certifi.
+    GIGACHAT_CA_BUNDLE = os.environ.get("GIGACHAT_CA_BUNDLE")
+
     TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+    # Общий секрет бота и API для продления JWT по привязанному telegram_id
+    BOT_API_SECRET = os.environ.get("BOT_API_SECRET")
+
+    # PRAGMA, выполняемые на каждом новом соединении SQLite (см. app/sqlite.py)
+    SQLITE_PRAGMAS = {}
+    # Режим BEGIN для транзакций записи SQLite (см. app/sqlite.begin_write);
+    # None — поведение драйвера по умолчанию
+    SQLITE_WRITE_BEGIN_MODE = None
 
 
 class DevelopmentConfig(Config):
@@ -24,3 +155,47 @@ class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         "DEV_DATABASE_URL"
     ) or "sqlite:///" + os.path.join(basedir, "app.db")
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    SQLALCHEMY_DATABASE_URI = (
+        os.environ.get("DATABASE_URL")
+        or os.environ.get("DEV_DATABASE_URL")
+        or "sqlite:///" + os.path.join(basedir, "app.db")
+    )
+
+    # Файл БД делят воркеры gunicorn и контейнер бота. WAL позволяет читать
+    # параллельно с записью, а busy_timeout заставляет писателей ждать
+    # блокировку вместо немедленной ошибки "database is locked".
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 30000)),
+        "cache_size": -64000,  # 64 МБ на соединение
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
+    # Транзакции записи сразу берут блокировку записи. Иначе чтение с
+    # последующей записью в WAL может получить SQLITE_BUSY без ожидания
+    # busy_timeout. Транзакции только для чтения остаются отложенными.
+    SQLITE_WRITE_BEGIN_MODE = "IMMEDIATE"
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 10)),
+        "pool_timeout": 30,
+        "pool_recycle": 3600,
+        "connect_args": {"timeout": 30, "check_same_thread": False},
+    }
+
+
+config_by_name = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+}
+
+
+def get_config():
+    """Класс конфигурации по переменной окружения FLASK_CONFIG."""
+    return config_by_name[os.environ.get("FLASK_CONFIG", "development").lower()]
@@ -13,5 +13,11 @@ flask db upgrade
 
 echo "Database migrations complete."
 
+# Метрики прошлого запуска не должны смешиваться с текущими
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 # Запускаем основную команду, переданную в Dockerfile (gunicorn)
 exec "$@"
\ No newline at end of file
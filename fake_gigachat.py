@@ -0,0 +1,342 @@
+"""Локальная заглушка GigaChat API для нагрузочных тестов и профилирования.
+
+Реализует ``POST /api/v2/oauth`` и ``POST /api/v1/chat/completions`` (в том
+числе потоковый режим ``stream: true``) в формате настоящего API. Ответ
+детерминирован: один и тот же диалог всегда дает один и тот же текст.
+Задержка, доля ошибок и обрывы потока настраиваются переменными окружения
+``FAKE_GIGACHAT_*``, аргументами командной строки или на лету через
+``POST /_fake/settings``.
+
+Запуск::
+
+    python fake_gigachat.py --port 8090 --latency lognormal:0.8,0.5
+
+и в .env приложения::
+
+    GIGACHAT_OAUTH_URL=http://127.0.0.1:8090/api/v2/oauth
+    GIGACHAT_COMPLETIONS_URL=http://127.0.0.1:8090/api/v1/chat/completions
+    GIGACHAT_AUTH_CREDENTIALS=fake
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import Flask, Response, jsonify, request
+
+CANNED_SENTENCES = [
+    "Начните с анализа текущих расходов и выделите постоянные и переменные.",
+    "Для ИП на УСН важно вовремя вносить авансовые платежи по налогу.",
+    "Составьте план продаж на квартал и сверяйтесь с ним каждую неделю.",
+    "Проверьте договоры с поставщиками: часто можно договориться об отсрочке.",
+    "Финансовую подушку стоит держать на уровне трех месяцев расходов.",
+    "Автоматизация учета экономит время и снижает число ошибок.",
+    "Соберите отзывы клиентов и определите, что ценят больше всего.",
+    "Сравните условия нескольких банков по расчетно-кассовому обслуживанию.",
+    "Онлайн-касса обязательна при расчетах с физическими лицами.",
+    "Маркетинговый бюджет лучше распределять по каналам с измеримой отдачей.",
+    "Следите за сроками сдачи отчетности, чтобы избежать штрафов.",
+    "Делегируйте рутинные задачи и оставьте себе стратегические решения.",
+]
+
+DEFAULT_SETTINGS = {
+    # Задержка до первого токена: fixed:S, uniform:A,B, normal:MU,SIGMA
+    # или lognormal:MEDIAN,SIGMA (секунды)
+    "latency": "lognormal:0.8,0.5",
+    # Пауза между фрагментами потокового ответа, секунды
+    "chunk_delay": 0.02,
+    # Доля ответов с ошибкой и коды, из которых она выбирается
+    "error_rate": 0.0,
+    "error_statuses": [500, 502, 503],
+    # Доля запросов, которые «зависают» на hang_seconds (проверка таймаутов)
+    "timeout_rate": 0.0,
+    "hang_seconds": 60.0,
+    # Доля потоковых ответов, которые обрываются на середине
+    "stream_break_rate": 0.0,
+    # Доля ошибок при получении токена
+    "oauth_error_rate": 0.0,
+    "token_ttl": 1800,
+    # Длина ответа в предложениях (до ограничения max_tokens)
+    "min_sentences": 2,
+    "max_sentences": 5,
+    "seed": 0,
+}
+
+# Грубая оценка, как в app/services/context_window.py
+CHARS_PER_TOKEN = 3
+
+
+def _env_settings():
+    settings = {}
+    for key, default in DEFAULT_SETTINGS.items():
+        raw = os.environ.get(f"FAKE_GIGACHAT_{key.upper()}")
+        if raw is not None:
+            settings[key] = _coerce(default, raw)
+    return settings
+
+
+def _coerce(default, value):
+    if isinstance(value, str):
+        if isinstance(default, list):
+            return [int(code) for code in value.split(",") if code]
+        if isinstance(default, bool):
+            return value == "1"
+        if isinstance(default, int):
+            return int(value)
+        if isinstance(default, float):
+            return float(value)
+    return value
+
+
+def parse_latency(spec):
+    """Разбирает описание распределения задержки в функцию rng -> секунды."""
+    kind, _, args = spec.partition(":")
+    params = [float(arg) for arg in args.split(",") if arg]
+    if kind == "fixed":
+        (value,) = params
+        return lambda rng: value
+    if kind == "uniform":
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal":
+        mu, sigma = params
+        return lambda rng: max(0.0, rng.gauss(mu, sigma))
+    if kind == "lognormal":
+        median, sigma = params
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def canned_reply(messages, min_sentences, max_sentences, max_tokens):
+    """Детерминированный ответ на диалог: зависит только от сообщений."""
+    digest = hashlib.sha256(
+        json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).digest()
+    rng = random.Random(digest)
+    count = rng.randint(min_sentences, max_sentences)
+    question = messages[-1]["content"] if messages else ""
+    sentences = [f"Отвечаю на вопрос «{question[:60]}»."]
+    sentences.extend(rng.choice(CANNED_SENTENCES) for _ in range(count))
+    text = " ".join(sentences)
+    if max_tokens and estimate_tokens(text) > max_tokens:
+        text = text[: max_tokens * CHARS_PER_TOKEN]
+    return text
+
+
+class FakeGigaChat:
+    """Состояние заглушки: настройки, выданные токены и счетчики."""
+
+    def __init__(self, **overrides):
+        self._lock = threading.Lock()
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(_env_settings())
+        self.settings.update(overrides)
+        self._latency = parse_latency(self.settings["latency"])
+        self._rng = random.Random(self.settings["seed"])
+        self._tokens = {}
+        self.stats = Counter()
+
+    def update_settings(self, values):
+        with self._lock:
+            for key, value in values.items():
+                if key not in DEFAULT_SETTINGS:
+                    raise KeyError(key)
+                self.settings[key] = _coerce(DEFAULT_SETTINGS[key], value)
+            self._latency = parse_latency(self.settings["latency"])
+            self._rng = random.Random(self.settings["seed"])
+            return dict(self.settings)
+
+    def roll(self, name):
+        """True с вероятностью из настройки ``name``."""
+        with self._lock:
+            return self._rng.random() < self.settings[name]
+
+    def sample_latency(self):
+        with self._lock:
+            return self._latency(self._rng)
+
+    def pick_error_status(self):
+        with self._lock:
+            return self._rng.choice(self.settings["error_statuses"])
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        expires_at = time.time() + self.settings["token_ttl"]
+        with self._lock:
+            self._tokens[token] = expires_at
+        return token, expires_at
+
+    def check_token(self, token):
+        with self._lock:
+            expires_at = self._tokens.get(token)
+            if expires_at is not None and expires_at < time.time():
+                del self._tokens[token]
+                expires_at = None
+        return expires_at is not None
+
+    def count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+
+def _error(status, message):
+    return jsonify({"status": status, "message": message}), status
+
+
+def create_fake_app(**overrides):
+    app = Flask(__name__)
+    fake = FakeGigaChat(**overrides)
+    app.extensions["fake_gigachat"] = fake
+
+    @app.post("/api/v2/oauth")
+    def oauth():
+        if not request.headers.get("Authorization", "").startswith("Basic "):
+            fake.count("oauth_401")
+            return _error(401, "Authorization header is required")
+        if not request.headers.get("RqUID"):
+            fake.count("oauth_400")
+            return _error(400, "RqUID header is required")
+        if fake.roll("oauth_error_rate"):
+            fake.count("oauth_error")
+            return _error(fake.pick_error_status(), "Injected OAuth error")
+        token, expires_at = fake.issue_token()
+        fake.count("oauth_ok")
+        return jsonify({"access_token": token, "expires_at": int(expires_at * 1000)})
+
+    @app.post("/api/v1/chat/completions")
+    def completions():
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or not fake.check_token(auth[7:]):
+            fake.count("completions_401")
+            return _error(401, "Token has expired")
+
+        body = request.get_json(silent=True) or {}
+        messages = body.get("messages")
+        if not messages:
+            fake.count("completions_400")
+            return _error(400, "messages is required")
+
+        settings = fake.settings
+        time.sleep(fake.sample_latency())
+        if fake.roll("timeout_rate"):
+            fake.count("completions_hang")
+            time.sleep(settings["hang_seconds"])
+            return _error(504, "Injected gateway timeout")
+        if fake.roll("error_rate"):
+            fake.count("completions_error")
+            return _error(fake.pick_error_status(), "Injected error")
+
+        model = body.get("model", "GigaChat")
+        content = canned_reply(
+            messages,
+            settings["min_sentences"],
+            settings["max_sentences"],
+            body.get("max_tokens"),
+        )
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(content),
+            "total_tokens": prompt_tokens + estimate_tokens(content),
+        }
+
+        if body.get("stream"):
+            fake.count("completions_stream")
+            return Response(
+                _stream(fake, model, content, usage), mimetype="text/event-stream"
+            )
+
+        fake.count("completions_ok")
+        return jsonify(
+            {
+                "choices": [
+                    {
+                        "message": {"role": "assistant", "content": content},
+                        "index": 0,
+                        "finish_reason": "stop",
+                    }
+                ],
+                "created": int(time.time()),
+                "model": model,
+                "object": "chat.completion",
+                "usage": usage,
+            }
+        )
+
+    @app.get("/_fake/settings")
+    def get_settings():
+        return jsonify(fake.settings)
+
+    @app.post("/_fake/settings")
+    def post_settings():
+        try:
+            return jsonify(fake.update_settings(request.get_json() or {}))
+        except (KeyError, ValueError) as e:
+            return _error(400, f"Invalid setting: {e}")
+
+    @app.get("/_fake/stats")
+    def get_stats():
+        return jsonify(dict(fake.stats))
+
+    return app
+
+
+def _stream(fake, model, content, usage):
+    words = content.split(" ")
+    break_at = len(words) // 2 if fake.roll("stream_break_rate") else None
+    created = int(time.time())
+    for index, word in enumerate(words):
+        if index == break_at:
+            fake.count("completions_stream_broken")
+            # Обрыв без [DONE]: клиент увидит незавершенный поток
+            return
+        delta = word if index == 0 else f" {word}"
+        chunk = {
+            "choices": [{"delta": {"role": "assistant", "content": delta}, "index": 0}],
+            "created": created,
+            "model": model,
+            "object": "chat.completion",
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        time.sleep(fake.settings["chunk_delay"])
+    final = {
+        "choices": [{"delta": {"content": ""}, "index": 0, "finish_reason": "stop"}],
+        "created": created,
+        "model": model,
+        "object": "chat.completion",
+        "usage": usage,
+    }
+    yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    for key, default in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key)
+    args = parser.parse_args()
+
+    overrides = {
+        key: _coerce(DEFAULT_SETTINGS[key], value)
+        for key, value in vars(args).items()
+        if key in DEFAULT_SETTINGS and value is not None
+    }
+    app = create_fake_app(**overrides)
+    print(f"Fake GigaChat listening on http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
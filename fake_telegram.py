@@ -0,0 +1,387 @@
+"""Локальная заглушка Telegram Bot API и симулятор вебхука.
+
+Реализует методы Bot API, которые вызывает бот (``getMe``, ``setWebhook``,
+``sendMessage``, ``sendChatAction``, ``deleteMessage`` и т. д.), и
+запоминает отправленные ботом сообщения. В режиме симуляции заглушка сама
+рассылает обновления на вебхук бота, как это делает Telegram: каждый
+пользователь входит через ``/login`` и пишет сообщения, а время до ответа
+бота записывается. Несколько ``--webhook`` — несколько реплик бота,
+обновления раздаются по кругу, как за балансировщиком.
+
+Запуск бота против заглушки::
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook \\
+        BOT_WEBHOOK_SECRET=local python bot.py
+
+и симуляция 20 пользователей по 5 сообщений (аккаунты регистрируются
+через API)::
+
+    python fake_telegram.py --port 8081 --secret local \\
+        --webhook http://127.0.0.1:8443/telegram/webhook \\
+        --register 20 --api-url http://127.0.0.1:5000/api/v1 --messages 5
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+BOT_USER = {
+    "id": 100000001,
+    "is_bot": True,
+    "first_name": "Alpha",
+    "username": "fake_alpha_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+# Ответы бота, которые означают ошибку, а не ответ ассистента
+BOT_ERROR_PREFIXES = (
+    "Пожалуйста, сначала войдите",
+    "Ваша сессия истекла",
+    "Ассистент сейчас перегружен",
+    "Произошла ошибка",
+)
+
+QUESTIONS = [
+    "Как снизить расходы малого бизнеса?",
+    "Какие налоги платит ИП на УСН?",
+    "Как составить план продаж на квартал?",
+    "Нужна ли онлайн-касса для интернет-магазина?",
+    "Как договориться с поставщиком об отсрочке?",
+]
+
+
+class FakeTelegram:
+    """Состояние заглушки: отправленные ботом сообщения и счетчики."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(int(time.time()))
+        self.sent = {}  # chat_id -> [(время, текст)]
+        self.webhook = None
+        self.stats = Counter()
+
+    def next_update_id(self):
+        with self._condition:
+            return next(self._update_ids)
+
+    def next_message_id(self):
+        with self._condition:
+            return next(self._message_ids)
+
+    def record_sent(self, chat_id, text):
+        with self._condition:
+            self.sent.setdefault(chat_id, []).append((time.monotonic(), text))
+            self._condition.notify_all()
+
+    def count(self, method):
+        with self._condition:
+            self.stats[method] += 1
+
+    def sent_count(self, chat_id):
+        with self._condition:
+            return len(self.sent.get(chat_id, []))
+
+    def wait_reply(self, chat_id, after, predicate, timeout):
+        """Ждет сообщение бота в чат после ``after`` уже полученных."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                for received_at, text in self.sent.get(chat_id, [])[after:]:
+                    if predicate(text):
+                        return received_at, text
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None
+                self._condition.wait(remaining)
+
+
+def _params():
+    """Параметры вызова: Bot API принимает и JSON, и форму."""
+    params = request.get_json(silent=True)
+    if params is None:
+        params = request.values.to_dict()
+    return params
+
+
+def create_fake_app(fake=None):
+    app = Flask(__name__)
+    fake = fake or FakeTelegram()
+    app.extensions["fake_telegram"] = fake
+
+    def ok(result):
+        return jsonify({"ok": True, "result": result})
+
+    @app.post("/bot<token>/<method>")
+    def bot_api(token, method):
+        params = _params()
+        fake.count(method)
+        if method == "getMe":
+            return ok(BOT_USER)
+        if method == "setWebhook":
+            fake.webhook = params.get("url")
+            return ok(True)
+        if method == "deleteWebhook":
+            fake.webhook = None
+            return ok(True)
+        if method == "getWebhookInfo":
+            return ok(
+                {
+                    "url": fake.webhook or "",
+                    "has_custom_certificate": False,
+                    "pending_update_count": 0,
+                }
+            )
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            fake.record_sent(chat_id, params.get("text", ""))
+            return ok(
+                {
+                    "message_id": fake.next_message_id(),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": params.get("text", ""),
+                }
+            )
+        # sendChatAction, deleteMessage и прочие методы без данных в ответе
+        return ok(True)
+
+    @app.get("/_fake/stats")
+    def get_stats():
+        return jsonify(
+            {
+                "calls": dict(fake.stats),
+                "webhook": fake.webhook,
+                "chats": len(fake.sent),
+            }
+        )
+
+    return app
+
+
+def make_update(fake, user_id, text):
+    """Обновление с текстовым сообщением в личном чате, как от Telegram."""
+    message = {
+        "message_id": fake.next_message_id(),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"User {user_id}"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split(" ", 1)[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+    return {"update_id": fake.next_update_id(), "message": message}
+
+
+def register_accounts(api_url, count):
+    """Регистрирует ``count`` пользователей через API, возвращает (email, пароль)."""
+    accounts = []
+    run_tag = uuid.uuid4().hex[:8]
+    for index in range(count):
+        email = f"tg-sim-{run_tag}-{index}@example.com"
+        password = f"sim-password-{run_tag}"
+        response = requests.post(
+            f"{api_url.rstrip('/')}/auth/register",
+            json={"email": email, "password": password},
+            timeout=30,
+        )
+        response.raise_for_status()
+        accounts.append((email, password))
+    return accounts
+
+
+def wait_for_webhooks(webhooks, timeout=60):
+    """Ждет, пока реплики бота ответят на /healthz (бот стартует после заглушки)."""
+    deadline = time.monotonic() + timeout
+    for url in webhooks:
+        parts = urlsplit(url)
+        health_url = f"{parts.scheme}://{parts.netloc}/healthz"
+        while True:
+            try:
+                requests.get(health_url, timeout=1).raise_for_status()
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Бот не отвечает на {health_url}")
+                time.sleep(0.5)
+
+
+def simulate(fake, webhooks, accounts, args):
+    """Каждый пользователь входит и пишет ``args.messages`` сообщений подряд."""
+    lock = threading.Lock()
+    webhook_cycle = itertools.cycle(webhooks)
+    latencies = []
+    outcomes = Counter()
+    http = threading.local()
+
+    def post_update(update):
+        with lock:
+            url = next(webhook_cycle)
+        session = getattr(http, "session", None)
+        if session is None:
+            session = http.session = requests.Session()
+        headers = {}
+        if args.secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+        response = session.post(url, json=update, headers=headers, timeout=10)
+        response.raise_for_status()
+
+    def send_and_wait(user_id, text, predicate):
+        after = fake.sent_count(user_id)
+        started = time.monotonic()
+        try:
+            post_update(make_update(fake, user_id, text))
+        except requests.RequestException:
+            return None, "webhook_error"
+        received_at, reply = fake.wait_reply(user_id, after, predicate, args.timeout)
+        if received_at is None:
+            return None, "timeout"
+        return received_at - started, reply
+
+    def user(index, email, password):
+        user_id = args.first_user_id + index
+        rng = random.Random(args.seed * 1000 + index)
+        _, reply = send_and_wait(
+            user_id,
+            f"/login {email} {password}",
+            lambda text: text.startswith(("✅", "❌")),
+        )
+        if not reply or not reply.startswith("✅"):
+            with lock:
+                outcomes["login_failed"] += 1
+            return
+        for _ in range(args.messages):
+            elapsed, reply = send_and_wait(
+                user_id, rng.choice(QUESTIONS), lambda text: True
+            )
+            with lock:
+                if elapsed is None:
+                    outcomes[reply] += 1
+                elif reply.startswith(BOT_ERROR_PREFIXES):
+                    outcomes["bot_error"] += 1
+                else:
+                    outcomes["ok"] += 1
+                    latencies.append(elapsed)
+
+    threads = [
+        threading.Thread(target=user, args=(index, email, password))
+        for index, (email, password) in enumerate(accounts)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    ordered = sorted(latencies)
+
+    def percentile_ms(q):
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+        return round(ordered[index] * 1000, 2)
+
+    return {
+        "users": len(accounts),
+        "replicas": len(webhooks),
+        "messages": sum(outcomes.values()),
+        "outcomes": dict(outcomes),
+        "messages_per_second": round(len(ordered) / elapsed, 2) if elapsed else None,
+        "reply_latency_ms": {
+            "p50": percentile_ms(0.50),
+            "p95": percentile_ms(0.95),
+            "p99": percentile_ms(0.99),
+            "max": percentile_ms(1.0),
+        },
+        "duration_s": round(elapsed, 2),
+    }
+
+
+def _read_accounts(path):
+    with open(path, encoding="utf-8") as f:
+        return [tuple(line.strip().split(":", 1)) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--webhook",
+        action="append",
+        default=[],
+        help="Адрес вебхука бота; повторить для нескольких реплик",
+    )
+    parser.add_argument("--secret", help="BOT_WEBHOOK_SECRET бота")
+    parser.add_argument("--accounts", help="Файл со строками email:пароль")
+    parser.add_argument(
+        "--register", type=int, default=0, help="Зарегистрировать N пользователей"
+    )
+    parser.add_argument("--api-url", default="http://127.0.0.1:5000/api/v1")
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument(
+        "--first-user-id",
+        type=int,
+        help="telegram_id первого пользователя; по умолчанию случайный, чтобы "
+        "повторный прогон на той же БД не конфликтовал с привязанными аккаунтами",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Записать результаты симуляции в JSON")
+    args = parser.parse_args()
+    if args.first_user_id is None:
+        args.first_user_id = random.randrange(10**9, 2 * 10**9)
+
+    if args.webhook and not args.secret:
+        parser.error("Нужен --secret: бот в режиме webhook требует BOT_WEBHOOK_SECRET")
+
+    fake = FakeTelegram()
+    server = make_server(args.host, args.port, create_fake_app(fake), threaded=True)
+    print(f"Fake Telegram Bot API listening on http://{args.host}:{args.port}")
+    if not args.webhook:
+        server.serve_forever()
+        return 0
+
+    # Журнал каждого вызова Bot API засоряет вывод симуляции
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Аккаунты регистрируются, когда бот уже поднялся: к этому времени
+    # готово и API, которое запускают вместе с ботом
+    wait_for_webhooks(args.webhook)
+    accounts = _read_accounts(args.accounts) if args.accounts else []
+    if args.register:
+        accounts += register_accounts(args.api_url, args.register)
+    if not accounts:
+        parser.error("Нужны аккаунты: --accounts или --register")
+
+    result = simulate(fake, args.webhook, accounts, args)
+    result["bot_api_calls"] = dict(fake.stats)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    server.shutdown()
+    return 0 if result["outcomes"].get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Конфигурация gunicorn для веб-приложения.
+
+Запрос к чату большую часть времени ждет ответа GigaChat (до
+GIGACHAT_READ_TIMEOUT секунд), поэтому воркеры многопоточные: пока один
+поток ждет LLM, остальные обслуживают другие запросы. Число одновременных
+вызовов LLM ограничивает admission control (LLM_MAX_CONCURRENT на
+процесс), лишние запросы ждут в очереди или получают 429/503.
+
+Все параметры переопределяются переменными окружения ``GUNICORN_*``::
+
+    gunicorn -c gunicorn.conf.py run:app
+"""
+
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config  # noqa: E402
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Процессы нужны для CPU (сериализация, шаблоны), потоки — для ожидания LLM
+workers = int(
+    os.environ.get("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2, 8))
+)
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+# Очередь соединений, ожидающих свободный поток
+backlog = int(os.environ.get("GUNICORN_BACKLOG", 2048))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Приложение создается один раз в мастере, воркеры получают его через fork:
+# быстрее старт и меньше памяти. Ресурсы с открытыми соединениями
+# пересоздаются в post_fork.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Самый долгий запрос — повтор с Idempotency-Key: он ждет исходный запрос до
+# IDEMPOTENCY_WAIT_TIMEOUT, а затем может сам пройти весь путь до LLM
+# (LLM_REQUEST_DEADLINE: очередь допуска, токен OAuth, повторы с паузами).
+# Дожидаемся таких запросов при перезапуске и не считаем воркер зависшим.
+_request_deadline = Config.IDEMPOTENCY_WAIT_TIMEOUT + Config.LLM_REQUEST_DEADLINE
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", _request_deadline + 30))
+graceful_timeout = int(
+    os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", _request_deadline + 15)
+)
+
+# Перезапуск воркеров ограничивает рост памяти; джиттер разводит перезапуски
+# воркеров во времени
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Файл heartbeat в памяти: на overlayfs Docker запись на диск может
+# блокироваться и приводить к ложным таймаутам воркеров
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Сбрасывает унаследованные от мастера пулы соединений.
+
+    Соединения SQLite и keep-alive сокеты GigaChat нельзя делить между
+    процессами. ``dispose(close=False)`` забывает соединения мастера, не
+    закрывая их (иначе закрылись бы и в мастере). Экспортер трассировки и
+    admission control проверяют pid сами.
+    """
+    from app import db
+    from app.services.llm_clients import reset_transport
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        db.engine.dispose(close=False)
+    reset_transport()
+    server.log.info(f"Worker {worker.pid}: connection pools reset")
+
+
+def child_exit(server, worker):
+    """Удаляет gauge-метрики завершенного воркера (режим multiprocess)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,37 @@
+"""Add indexes for chat hot-path queries
+
+Revision ID: 3f1c9a2b7d4e
+Revises: 7386bbb0aeb3
+Create Date: 2026-10-18 10:12:40.318204
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3f1c9a2b7d4e"
+down_revision = "7386bbb0aeb3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_chat_session_user_id"), ["user_id"], unique=False
+        )
+
+    with op.batch_alter_table("message", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_message_session_id_timestamp_id",
+            ["session_id", "timestamp", "id"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("message", schema=None) as batch_op:
+        batch_op.drop_index("ix_message_session_id_timestamp_id")
+
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_chat_session_user_id"))
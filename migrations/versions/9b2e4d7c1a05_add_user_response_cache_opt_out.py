@@ -0,0 +1,33 @@
+"""Add user.response_cache_opt_out
+
+Revision ID: 9b2e4d7c1a05
+Revises: 3f1c9a2b7d4e
+Create Date: 2026-10-18 11:40:02.771930
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9b2e4d7c1a05"
+down_revision = "3f1c9a2b7d4e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "response_cache_opt_out",
+                sa.Boolean(),
+                server_default=sa.false(),
+                nullable=False,
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_column("response_cache_opt_out")
@@ -0,0 +1,26 @@
+"""Add idempotency_record.lease_expires_at
+
+Revision ID: a8e2c6d4f190
+Revises: 5d0f2a8c3e71
+Create Date: 2026-10-18 18:40:12.538104
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a8e2c6d4f190"
+down_revision = "5d0f2a8c3e71"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("idempotency_record", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("idempotency_record", schema=None) as batch_op:
+        batch_op.drop_column("lease_expires_at")
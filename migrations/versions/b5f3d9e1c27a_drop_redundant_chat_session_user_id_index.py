@@ -0,0 +1,26 @@
+"""Drop redundant ix_chat_session_user_id
+
+Revision ID: b5f3d9e1c27a
+Revises: a8e2c6d4f190
+Create Date: 2026-10-18 19:05:33.270915
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b5f3d9e1c27a"
+down_revision = "a8e2c6d4f190"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Запросы по user_id обслуживает ix_chat_session_user_id_last_message_at_id
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.drop_index("ix_chat_session_user_id")
+
+
+def downgrade():
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.create_index("ix_chat_session_user_id", ["user_id"], unique=False)
@@ -0,0 +1,30 @@
+"""Add user.profile_version
+
+Revision ID: c4a81f3e6b92
+Revises: 9b2e4d7c1a05
+Create Date: 2026-10-18 12:25:47.106381
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c4a81f3e6b92"
+down_revision = "9b2e4d7c1a05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "profile_version", sa.Integer(), server_default="0", nullable=False
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_column("profile_version")
@@ -0,0 +1,88 @@
+"""Add denormalized summary fields to chat_session
+
+Revision ID: e7d3b5a90c18
+Revises: c4a81f3e6b92
+Create Date: 2026-10-18 13:58:21.540617
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e7d3b5a90c18"
+down_revision = "c4a81f3e6b92"
+branch_labels = None
+depends_on = None
+
+TITLE_LENGTH = 80
+
+
+def _title_from_message(content):
+    """Копия ChatSession.title_from_message на момент ревизии.
+
+    Миграция не импортирует модели: их правило может измениться позже.
+    """
+    title = " ".join(content.split())
+    if len(title) > TITLE_LENGTH:
+        title = title[: TITLE_LENGTH - 1] + "…"
+    return title
+
+
+def upgrade():
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("title", sa.String(length=80), nullable=True))
+        batch_op.add_column(
+            sa.Column("message_count", sa.Integer(), server_default="0", nullable=False)
+        )
+        batch_op.add_column(sa.Column("last_message_at", sa.DateTime(), nullable=True))
+
+    # Заполняем поля для существующих сессий
+    op.execute("""
+        UPDATE chat_session SET
+            message_count = (
+                SELECT COUNT(*) FROM message WHERE message.session_id = chat_session.id
+            ),
+            last_message_at = COALESCE(
+                (SELECT MAX(message.timestamp) FROM message
+                 WHERE message.session_id = chat_session.id),
+                chat_session.created_at
+            )
+        """)
+
+    # Заголовок считается тем же правилом, что и для новых сессий
+    # (ChatSession.title_from_message), поэтому заполняется в Python, а не SQL
+    bind = op.get_bind()
+    first_messages = bind.execute(sa.text("""
+            SELECT message.session_id, message.content FROM message
+            WHERE message.id = (
+                SELECT earliest.id FROM message AS earliest
+                WHERE earliest.session_id = message.session_id
+                    AND earliest.role = 'user'
+                ORDER BY earliest.timestamp, earliest.id
+                LIMIT 1
+            )
+            """)).fetchall()
+    if first_messages:
+        bind.execute(
+            sa.text("UPDATE chat_session SET title = :title WHERE id = :id"),
+            [
+                {"id": session_id, "title": _title_from_message(content)}
+                for session_id, content in first_messages
+            ],
+        )
+
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_chat_session_user_id_last_message_at_id",
+            ["user_id", "last_message_at", "id"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("chat_session", schema=None) as batch_op:
+        batch_op.drop_index("ix_chat_session_user_id_last_message_at_id")
+        batch_op.drop_column("last_message_at")
+        batch_op.drop_column("message_count")
+        batch_op.drop_column("title")
@@ -1,8 +1,9 @@
 # run.py
 from app import create_app, db
 from app.models import User, BusinessProfile, ChatSession, Message
+from config import get_config
 
-app = create_app()
+app = create_app(get_config())
 
 
 @app.shell_context_processor
@@ -0,0 +1,44 @@
+# tests/conftest.py
+import os
+
+import pytest
+from flask_migrate import upgrade
+
+from app import create_app, db
+from config import Config, ProductionConfig
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = "test-secret-key-0123456789abcdef0123"
+    JWT_SECRET_KEY = "test-jwt-secret-key-0123456789abcdef"
+    METRICS_ENABLED = False
+    TRACE_FILE = None
+    TRACE_ZIPKIN_URL = None
+
+    # Режим SQLite как в production, но с коротким ожиданием блокировки,
+    # чтобы регрессии проявлялись ошибкой, а не зависанием теста
+    SQLITE_PRAGMAS = {**ProductionConfig.SQLITE_PRAGMAS, "busy_timeout": 2000}
+    SQLITE_WRITE_BEGIN_MODE = ProductionConfig.SQLITE_WRITE_BEGIN_MODE
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 20,
+        "max_overflow": 0,
+        "connect_args": {"timeout": 2, "check_same_thread": False},
+    }
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с файловой БД SQLite, схема создается миграциями."""
+
+    class Cfg(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "test.db")
+
+    app = create_app(Cfg)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,133 @@
+# tests/test_admission.py
+import threading
+import time
+
+import pytest
+
+from app.services.admission import (
+    AdmissionController,
+    Overloaded,
+    RateLimited,
+    TokenBucket,
+)
+
+
+def test_zero_rate_means_unlimited():
+    controller = AdmissionController(
+        max_concurrent=1,
+        rate=0,
+        burst=0,
+        max_queue=0,
+        queue_timeout=1,
+        max_per_user=10,
+    )
+    for _ in range(5):
+        with controller.acquire("user"):
+            pass
+
+    with controller.acquire("user"):
+        with pytest.raises(Overloaded) as excinfo:
+            controller.acquire("other")
+    assert excinfo.value.retry_after == 1
+
+
+def test_negative_rate_is_rejected():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=-1, burst=1)
+
+
+def _controller(max_concurrent=1, max_queue=10, queue_timeout=2, max_per_user=10):
+    return AdmissionController(
+        max_concurrent=max_concurrent,
+        rate=0,
+        burst=0,
+        max_queue=max_queue,
+        queue_timeout=queue_timeout,
+        max_per_user=max_per_user,
+    )
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_per_user_cap_rejects_with_429():
+    controller = _controller(max_concurrent=5, max_per_user=1)
+
+    with controller.acquire("user"):
+        with pytest.raises(RateLimited) as excinfo:
+            controller.acquire("user")
+        assert excinfo.value.status_code == 429
+        assert controller.try_acquire("user") is None
+        # Доля считается по пользователю: другие допускаются
+        with controller.acquire("other"):
+            pass
+
+    # Отказы и проверки не оставляют записей о пользователях
+    assert controller.try_acquire("probe") is not None
+    assert controller._active_by_user == {"probe": 1}
+
+
+def test_full_queue_rejects_with_503():
+    controller = _controller(max_concurrent=1, max_queue=0)
+
+    with controller.acquire("user"):
+        with pytest.raises(Overloaded) as excinfo:
+            controller.acquire("other")
+    assert excinfo.value.status_code == 503
+
+
+def test_queue_timeout_rejects_with_503():
+    controller = _controller(max_concurrent=1, queue_timeout=0.1)
+
+    with controller.acquire("user"):
+        started = time.monotonic()
+        with pytest.raises(Overloaded):
+            controller.acquire("other")
+        assert time.monotonic() - started >= 0.1
+
+    assert controller._queued == 0
+    assert not controller._waiting
+    assert controller._active_by_user == {}
+
+
+def test_free_slot_goes_to_least_active_user():
+    controller = _controller(max_concurrent=2)
+    holder = controller.acquire("heavy")
+    other = controller.acquire("other")
+    order = []
+    leases = {}
+
+    def wait_for_slot(user_id, label):
+        leases[label] = controller.acquire(user_id)
+        order.append(label)
+
+    threads = []
+    for user_id, label in [
+        ("heavy", "heavy-1"),
+        ("heavy", "heavy-2"),
+        ("light", "light-1"),
+    ]:
+        queued = controller._queued
+        thread = threading.Thread(target=wait_for_slot, args=(user_id, label))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: controller._queued == queued + 1)
+
+    # У heavy уже есть слот, поэтому первым обслуживается light, хотя он
+    # встал в очередь последним
+    other.release()
+    _wait_until(lambda: order == ["light-1"])
+    holder.release()
+    _wait_until(lambda: order == ["light-1", "heavy-1"])
+    leases["light-1"].release()
+    _wait_until(lambda: order == ["light-1", "heavy-1", "heavy-2"])
+
+    for thread in threads:
+        thread.join()
+    for lease in leases.values():
+        lease.release()
+    assert controller._active_by_user == {}
@@ -0,0 +1,71 @@
+# tests/test_bot_webhook.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import bot
+
+SECRET = "webhook-secret"
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr(bot, "BOT_WEBHOOK_SECRET", SECRET)
+
+
+def _post_updates(requests):
+    """Отправляет запросы на вебхук; возвращает статусы и очередь Application."""
+
+    async def scenario():
+        application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        client = TestClient(TestServer(bot.build_webhook_app(application)))
+        await client.start_server()
+        try:
+            statuses = []
+            for headers, body in requests:
+                response = await client.post(
+                    bot.BOT_WEBHOOK_PATH, headers=headers, data=body
+                )
+                statuses.append(response.status)
+        finally:
+            await client.close()
+        queued = []
+        while not application.update_queue.empty():
+            queued.append(application.update_queue.get_nowait())
+        return statuses, queued
+
+    return asyncio.run(scenario())
+
+
+def test_rejects_missing_or_wrong_secret():
+    body = '{"update_id": 1}'
+    statuses, queued = _post_updates(
+        [
+            ({}, body),
+            ({"X-Telegram-Bot-Api-Secret-Token": "wrong"}, body),
+        ]
+    )
+    assert statuses == [403, 403]
+    assert queued == []
+
+
+def test_rejects_malformed_json():
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    statuses, queued = _post_updates([(headers, "{not json")])
+    assert statuses == [400]
+    assert queued == []
+
+
+def test_valid_update_is_queued():
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    statuses, queued = _post_updates([(headers, '{"update_id": 42}')])
+    assert statuses == [200]
+    assert [update.update_id for update in queued] == [42]
+
+
+def test_secret_is_required(monkeypatch):
+    monkeypatch.setattr(bot, "BOT_WEBHOOK_SECRET", None)
+    with pytest.raises(RuntimeError):
+        bot.build_webhook_app(SimpleNamespace(bot=None, update_queue=None))
@@ -0,0 +1,64 @@
+# tests/test_chat_service.py
+import pytest
+
+from app import db
+from app.models import ChatSession, Message, User
+from app.services import chat_service
+from app.services.llm_providers import LLMProvider
+
+
+class EchoProvider(LLMProvider):
+    name = "echo"
+
+    def complete(self, system_prompt, history, user_message):
+        return f"ответ на: {user_message}"
+
+    def stream(self, system_prompt, history, user_message):
+        yield self.complete(system_prompt, history, user_message)
+
+
+@pytest.fixture
+def user_id(app, monkeypatch):
+    monkeypatch.setattr(chat_service, "get_llm_provider", lambda config: EchoProvider())
+    with app.app_context():
+        user = User(email="user@example.com")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def test_turns_update_session_summary(app, user_id):
+    long_question = "Как  открыть\nИП? " + "подробности " * 20
+    with app.app_context():
+        session_id, _, _ = chat_service.send_message(user_id, long_question)
+    with app.app_context():
+        chat_service.send_message(user_id, "А сколько стоит?", session_id)
+
+    with app.app_context():
+        session = db.session.get(ChatSession, session_id)
+        last_timestamp = (
+            db.session.query(db.func.max(Message.timestamp))
+            .filter_by(session_id=session_id)
+            .scalar()
+        )
+        assert session.message_count == 4
+        assert session.last_message_at == last_timestamp
+        assert session.title == (
+            "Как открыть ИП? подробности подробности подробности "
+            "подробности подробности под…"
+        )
+
+
+def test_add_message_twice_in_one_transaction(app, user_id):
+    with app.app_context():
+        session = ChatSession(user_id=user_id)
+        db.session.add(session)
+        db.session.commit()
+
+        chat_service.add_message(session, "user", "вопрос")
+        chat_service.add_message(session, "assistant", "ответ")
+        db.session.commit()
+
+        assert session.message_count == 2
+        assert session.title == "вопрос"
@@ -0,0 +1,116 @@
+# tests/test_chat_stream.py
+import json
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from app import db
+from app.models import Message, User
+from app.services import auth_service, llm_clients, response_cache
+from fake_gigachat import create_fake_app
+
+STREAM_URL = "/api/v1/chat/send_message/stream"
+
+
+@pytest.fixture
+def fake_gigachat():
+    """Заглушка GigaChat на свободном порту; возвращает ее состояние."""
+    fake_app = create_fake_app(latency="fixed:0", chunk_delay=0.0)
+    server = make_server("127.0.0.1", 0, fake_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    fake = fake_app.extensions["fake_gigachat"]
+    fake.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield fake
+    server.shutdown()
+
+
+@pytest.fixture
+def client(app, fake_gigachat, monkeypatch):
+    app.config.update(
+        GIGACHAT_OAUTH_URL=f"{fake_gigachat.base_url}/api/v2/oauth",
+        GIGACHAT_COMPLETIONS_URL=f"{fake_gigachat.base_url}/api/v1/chat/completions",
+        GIGACHAT_AUTH_CREDENTIALS="fake",
+        RESPONSE_CACHE_ENABLED=True,
+        LLM_RETRY_ATTEMPTS=1,
+    )
+    # Транспорт, токен и кэш процесса создаются заново под эту заглушку
+    monkeypatch.setattr(llm_clients, "_transport", None)
+    monkeypatch.setattr(
+        llm_clients, "_token_manager", llm_clients.GigaChatTokenManager()
+    )
+    monkeypatch.setattr(response_cache, "_cache", None)
+
+    with app.app_context():
+        user = User(email="user@example.com")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        token = auth_service.issue_access_token(user)
+
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return client
+
+
+def _parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = "message"
+        data = None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: ") :]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: ") :])
+        events.append((event, data))
+    return events
+
+
+def _assistant_messages(app):
+    with app.app_context():
+        return [
+            content
+            for (content,) in db.session.query(Message.content).filter_by(
+                role="assistant"
+            )
+        ]
+
+
+def test_broken_stream_reports_partial_answer(app, client, fake_gigachat):
+    fake_gigachat.update_settings({"stream_break_rate": 1.0})
+
+    response = client.post(STREAM_URL, json={"message_content": "Как открыть ИП?"})
+    events = _parse_events(response.get_data(as_text=True))
+
+    assert events[0][0] == "session"
+    deltas = "".join(data["delta"] for event, data in events if event == "message")
+    event, payload = events[-1]
+    assert event == "error"
+    assert payload["partial"] is True
+    assert payload["assistant_message"]["content"] == deltas
+    assert _assistant_messages(app) == [deltas]
+    assert fake_gigachat.stats["completions_stream_broken"] == 1
+
+    # Неполный ответ не кэшируется: повтор вопроса снова идет в GigaChat
+    with app.app_context():
+        assert not response_cache.get_response_cache(app.config)._entries
+    client.post(STREAM_URL, json={"message_content": "Как открыть ИП?"}).get_data()
+    assert fake_gigachat.stats["completions_stream"] == 2
+
+
+def test_client_disconnect_saves_partial_answer(app, client, fake_gigachat):
+    response = client.post(
+        STREAM_URL, json={"message_content": "Как открыть ИП?"}, buffered=False
+    )
+    chunks = iter(response.response)
+    session_event = _parse_events(next(chunks).decode())
+    first_delta = _parse_events(next(chunks).decode())
+    # Клиент закрыл соединение после первого фрагмента
+    response.close()
+
+    assert session_event[0][0] == "session"
+    assert _assistant_messages(app) == [first_delta[0][1]["delta"]]
+    with app.app_context():
+        assert not response_cache.get_response_cache(app.config)._entries
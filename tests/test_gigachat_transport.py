@@ -0,0 +1,66 @@
+# tests/test_gigachat_transport.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from urllib3.exceptions import EmptyPoolError
+
+from app.services.llm_clients import GigaChatTransport
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v1/chat/completions"
+    server.shutdown()
+    server.server_close()
+
+
+def _transport(url, pool_timeout):
+    return GigaChatTransport(
+        oauth_url=url,
+        completions_url=url,
+        scope="scope",
+        pool_size=1,
+        pool_timeout=pool_timeout,
+        connect_timeout=1,
+        read_timeout=1,
+        oauth_timeout=1,
+        verify=True,
+    )
+
+
+def test_pool_wait_is_bounded(server_url):
+    transport = _transport(server_url, pool_timeout=0.2)
+    # Непрочитанный потоковый ответ держит единственное соединение пула
+    held = transport.post(server_url, json={}, stream=True)
+    try:
+        started = time.monotonic()
+        with pytest.raises(EmptyPoolError):
+            transport.post(server_url, json={})
+        assert time.monotonic() - started < 1
+    finally:
+        held.close()
+
+    # Освобожденное соединение снова доступно
+    assert transport.post(server_url, json={}).json() == {"ok": True}
+    transport.close()
@@ -0,0 +1,73 @@
+# tests/test_hedging.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import REGISTRY
+
+from app.services.admission import AdmissionController
+from app.services.resilience import hedged_call
+
+
+def _controller(max_concurrent):
+    return AdmissionController(
+        max_concurrent=max_concurrent,
+        rate=100,
+        burst=100,
+        max_queue=10,
+        queue_timeout=1,
+        max_per_user=10,
+    )
+
+
+def _rejected_total():
+    return sum(
+        sample.value
+        for metric in REGISTRY.collect()
+        if metric.name == "alpha_llm_admission_rejected"
+        for sample in metric.samples
+        if sample.name.endswith("_total")
+    )
+
+
+def _slow_call(calls):
+    def call():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return "ok"
+
+    return call
+
+
+def test_hedge_is_skipped_without_free_slot():
+    controller = _controller(max_concurrent=1)
+    calls = []
+    rejected = _rejected_total()
+    with controller.acquire("user"):
+        result = hedged_call(
+            _slow_call(calls),
+            delay=0.05,
+            executor=ThreadPoolExecutor(max_workers=2),
+            admit_hedge=lambda: controller.try_acquire("user"),
+        )
+    assert result == "ok"
+    assert len(calls) == 1
+    # Пропущенная копия не считается отказом допуска
+    assert _rejected_total() == rejected
+
+
+def test_hedge_takes_and_releases_slot():
+    controller = _controller(max_concurrent=2)
+    calls = []
+    with controller.acquire("user"):
+        hedged_call(
+            _slow_call(calls),
+            delay=0.05,
+            executor=ThreadPoolExecutor(max_workers=2),
+            admit_hedge=lambda: controller.try_acquire("user"),
+        )
+        assert len(calls) == 2
+        time.sleep(0.1)
+        # Слот копии освобождается, когда она завершается
+        assert controller._active == 1
+    assert controller._active == 0
@@ -0,0 +1,47 @@
+# tests/test_idempotency.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import IdempotencyRecord, User
+from app.services import idempotency
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        user = User(email="user@example.com")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def test_retry_waits_for_live_pending_request(app, user_id):
+    app.config["IDEMPOTENCY_WAIT_TIMEOUT"] = 0.3
+    with app.app_context():
+        assert idempotency.begin(user_id, "key", "hash") is None
+    with app.app_context():
+        with pytest.raises(idempotency.IdempotencyInProgress):
+            idempotency.begin(user_id, "key", "hash")
+
+
+def test_retry_takes_over_expired_lease(app, user_id):
+    app.config["IDEMPOTENCY_WAIT_TIMEOUT"] = 0.3
+    with app.app_context():
+        assert idempotency.begin(user_id, "key", "hash") is None
+        # Воркер исходного запроса упал, не вызвав complete или fail
+        record = IdempotencyRecord.query.one()
+        record.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    with app.app_context():
+        assert idempotency.begin(user_id, "key", "hash") is None
+        record = IdempotencyRecord.query.one()
+        assert record.status == "pending"
+        assert record.lease_expires_at > datetime.utcnow()
+
+        idempotency.complete(user_id, "key", {"answer": 42})
+    with app.app_context():
+        assert idempotency.begin(user_id, "key", "hash") == {"answer": 42}
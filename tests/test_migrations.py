@@ -0,0 +1,50 @@
+# tests/test_migrations.py
+from flask_migrate import upgrade
+from sqlalchemy import text
+
+from app import create_app, db
+from tests.conftest import MIGRATIONS_DIR, TestConfig
+
+
+def test_session_title_backfill_matches_add_message(tmp_path):
+    class Cfg(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "test.db")
+
+    app = create_app(Cfg)
+    long_question = "Как  открыть\nИП? " + "подробности " * 20
+    with app.app_context():
+        # Схема до появления денормализованных полей сессии
+        upgrade(directory=MIGRATIONS_DIR, revision="c4a81f3e6b92")
+        db.session.execute(
+            text(
+                "INSERT INTO user (id, email, password_hash, profile_version) "
+                "VALUES (1, 'user@example.com', 'x', 0)"
+            )
+        )
+        db.session.execute(
+            text("INSERT INTO chat_session (id, user_id) VALUES (1, 1), (2, 1)")
+        )
+        db.session.execute(
+            text(
+                "INSERT INTO message (session_id, role, content, timestamp) VALUES "
+                "(1, 'assistant', 'Здравствуйте', '2026-01-01 10:00:00'), "
+                "(1, 'user', :question, '2026-01-01 10:00:01'), "
+                "(1, 'user', 'второй вопрос', '2026-01-01 10:00:02')"
+            ),
+            {"question": long_question},
+        )
+        db.session.commit()
+
+        upgrade(directory=MIGRATIONS_DIR)
+
+        titles = dict(
+            db.session.execute(text("SELECT id, title FROM chat_session")).all()
+        )
+        assert titles == {
+            1: (
+                "Как открыть ИП? подробности подробности подробности "
+                "подробности подробности под…"
+            ),
+            2: None,
+        }
+        db.engine.dispose()
@@ -0,0 +1,31 @@
+# tests/test_profiling.py
+import os
+
+from app import profiling
+
+
+def test_counter_file_is_empty_when_exhausted(tmp_path):
+    profile_dir = str(tmp_path)
+    assert profiling.arm(profile_dir, 2) == 2
+    assert profiling.remaining(profile_dir) == 2
+
+    assert profiling._claim(profile_dir)
+    assert profiling._claim(profile_dir)
+    assert not profiling._claim(profile_dir)
+
+    # Пустой файл — признак для проверки без блокировки в _claim
+    assert os.path.getsize(profiling._armed_path(profile_dir)) == 0
+    assert profiling.remaining(profile_dir) == 0
+
+
+def test_claim_skips_lock_when_disarmed(tmp_path, monkeypatch):
+    profile_dir = str(tmp_path)
+    profiling.arm(profile_dir, 1)
+    profiling.arm(profile_dir, 0)
+
+    def fail(*args):
+        raise AssertionError("счетчик не должен блокироваться")
+
+    monkeypatch.setattr(profiling.fcntl, "flock", fail)
+    assert not profiling._claim(profile_dir)
+    assert profiling.remaining(profile_dir) == 0
@@ -0,0 +1,87 @@
+# tests/test_query_plans.py
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import ChatSession, User
+from app.services import chat_service
+
+
+@pytest.fixture
+def chat(app):
+    with app.app_context():
+        user = User(email="user@example.com")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.flush()
+        sessions = []
+        for _ in range(3):
+            session = ChatSession(user_id=user.id)
+            db.session.add(session)
+            db.session.flush()
+            for i in range(5):
+                chat_service.add_message(session, "user", f"question {i}")
+                chat_service.add_message(session, "assistant", f"answer {i}")
+            sessions.append(session)
+        db.session.commit()
+        return user.id, sessions[0].id
+
+
+def _capture_selects(table):
+    """Записывает SELECT-запросы к ``table`` с сортировкой, выполненные в блоке."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if statement.startswith("SELECT") and f"FROM {table}" in statement:
+            if "ORDER BY" in statement:
+                statements.append((statement, parameters))
+
+    return statements, before_cursor_execute
+
+
+def _query_plan(statement, parameters):
+    cursor = db.session.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + statement, parameters
+    )
+    return [row[-1] for row in cursor]
+
+
+def _assert_uses_index(statements, index_name):
+    assert statements
+    for statement, parameters in statements:
+        plan = _query_plan(statement, parameters)
+        assert any(index_name in detail for detail in plan), plan
+        # Сортировку обеспечивает порядок индекса, а не временное B-дерево
+        assert not any("TEMP B-TREE" in detail for detail in plan), plan
+
+
+def test_history_queries_use_message_index(app, chat):
+    user_id, session_id = chat
+    with app.app_context():
+        statements, listener = _capture_selects("message")
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            user = db.session.get(User, user_id)
+            session = db.session.get(ChatSession, session_id)
+            chat_service.build_prompt(user, session, "new question")
+            messages, _ = chat_service.get_session_messages(session_id, limit=3)
+            chat_service.get_session_messages(session_id, before_id=messages[0].id)
+            chat_service.get_session_messages(session_id, after_id=messages[0].id)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+
+        _assert_uses_index(statements, "ix_message_session_id_timestamp_id")
+
+
+def test_session_list_uses_user_last_message_index(app, chat):
+    user_id, _ = chat
+    with app.app_context():
+        statements, listener = _capture_selects("chat_session")
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            sessions, _ = chat_service.list_sessions(user_id, limit=2)
+            chat_service.list_sessions(user_id, before_id=sessions[-1].id)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+
+        _assert_uses_index(statements, "ix_chat_session_user_id_last_message_at_id")
@@ -0,0 +1,160 @@
+# tests/test_response_cache.py
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app import db
+from app.models import Message, User
+from app.services import chat_service, response_cache
+from app.services.admission import Overloaded
+from app.services.llm_providers import LLMProvider
+from app.services.response_cache import ResponseCache
+
+
+def _sample(name, **labels):
+    value = REGISTRY.get_sample_value(name, labels)
+    return value or 0.0
+
+
+def test_entry_expires_after_ttl():
+    cache = ResponseCache(ttl=0.05, max_bytes=1024, name="test_ttl")
+    cache.set("key", "ответ")
+    assert cache.get("key") == "ответ"
+
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert _sample("alpha_response_cache_entries", cache="test_ttl") == 0
+
+
+def test_lru_eviction_by_bytes():
+    # «а» занимает два байта в UTF-8: три записи по 4 байта в лимит 10 не влезут
+    cache = ResponseCache(ttl=60, max_bytes=10, name="test_lru")
+    cache.set("first", "аа")
+    cache.set("second", "бб")
+    assert cache.get("first") == "аа"
+
+    cache.set("third", "вв")
+    assert cache.get("second") is None
+    assert cache.get("first") == "аа"
+    assert cache.get("third") == "вв"
+    assert _sample("alpha_response_cache_bytes", cache="test_lru") == 8
+
+    # Значение больше лимита не кэшируется и ничего не вытесняет
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None
+    assert cache.get("first") == "аа"
+
+
+def test_caches_report_under_own_label():
+    responses = ResponseCache(ttl=60, max_bytes=1024, name="test_responses")
+    prompts = ResponseCache(ttl=60, max_bytes=1024, name="test_prompts")
+    before = _sample(
+        "alpha_response_cache_lookups_total", cache="test_responses", result="miss"
+    )
+
+    prompts.get("key")
+    prompts.set("key", "промпт")
+    prompts.get("key")
+
+    assert (
+        _sample(
+            "alpha_response_cache_lookups_total",
+            cache="test_responses",
+            result="miss",
+        )
+        == before
+    )
+    assert (
+        _sample(
+            "alpha_response_cache_lookups_total", cache="test_prompts", result="hit"
+        )
+        == 1
+    )
+    assert responses.get("key") is None
+
+
+class CountingProvider(LLMProvider):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def complete(self, system_prompt, history, user_message):
+        self.calls += 1
+        return f"ответ {self.calls}"
+
+    def stream(self, system_prompt, history, user_message):
+        yield self.complete(system_prompt, history, user_message)
+
+
+@pytest.fixture
+def provider(app, monkeypatch):
+    app.config["RESPONSE_CACHE_ENABLED"] = True
+    monkeypatch.setattr(response_cache, "_cache", None)
+    provider = CountingProvider()
+    monkeypatch.setattr(chat_service, "get_llm_provider", lambda config: provider)
+    return provider
+
+
+def _create_user(app, opt_out=False):
+    with app.app_context():
+        user = User(email="user@example.com", response_cache_opt_out=opt_out)
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _ask_twice(app, user_id):
+    """Задает один и тот же вопрос в двух новых сессиях."""
+    with app.app_context():
+        first_session, first, _ = chat_service.send_message(user_id, "Как открыть ИП?")
+        first_content = first.content
+    with app.app_context():
+        second_session, second, _ = chat_service.send_message(
+            user_id, "как  открыть ип?"
+        )
+        second_content = second.content
+    return (first_session, first_content), (second_session, second_content)
+
+
+def test_cache_hit_still_saves_messages(app, provider):
+    user_id = _create_user(app)
+    first, second = _ask_twice(app, user_id)
+
+    assert provider.calls == 1
+    assert first[1] == second[1] == "ответ 1"
+    with app.app_context():
+        saved = (
+            Message.query.filter_by(session_id=second[0])
+            .order_by(Message.id)
+            .with_entities(Message.role, Message.content)
+            .all()
+        )
+    assert saved == [("user", "как  открыть ип?"), ("assistant", "ответ 1")]
+
+
+def test_opt_out_bypasses_cache(app, provider):
+    user_id = _create_user(app, opt_out=True)
+    first, second = _ask_twice(app, user_id)
+
+    assert provider.calls == 2
+    assert (first[1], second[1]) == ("ответ 1", "ответ 2")
+
+
+def test_cache_hit_does_not_need_admission(app, provider, monkeypatch):
+    user_id = _create_user(app)
+    with app.app_context():
+        chat_service.send_message(user_id, "Как открыть ИП?")
+
+    def reject(config, user_id):
+        raise Overloaded("Ассистент перегружен.", retry_after=1)
+
+    monkeypatch.setattr(chat_service, "admit", reject)
+    with app.app_context():
+        _, message, _ = chat_service.send_message(user_id, "как открыть ип?")
+        assert message.content == "ответ 1"
+        with pytest.raises(Overloaded):
+            chat_service.send_message(user_id, "Другой вопрос")
+    assert provider.calls == 1
@@ -0,0 +1,77 @@
+# tests/test_sqlite_concurrency.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import db
+from app.models import Message, User
+from app.services import chat_service
+from app.sqlite import begin_write
+
+
+def _create_users(app, count):
+    with app.app_context():
+        users = [User(email=f"user{i}@example.com") for i in range(count)]
+        for user in users:
+            user.set_password("password")
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def test_read_does_not_wait_for_open_write_transaction(app):
+    (user_id,) = _create_users(app, 1)
+    write_started = threading.Event()
+    release = threading.Event()
+
+    def hold_write_lock():
+        with app.app_context():
+            begin_write()
+            user = db.session.get(User, user_id)
+            user.profile_version += 1
+            db.session.flush()
+            write_started.set()
+            release.wait(10)
+            db.session.commit()
+
+    writer = threading.Thread(target=hold_write_lock)
+    writer.start()
+    try:
+        assert write_started.wait(5)
+        with app.app_context():
+            started = time.monotonic()
+            user = db.session.get(User, user_id)
+            elapsed = time.monotonic() - started
+            assert user.profile_version == 0
+        # В WAL чтение видит снимок до незафиксированной записи и не ждет
+        # busy_timeout (2 секунды в тестовой конфигурации)
+        assert elapsed < 1
+    finally:
+        release.set()
+        writer.join()
+
+
+def test_concurrent_chat_turns_do_not_lock(app):
+    workers, turns = 8, 10
+    user_ids = _create_users(app, workers)
+
+    def chat(user_id):
+        session_id = None
+        for i in range(turns):
+            with app.app_context():
+                # Со второго хода сессия читается до записи: это путь,
+                # на котором отложенная транзакция получала бы SQLITE_BUSY
+                turn = chat_service.begin_turn(user_id, session_id, f"question {i}")
+                session_id = turn.session_id
+            with app.app_context():
+                db.session.get(User, user_id)
+                assert chat_service.save_assistant_message(session_id, f"answer {i}")
+        return session_id
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        session_ids = list(pool.map(chat, user_ids))
+
+    with app.app_context():
+        for session_id in session_ids:
+            count = Message.query.filter_by(session_id=session_id).count()
+            assert count == turns * 2
@@ -0,0 +1,86 @@
+# tests/test_telegram_sessions.py
+import asyncio
+
+import pytest
+
+from app.services.telegram_sessions import TelegramSessionStore
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        store = TelegramSessionStore(str(tmp_path / "bot_sessions.db"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def _last_used(store, telegram_id):
+    return store._conn.execute(
+        "SELECT last_used FROM bot_session WHERE telegram_id = ?", (telegram_id,)
+    ).fetchone()[0]
+
+
+def _set_last_used(store, telegram_id, value):
+    store._conn.execute(
+        "UPDATE bot_session SET last_used = ? WHERE telegram_id = ?",
+        (value, telegram_id),
+    )
+
+
+def test_expired_entry_is_removed(make_store):
+    store = make_store(ttl=60)
+    store.set(1, "token", 10)
+    assert store.get(1) == {"jwt_token": "token", "session_id": 10}
+
+    _set_last_used(store, 1, _last_used(store, 1) - 61)
+    assert store.get(1) is None
+    assert len(store) == 0
+
+
+def test_least_recently_used_entry_is_evicted(make_store):
+    store = make_store(max_entries=2, touch_interval=0)
+    store.set(1, "first")
+    store.set(2, "second")
+    _set_last_used(store, 1, _last_used(store, 1) - 10)
+    _set_last_used(store, 2, _last_used(store, 2) - 5)
+
+    # Чтение продлевает запись 1, и вытесняется давно не читавшаяся 2
+    assert store.get(1)["jwt_token"] == "first"
+    store.set(3, "third")
+
+    assert store.get(2) is None
+    assert store.get(1)["jwt_token"] == "first"
+    assert store.get(3)["jwt_token"] == "third"
+
+
+def test_read_renews_only_stale_entry(make_store):
+    store = make_store(ttl=3600, touch_interval=60)
+    store.set(1, "token")
+    written = _last_used(store, 1) - 30
+    _set_last_used(store, 1, written)
+
+    store.get(1)
+    assert _last_used(store, 1) == written
+
+    _set_last_used(store, 1, written - 60)
+    store.get(1)
+    assert _last_used(store, 1) > written
+
+
+def test_async_methods(make_store):
+    store = make_store()
+
+    async def scenario():
+        await store.set_async(1, "token")
+        await store.update_async(1, session_id=42)
+        session = await store.get_async(1)
+        await store.delete_async(1)
+        return session, await store.get_async(1)
+
+    assert asyncio.run(scenario()) == ({"jwt_token": "token", "session_id": 42}, None)
@@ -0,0 +1,141 @@
+# tests/test_token_manager.py
+import threading
+import time
+
+import pytest
+
+from app.services import llm_clients
+from app.services.llm_clients import GigaChatTokenManager
+
+
+class FakeTokenEndpoint:
+    """Подмена ``_request_gigachat_token``: считает вызовы, может тормозить."""
+
+    def __init__(self, ttl=3600, delay=0.0):
+        self.ttl = ttl
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, credentials, transport):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.delay)
+        return f"token-{number}", time.time() + self.ttl, None
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeTokenEndpoint()
+    monkeypatch.setattr(llm_clients, "_request_gigachat_token", fake)
+    return fake
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_cached_token_is_reused(endpoint):
+    manager = GigaChatTokenManager(refresh_margin=60)
+
+    assert manager.get_token("creds", None) == ("token-1", None)
+    assert manager.get_token("creds", None) == ("token-1", None)
+    assert endpoint.calls == 1
+
+
+def test_background_refresh_does_not_block_readers(endpoint):
+    manager = GigaChatTokenManager(refresh_margin=60)
+    manager.get_token("creds", None)
+    # Токен еще действует, но уже попал в окно обновления
+    manager._expires_at = time.time() + 30
+    endpoint.delay = 1.0
+
+    started = time.monotonic()
+    token, error = manager.get_token("creds", None)
+    assert (token, error) == ("token-1", None)
+    assert _wait_for(lambda: endpoint.calls == 2)
+
+    # Пока идет запрос к OAuth, читатели получают старый токен без ожидания
+    for _ in range(5):
+        assert manager.get_token("creds", None) == ("token-1", None)
+    assert time.monotonic() - started < 0.5
+
+    assert _wait_for(lambda: manager.get_token("creds", None)[0] == "token-2")
+
+
+def test_only_one_refresh_at_a_time(endpoint):
+    manager = GigaChatTokenManager(refresh_margin=60)
+    endpoint.delay = 0.3
+    results = []
+
+    def worker():
+        results.append(manager.get_token("creds", None))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert endpoint.calls == 1
+    assert results == [("token-1", None)] * 8
+
+    # Повторные вызовы в окне обновления запускают один фоновый запрос
+    manager._expires_at = time.time() + 30
+    for _ in range(8):
+        manager.get_token("creds", None)
+    assert _wait_for(lambda: not manager._refreshing)
+    assert endpoint.calls == 2
+
+
+def test_invalidate_ignores_stale_token(endpoint):
+    manager = GigaChatTokenManager()
+    manager.get_token("creds", None)
+
+    manager.invalidate("token-0")
+    assert manager.get_token("creds", None) == ("token-1", None)
+
+    manager.invalidate("token-1")
+    assert manager.get_token("creds", None) == ("token-2", None)
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport:
+    completions_url = "https://gigachat.test/api/v1/chat/completions"
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.tokens = []
+
+    def post(self, url, headers=None, json=None, stream=False):
+        self.tokens.append(headers["Authorization"])
+        return FakeResponse(self.statuses.pop(0))
+
+
+def test_unauthorized_invalidates_token_and_retries_once(app, endpoint, monkeypatch):
+    app.config["GIGACHAT_AUTH_CREDENTIALS"] = "creds"
+    monkeypatch.setattr(llm_clients, "_token_manager", GigaChatTokenManager())
+    transport = FakeTransport([401, 401, 200])
+    monkeypatch.setattr(llm_clients, "get_transport", lambda: transport)
+
+    with app.app_context():
+        response = llm_clients._send_completions({}, stream=False)
+
+    # Вторая 401 возвращается вызывающему, третьего запроса нет
+    assert response.status_code == 401
+    assert transport.tokens == ["Bearer token-1", "Bearer token-2"]
+    assert endpoint.calls == 2